@@ -0,0 +1,100 @@
+"""
+Early abort of the hopeless runs.
+
+When the cluster can't start (a broken scylla build, the environment) every test fails the same way, and running
+the rest of the suite only takes an hour to produce the same failure again. The AbortMonitor follows the finished
+tests through the GtestEventParser and tells when the run should be aborted:
+  * the cluster failed to start in N tests in a row (only the start and populate errors of the ccm bridge count,
+    an ordinary connection failure of a test doesn't),
+  * K tests in a row failed with the same error class (the failure location and the normalized message),
+  * more than X% of the tests failed once N tests finished.
+"""
+import re
+import logging
+from typing import NamedTuple, Optional
+
+from gtest_stream import GtestEventParser
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BOOTSTRAP_FAILURES = 0
+DEFAULT_MIN_TESTS = 20
+
+FAILURE_LOCATION_RE = re.compile(r"([\w.\-]+\.(?:cpp|hpp|cc|h)):(\d+)")
+BOOTSTRAP_RE = re.compile(r"unable to (?:start|create|populate|initialize)\b.*\bcluster|"
+                          r"cluster\b.*\b(?:failed|unable) to start|"
+                          r"error starting node|node\b.*\bfailed to start|"
+                          r"ccm (?:start|populate|create)\b.*\bfailed", re.IGNORECASE)
+VOLATILE_RE = re.compile(r"0x[0-9a-f]+|\d+(?:\.\d+)*|'[^']*'|\"[^\"]*\"", re.IGNORECASE)
+
+
+def error_class(message: str) -> str:
+    """
+    The failure location and the first line of the message with the numbers, addresses and quoted values
+    replaced, so the same error in another test (e.g. with another keyspace or node IP) gets the same class
+    """
+    lines = [line.strip() for line in message.splitlines() if line.strip()]
+    if not lines:
+        return "unknown"
+    match = FAILURE_LOCATION_RE.search(message)
+    location = f"{match.group(1)}:{match.group(2)} " if match else ""
+    first_line = next((line for line in lines if not FAILURE_LOCATION_RE.search(line)), lines[0])
+    return f"{location}{VOLATILE_RE.sub('#', first_line.lower())}"[:200]
+
+
+def is_bootstrap_failure(message: str) -> bool:
+    return bool(BOOTSTRAP_RE.search(message))
+
+
+class AbortPolicy(NamedTuple):
+    consecutive: int = 0  # abort after K tests in a row failed with the same error class, 0 to disable
+    failure_ratio: float = 0.0  # abort when more than this part of the tests failed, 0 to disable
+    min_tests: int = DEFAULT_MIN_TESTS  # the failure ratio is checked once that many tests finished
+    bootstrap: int = DEFAULT_BOOTSTRAP_FAILURES  # abort after N bootstrap failures in a row, 0 to disable
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.consecutive or self.failure_ratio or self.bootstrap)
+
+
+class AbortMonitor:
+    """
+    Checks the tests that finished since the previous check() against the policy, check() is called periodically
+    while the tests run. Returns the reason to abort the run, None to go on.
+    """
+
+    def __init__(self, policy: AbortPolicy, parser: GtestEventParser):
+        self._policy = policy
+        self._parser = parser
+        self._checked = set()
+        self._finished = 0
+        self._failed = 0
+        self._last_class = None
+        self._same_class = 0
+        self._bootstrap_failures = 0
+
+    def check(self) -> Optional[str]:
+        for event in list(self._parser.tests.values()):
+            if event.status == "running" or event.name in self._checked:
+                continue
+            self._checked.add(event.name)
+            self._finished += 1
+            if event.status == "passed":
+                self._last_class = None
+                self._same_class = self._bootstrap_failures = 0
+                continue
+            self._failed += 1
+            message = self._parser.messages.get(event.name, '')
+            failure_class = error_class(message)
+            self._same_class = self._same_class + 1 if failure_class == self._last_class else 1
+            self._last_class = failure_class
+            self._bootstrap_failures = self._bootstrap_failures + 1 if is_bootstrap_failure(message) else 0
+            if self._policy.bootstrap and self._bootstrap_failures >= self._policy.bootstrap:
+                return f"the cluster failed to start in {self._bootstrap_failures} tests in a row: {failure_class}"
+            if self._policy.consecutive and self._same_class >= self._policy.consecutive:
+                return f"{self._same_class} tests in a row failed with the same error: {failure_class}"
+        if self._policy.failure_ratio and self._finished >= self._policy.min_tests \
+                and self._failed / self._finished > self._policy.failure_ratio:
+            return f"{self._failed} of the {self._finished} tests failed, more than " \
+                   f"{self._policy.failure_ratio:.0%}"
+        return None
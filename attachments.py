@@ -0,0 +1,182 @@
+"""
+Preparation of the email attachments within the size limit of the email.
+
+Every attachment goes through the steps below until it fits in what is left of the limit:
+  1. compressed with gzip (unless it already is),
+  2. trimmed to the failed tests: the failed test cases of a JUnit XML, the output of the failed tests of an indexed
+     tests log (see output_log.py), the end of any other text file or of a tests log without failed tests (e.g. the
+     version failed with an exception),
+  3. replaced by a link to the CI artifact, or by a note with its size when there is no link.
+The files are streamed in chunks, nothing is read into memory as a whole.
+"""
+import os
+import gzip
+import shutil
+import logging
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+
+import output_log
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+TAIL_SIZE = 1024 * 1024  # the end of a text file that is kept when it can't be trimmed by the tests
+
+
+class Attachment(NamedTuple):
+    path: Path
+    failed_tests: tuple = ()  # what to keep when the file has to be trimmed
+
+
+def _size(path: Path) -> str:
+    return f"{path.stat().st_size / 1024 / 1024:.1f} MB"
+
+
+def compress(source: Path, work_dir: Path, name: str = None) -> Path:
+    if source.suffix == ".gz":
+        return source
+    target = work_dir / f"{name or source.name}.gz"
+    with open(source, "rb") as source_file, gzip.open(target, "wb") as target_file:
+        shutil.copyfileobj(source_file, target_file, CHUNK_SIZE)
+    return target
+
+
+def _trim_junit(source: Path, failed_tests: tuple, target: Path) -> None:
+    """
+    Only the failed test cases, the suites and the report are kept with their original counters
+    """
+    failed = set(failed_tests)
+    root = None
+    suites = {}
+    for event, element in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if element.tag == "testsuites":
+                root = ElementTree.Element("testsuites", element.attrib)
+            elif element.tag == "testsuite":
+                suites[element.get("name")] = ElementTree.Element("testsuite", element.attrib)
+            continue
+        if element.tag == "testcase":
+            if f"{element.get('classname')}.{element.get('name')}" in failed \
+                    or any(child.tag in ("failure", "error") for child in element):
+                suites.setdefault(element.get("classname"), ElementTree.Element("testsuite")).append(element)
+            else:
+                element.clear()
+        elif element.tag == "testsuite":
+            suite = suites.pop(element.get("name"), None)
+            if suite is not None and len(suite):
+                if root is None:
+                    root = ElementTree.Element("testsuites")
+                root.append(suite)
+            element.clear()
+    if root is None:
+        root = ElementTree.Element("testsuites")
+    ElementTree.ElementTree(root).write(target, encoding="UTF-8", xml_declaration=True)
+
+
+def _trim_tests_log(source: Path, failed_tests: tuple, target: Path) -> None:
+    with open(target, "w") as target_file:
+        for test in failed_tests:
+            target_file.write(output_log.read_test_log(source, test))
+
+
+def _trim_tail(source: Path, target: Path) -> None:
+    with open(source, "rb") as source_file, open(target, "wb") as target_file:
+        source_file.seek(max(0, source.stat().st_size - TAIL_SIZE))
+        target_file.write(f"[... the first {max(0, source.stat().st_size - TAIL_SIZE)} bytes are cut ...]\n"
+                          .encode())
+        shutil.copyfileobj(source_file, target_file, CHUNK_SIZE)
+
+
+def _trim_compressed_tail(source: Path, target: Path) -> None:
+    # The end of the decompressed file, it can't be seeked to
+    tail = bytearray()
+    size = 0
+    with gzip.open(source, "rb") as source_file:
+        try:
+            for chunk in iter(lambda: source_file.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                tail += chunk
+                del tail[:-TAIL_SIZE]
+        except (EOFError, gzip.BadGzipFile):
+            # The run was killed while the last member was written, what was decompressed is kept
+            pass
+    with open(target, "wb") as target_file:
+        target_file.write(f"[... the first {size - len(tail)} bytes are cut ...]\n".encode())
+        target_file.write(tail)
+
+
+def trim(attachment: Attachment, work_dir: Path) -> Path:
+    """
+    The part of the file that matters for the failed tests, compressed
+    """
+    source = attachment.path
+    if source.name.endswith(".log.gz") and attachment.failed_tests and output_log.index_path(source).exists():
+        target = work_dir / source.name.replace(".log.gz", ".failed-tests.log")
+        _trim_tests_log(source, attachment.failed_tests, target)
+        if target.stat().st_size:
+            return compress(target, work_dir)
+    if source.name.endswith(".log.gz"):
+        # No output of the failed tests (e.g. the version failed with an exception), the end shows what went wrong
+        target = work_dir / source.name.replace(".log.gz", ".tail.log")
+        _trim_compressed_tail(source, target)
+    elif source.suffix == ".xml":
+        target = work_dir / f"{source.stem}.failed-tests.xml"
+        _trim_junit(source, attachment.failed_tests, target)
+    elif source.suffix != ".gz":
+        target = work_dir / f"{source.stem}.tail{source.suffix}"
+        _trim_tail(source, target)
+    else:
+        return source
+    return compress(target, work_dir)
+
+
+def artifact_link(path: Path) -> str:
+    """
+    The link to the file among the artifacts of the CI job, empty when it isn't run by the CI
+    """
+    build_url, workspace = os.getenv("BUILD_URL"), os.getenv("WORKSPACE")
+    if not build_url or not workspace:
+        return ""
+    try:
+        relative = path.resolve().relative_to(Path(workspace).resolve())
+    except ValueError:
+        return ""
+    return f"{build_url.rstrip('/')}/artifact/{relative.as_posix()}"
+
+
+def prepare_attachments(attachments: List[Attachment], work_dir: Path, size_limit: int) -> Tuple[List[Path], List[str]]:
+    """
+    Returns the files to attach, their total size below size_limit, and the notes about the attachments
+    that were trimmed or didn't fit, for the body of the email
+    """
+    files = []
+    notes = []
+    remaining = size_limit
+    for attachment in attachments:
+        if not attachment.path.exists():
+            continue
+        try:
+            prepared = compress(attachment.path, work_dir)
+            if prepared.stat().st_size >= remaining:
+                LOGGER.info("'%s' is %s compressed, trimming it to the failed tests", attachment.path.name,
+                            _size(prepared))
+                trimmed = trim(attachment, work_dir)
+                if trimmed != prepared and trimmed.stat().st_size < remaining:
+                    notes.append(f"{attachment.path.name} ({_size(attachment.path)}) is trimmed to "
+                                 f"{'the failed tests' if '.failed-tests.' in trimmed.name else 'its end'} "
+                                 f"as {trimmed.name}")
+                prepared = trimmed
+        except (OSError, ElementTree.ParseError) as exc:
+            LOGGER.warning("Failed to prepare '%s' for the email: %s", attachment.path, exc)
+            prepared = attachment.path
+        # Below the limit, as Email.prepare_email checks it
+        if prepared.stat().st_size < remaining:
+            files.append(prepared)
+            remaining -= prepared.stat().st_size
+            continue
+        link = artifact_link(attachment.path)
+        notes.append(f"{attachment.path.name} ({_size(attachment.path)}) is too big to attach" +
+                     (f": {link}" if link else ", it's kept in the log folder of the job"))
+    return files, notes
@@ -0,0 +1,339 @@
+"""
+Benchmarks of the harness itself, on synthetic fixtures of the size of the big matrices.
+
+Every benchmark prepares its fixture, then its hot path is measured: the best time of a few repeats and the peak of
+the memory allocated by Python (tracemalloc) in a separate run. The results are compared with the stored baseline,
+a benchmark that got slower or takes more memory than the tolerance allows fails the run. The first run on a machine
+stores the baseline, --update-baseline replaces it (e.g. after an intended change).
+    python3 benchmarks.py
+    python3 benchmarks.py --only tests_results version_folder --scale 0.1
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import string
+import logging
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple
+
+LOGGER = logging.getLogger(__name__)
+
+# ~/.local is kept between the runs of the docker container (see scripts/run_test.sh)
+DEFAULT_BASELINE = os.path.join(os.path.expanduser("~"), ".local", "share", "cpp-driver-matrix", "benchmarks.json")
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_REPEATS = 3
+
+BENCHMARKS: Dict[str, Callable[[Path, float], Callable[[], None]]] = {}
+
+
+class Measurement(NamedTuple):
+    seconds: float  # the best of the repeats
+    peak_mb: float  # the peak of the memory allocated by Python while it ran
+    scale: float
+
+
+def benchmark(name: str):
+    """
+    Registers a benchmark: a function that prepares the fixture in work_dir for the scale and returns the hot path
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _text(size: int) -> str:
+    return "".join(random.choices(string.ascii_letters + " ", k=size))
+
+
+@benchmark("tests_results")
+def _tests_results(work_dir: Path, scale: float):
+    """
+    10k tests with 200MB of output at scale 1, 1% of them failed: the output is parsed line by line and written to the
+    indexed tests log as it is while the tests run, then the results are taken from the JUnit XML
+    """
+    from gtest_stream import GtestEventParser
+    from output_log import OutputLogWriter
+    from run import Run
+    tests = max(1, int(10000 * scale))
+    chatter = [_text(200) + "\n" for _ in range(64)]
+    lines_per_test = int(200 * 1024 * 1024 * scale / tests / 201)
+    output = [f"[==========] Running {tests} tests from 100 test cases.\n"]
+    junit = [f'<?xml version="1.0" encoding="UTF-8"?>\n<testsuites tests="{tests}" time="1000">\n']
+    failed = 0
+    for suite in range(100):
+        junit.append(f'<testsuite name="Suite{suite}Tests">\n')
+        for index in range(suite, tests, 100):
+            name = f"Suite{suite}Tests.Integration_Cassandra_{index}"
+            output.append(f"[ RUN      ] {name}\n")
+            output.extend(chatter[(index + line) % len(chatter)] for line in range(lines_per_test))
+            junit.append(f'<testcase name="Integration_Cassandra_{index}" status="run" time="{index % 1000 / 1000}" '
+                         f'classname="Suite{suite}Tests"')
+            if index % 100 == 0:
+                failed += 1
+                output.append(f"/src/tests/integration/tests/test_{suite}.cpp:{index}: Failure\n")
+                output.append("Expected equality of these values: 1 and 2\n")
+                output.append(f"[  FAILED  ] {name} ({index % 1000} ms)\n")
+                junit.append(f'><failure message="test_{suite}.cpp:{index}: Expected equality of these values: '
+                             f'1 and 2" type=""/></testcase>\n')
+            else:
+                output.append(f"[       OK ] {name} ({index % 1000} ms)\n")
+                junit.append("/>\n")
+        junit.append("</testsuite>\n")
+    junit.append("</testsuites>\n")
+    output.append(f"[==========] {tests} tests from 100 test cases ran. (1000 ms total)\n")
+    output.append(f"[  PASSED  ] {tests - failed} tests.\n")
+    output.append(f"[  FAILED  ] {failed} tests, listed below:\n")
+    xml_file = work_dir / "TEST-scylla-2.16.2-1.xml"
+    xml_file.write_text("".join(junit))
+    del junit
+    LOGGER.info("tests_results: %d tests, %.0f MB of output, %.1f MB of JUnit XML", tests,
+                sum(map(len, output)) / 1024 / 1024, xml_file.stat().st_size / 1024 / 1024)
+
+    def collect():
+        parser = GtestEventParser()
+        with OutputLogWriter(work_dir / "scylla-2.16.2-1.stdout.log.gz") as stdout_log:
+            for line in output:
+                stdout_log.write(line, parser.feed(line))
+        Run.collect_results(xml_file, parser, 1, '')
+    return collect
+
+
+@benchmark("version_folder")
+def _version_folder(work_dir: Path, scale: float):
+    """
+    The version folders of 20 years of releases, resolved for every release and a few unknown versions
+    """
+    import run
+    versions_dir = work_dir / "versions" / "scylla"
+    releases = [f"{major}.{minor}.{patch}-1" for major in range(1, 21) for minor in range(max(1, int(25 * scale)))
+                for patch in range(5)]
+    for release in releases[::3]:
+        (versions_dir / release).mkdir(parents=True)
+    (versions_dir / "master").mkdir()
+    targets = releases + [f"{major}.99.0-1" for major in range(1, 21)] + ["master", "not-a-version"]
+    LOGGER.info("version_folder: %d folders, %d lookups", len(releases[::3]) + 1, len(targets))
+
+    def resolve():
+        # The folders are looked up next to run.py
+        run_file = run.__file__
+        run.__file__ = str(work_dir / "run.py")
+        try:
+            for target in targets:
+                run.Run._Run__version_folder("scylla", target)  # pylint: disable=protected-access
+        finally:
+            run.__file__ = run_file
+    return resolve
+
+
+@benchmark("extract_n_latest_repo_tags")
+def _extract_n_latest_repo_tags(work_dir: Path, scale: float):
+    """
+    A repository with 5000 tags at scale 1, the releases of both drivers and some other tags
+    """
+    from main import extract_n_latest_repo_tags
+    repo = work_dir / "cpp-driver"
+    repo.mkdir()
+    subprocess.check_call(["git", "init", "--quiet"], cwd=repo)
+    (repo / "README.md").write_text("cpp-driver")
+    subprocess.check_call(["git", "add", "README.md"], cwd=repo)
+    subprocess.check_call(["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost", "commit", "--quiet",
+                           "-m", "init"], cwd=repo)
+    commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=repo, text=True).strip()
+    count = max(10, int(5000 * scale))
+    # At least two releases of each driver for the major versions that are extracted
+    tags = {f"{major}.{minor}.0{suffix}" for major in (10, 20) for minor in (0, 1) for suffix in ("", "-1")}
+    while len(tags) < count:
+        version = f"{random.randint(1, 30)}.{random.randint(0, 30)}.{random.randint(0, 30)}"
+        tags.add(random.choice([version, f"{version}-1", f"{version}-rc1", f"v{version}", f"{version}-beta"]))
+    # Written directly, creating thousands of tags one by one takes minutes
+    (repo / ".git" / "packed-refs").write_text("".join(f"{commit} refs/tags/{tag}\n" for tag in sorted(tags)))
+    LOGGER.info("extract_n_latest_repo_tags: %d tags", len(tags))
+
+    def extract():
+        os.environ["DEV_MODE"] = "1"
+        try:
+            for is_scylla_driver in (True, False):
+                extract_n_latest_repo_tags(str(repo), ["10", "20"], latest_tags_size=2,
+                                           is_scylla_driver=is_scylla_driver)
+        finally:
+            os.environ.pop("DEV_MODE")
+    return extract
+
+
+@benchmark("render_report")
+def _render_report(work_dir: Path, scale: float):
+    """
+    The report of 20 versions with 10k tests each at scale 1, 5% of them failed
+    """
+    from email_sender import render_report
+    from history import DurationRegression, FlakyTest, SlowTest
+    from junit import TestCase
+    from run import TestResults
+    tests = max(1, int(10000 * scale))
+    results = {}
+    for version in range(20):
+        cases = tuple(TestCase(f"Suite{index % 100}Tests.Integration_Cassandra_{index}",
+                               "failed" if index % 20 == 0 else "passed", index % 100 / 10,
+                               _text(200) if index % 20 == 0 else '') for index in range(tests))
+        failed_tests = [case.name for case in cases if case.status == "failed"]
+        results[f"2.{version}.0-1"] = TestResults(
+            running_tests=tests, ran_tests=tests, failed=len(failed_tests), failed_tests=failed_tests,
+            passed=tests - len(failed_tests), returncode=1, error='', tests=cases,
+            passed_on_retry=tuple(failed_tests[::2]), timed_out=tuple(failed_tests[:3]))
+    results["2.20.0-1"] = dict(exception=[f"  File \"run.py\", line {line}, in run\n" for line in range(100)])
+    history = dict(slowest_tests=[SlowTest(f"Suite.Test{index}", 10.0, 20.0, 10) for index in range(100)],
+                   duration_regressions=[DurationRegression(f"Suite.Test{index}", 20.0, 10.0, 2.0)
+                                         for index in range(100)],
+                   flaky_tests=[FlakyTest(f"Suite.Test{index}", 5, 5) for index in range(100)])
+    report = dict(results=results, history=history, scylla_version="2024.1.0-0", build_id="#1",
+                  build_url="https://jenkins/job/1/", job_name="cpp-driver-matrix", status="FAILED",
+                  driver_remote="https://github.com/scylladb/cpp-driver", attachment_notes=["note"] * 10)
+    return lambda: render_report(report)
+
+
+@benchmark("prepare_email")
+def _prepare_email(work_dir: Path, scale: float):
+    """
+    A 2MB report with 55MB of attachments at scale 1 (3 JUnit XMLs, the indexed tests log and the stderr log),
+    compressed and trimmed to the failed tests to fit the limit of the attachments
+    """
+    from attachments import Attachment, prepare_attachments
+    from email_sender import Email
+    from gtest_stream import GtestEventParser
+    from output_log import OutputLogWriter
+    # Longer than the window of gzip, so the files don't compress better than the real ones
+    chunks = [_text(2000) for _ in range(64)]
+    tests = max(1, int(5000 * scale))
+    failed_tests = tuple(f"Suite{index % 100}Tests.Integration_Cassandra_{index}" for index in range(0, tests, 100))
+    attachments = []
+    for version in range(3):
+        xml_file = work_dir / f"TEST-scylla-2.{version}.0-1.xml"
+        with open(xml_file, "w") as junit:
+            junit.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<testsuites tests="{tests}">\n')
+            for suite in range(100):
+                junit.write(f'<testsuite name="Suite{suite}Tests">\n')
+                for index in range(suite, tests, 100):
+                    junit.write(f'<testcase name="Integration_Cassandra_{index}" classname="Suite{suite}Tests">'
+                                f'<system-out>{chunks[(index + version) % len(chunks)]}</system-out>' +
+                                ('<failure message="Expected equality"/>' if index % 100 == 0 else '') +
+                                '</testcase>\n')
+                junit.write("</testsuite>\n")
+            junit.write("</testsuites>\n")
+        attachments.append(Attachment(xml_file, failed_tests))
+    stdout_log = work_dir / "scylla-2.0.0-1.stdout.log.gz"
+    parser = GtestEventParser()
+    with OutputLogWriter(stdout_log) as log_writer:
+        for index in range(tests):
+            name = f"Suite{index % 100}Tests.Integration_Cassandra_{index}"
+            lines = [f"[ RUN      ] {name}\n", *(chunks[(index * 7 + line) % len(chunks)] + "\n" for line in range(3)),
+                     f"[  FAILED  ] {name} (1 ms)\n" if index % 100 == 0 else f"[       OK ] {name} (1 ms)\n"]
+            for line in lines:
+                log_writer.write(line, parser.feed(line))
+    attachments.append(Attachment(stdout_log, failed_tests))
+    stderr_log = work_dir / "scylla-2.0.0-1.stderr.log"
+    with open(stderr_log, "w") as stderr:
+        for index in range(int(2000 * scale)):
+            stderr.write(chunks[index * 7 % len(chunks)] + "\n")
+    attachments.append(Attachment(stderr_log))
+    content = f"<html><body><pre>{_text(int(2 * 1024 * 1024 * scale))}</pre></body></html>"
+    LOGGER.info("prepare_email: %.0f MB of attachments",
+                sum(attachment.path.stat().st_size for attachment in attachments) / 1024 / 1024)
+    # Only the message is built, without connecting to the SMTP server
+    email_client = Email.__new__(Email)
+    email_client.sender = "qa@scylladb.com"
+    email_client.conn = None
+
+    def prepare():
+        with tempfile.TemporaryDirectory(dir=work_dir) as prepared_dir:
+            files, _ = prepare_attachments(attachments, Path(prepared_dir), email_client.attachments_size_limit)
+            email_client.prepare_email("FAILED: cpp-driver-matrix #1", content, ["qa@scylladb.com"],
+                                       files=files).close()
+    return prepare
+
+
+def measure(hot_path: Callable[[], None], repeats: int, scale: float) -> Measurement:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        hot_path()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        hot_path()
+        timings.append(time.perf_counter() - started)
+    return Measurement(seconds=round(min(timings), 4), peak_mb=round(peak / 1024 / 1024, 2), scale=scale)
+
+
+def regressions(results: Dict[str, Measurement], baseline: Dict[str, dict], tolerance: float) -> list:
+    found = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None or previous.get("scale") != result.scale:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if getattr(result, metric) > previous[metric] * (1 + tolerance):
+                found.append(f"{name}: {metric} {getattr(result, metric)} > {previous[metric]} "
+                             f"(+{tolerance:.0%} allowed)")
+    return found
+
+
+def main(names: list, scale: float, repeats: int, baseline_file: Path, tolerance: float,
+         update_baseline: bool) -> int:
+    baseline = json.loads(baseline_file.read_text()) if baseline_file.exists() else {}
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as work_dir:
+            random.seed(name)
+            hot_path = BENCHMARKS[name](Path(work_dir), scale)
+            results[name] = measure(hot_path, repeats, scale)
+            del hot_path
+        LOGGER.info("%s: %.3fs, peak %.1f MB", name, results[name].seconds, results[name].peak_mb)
+
+    print(f"{'benchmark':<30}{'seconds':>12}{'baseline':>12}{'peak MB':>12}{'baseline':>12}")
+    for name, result in results.items():
+        previous = baseline.get(name) if baseline.get(name, {}).get("scale") == scale else {}
+        print(f"{name:<30}{result.seconds:>12.3f}{previous.get('seconds', '-'):>12}"
+              f"{result.peak_mb:>12.1f}{previous.get('peak_mb', '-'):>12}")
+
+    found = [] if update_baseline else regressions(results, baseline, tolerance)
+    for regression in found:
+        LOGGER.error("Regression of %s", regression)
+    new_results = {name: result._asdict() for name, result in results.items()
+                   if update_baseline or baseline.get(name, {}).get("scale") != scale}
+    if new_results:
+        baseline_file.parent.mkdir(parents=True, exist_ok=True)
+        baseline_file.write_text(json.dumps(dict(baseline, **new_results), indent=2))
+        LOGGER.info("The baseline of %s was saved to '%s'", ", ".join(new_results), baseline_file)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the harness on synthetic fixtures")
+    parser.add_argument('--only', help="the benchmarks to run, all of them by default", nargs='+',
+                        choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--scale', help="size of the fixtures, e.g. 0.1 for a quick run (compared with the baseline "
+                                        "of the same scale only)", type=float, default=1.0)
+    parser.add_argument('--repeats', help="timed runs of every benchmark, the best one counts",
+                        type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--baseline', help=f"the stored results to compare with, default={DEFAULT_BASELINE}",
+                        type=Path, default=Path(DEFAULT_BASELINE))
+    parser.add_argument('--tolerance', help="how much slower or bigger than the baseline is still fine, "
+                                            "e.g. 0.25 for 25%%", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--update-baseline', help="store the results as the new baseline instead of comparing",
+                        action='store_true', dest='update_baseline')
+    arguments = parser.parse_args()
+    sys.exit(main(arguments.only, arguments.scale, arguments.repeats, arguments.baseline, arguments.tolerance,
+                  arguments.update_baseline))
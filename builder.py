@@ -0,0 +1,124 @@
+import os
+import shutil
+import hashlib
+import logging
+import subprocess
+from pathlib import Path
+from typing import List, NamedTuple
+
+LOGGER = logging.getLogger(__name__)
+
+# ~/.cache is a tmpfs inside the docker container (see scripts/run_test.sh), ~/.local survives between the runs
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "cpp-driver-matrix", "builds")
+TESTS_BINARY = "cassandra-integration-tests"
+
+
+class BuildOptions(NamedTuple):
+    jobs: int = None  # None means all the cpus available for the process
+    ninja: bool = False
+    ccache: bool = True
+    cache: bool = True
+    cache_dir: str = DEFAULT_CACHE_DIR
+    cache_size: int = 10  # how many builds to keep in the cache
+
+
+def default_jobs(concurrent_builds: int = 1) -> int:
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, cpus // max(1, concurrent_builds))
+
+
+def compiler_version() -> str:
+    compiler = os.environ.get("CXX", "c++")
+    try:
+        return subprocess.check_output([compiler, "--version"], text=True).splitlines()[0]
+    except (OSError, subprocess.CalledProcessError, IndexError):
+        return compiler
+
+
+def files_hash(files: List[Path]) -> str:
+    digest = hashlib.sha256()
+    for file_path in sorted(files):
+        digest.update(file_path.name.encode())
+        digest.update(file_path.read_bytes())
+    return digest.hexdigest()
+
+
+def build_key(driver_commit: str, patch_hash: str, options: BuildOptions, build_dir: Path) -> str:
+    """
+    The build dir is a part of the key: the tests binary finds the driver libraries by the absolute path of the build
+    dir it was linked in (RPATH), so it's restored only to the same path
+    """
+    digest = hashlib.sha256()
+    for part in (driver_commit, patch_hash, compiler_version(), "ninja" if options.ninja else "make",
+                 str(build_dir.resolve())):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def build_command(options: BuildOptions) -> str:
+    jobs = options.jobs or default_jobs()
+    cmake_args = ["-DCASS_BUILD_INTEGRATION_TESTS=ON"]
+    if options.ccache and shutil.which("ccache"):
+        cmake_args += ["-DCMAKE_C_COMPILER_LAUNCHER=ccache", "-DCMAKE_CXX_COMPILER_LAUNCHER=ccache"]
+    elif options.ccache:
+        LOGGER.info("ccache is not installed, compiling without it")
+    if options.ninja and shutil.which("ninja"):
+        return f"cmake -G Ninja {' '.join(cmake_args)} -S .. -B . && ninja -j {jobs}"
+    if options.ninja:
+        LOGGER.warning("ninja is not installed, falling back to make")
+    return f"cmake {' '.join(cmake_args)} -S .. -B . && make -j {jobs}"
+
+
+def _build_artifacts(build_dir: Path) -> List[Path]:
+    # The tests binary with the driver libraries it is linked to, that's all a test run needs from the build dir
+    return [path for path in build_dir.iterdir()
+            if path.name == TESTS_BINARY or (path.is_file() and ".so" in path.suffixes)] \
+        if build_dir.exists() else []
+
+
+class BuildCache:
+    """
+    Keeps the build outputs by the build key, so the identical build is restored instead of recompiled
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 10):
+        self._cache_dir = Path(cache_dir)
+        self._max_size = max_size
+
+    def restore(self, key: str, build_dir: Path) -> bool:
+        entry = self._cache_dir / key
+        if not (entry / TESTS_BINARY).exists():
+            return False
+        build_dir.mkdir(parents=True, exist_ok=True)
+        for artifact in entry.iterdir():
+            target = build_dir / artifact.name
+            if target.is_symlink() or target.exists():
+                target.unlink()
+            shutil.copy2(artifact, target, follow_symlinks=False)
+        entry.touch()
+        LOGGER.info("The build '%s' was restored from the cache", key)
+        return True
+
+    def store(self, key: str, build_dir: Path) -> None:
+        artifacts = _build_artifacts(build_dir)
+        if not any(artifact.name == TESTS_BINARY for artifact in artifacts):
+            LOGGER.warning("No '%s' in '%s', nothing to cache", TESTS_BINARY, build_dir)
+            return
+        entry = self._cache_dir / key
+        tmp_entry = self._cache_dir / f"{key}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        tmp_entry.mkdir(parents=True)
+        for artifact in artifacts:
+            shutil.copy2(artifact, tmp_entry / artifact.name, follow_symlinks=False)
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp_entry.rename(entry)
+        LOGGER.info("The build '%s' was stored in the cache", key)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted((entry for entry in self._cache_dir.iterdir() if entry.is_dir() and ".tmp-" not in entry.name),
+                         key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in entries[self._max_size:]:
+            LOGGER.info("Evicting the build '%s' from the cache", entry.name)
+            shutil.rmtree(entry, ignore_errors=True)
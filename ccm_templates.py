@@ -0,0 +1,164 @@
+"""
+Cache of initialized ccm clusters.
+
+The integration tests create every cluster with ``ccm create`` + ``ccm populate`` and then start it, so each fixture
+pays for the first boot of all its nodes (system tables creation etc.). When the tests run with the ``ccm_shim``
+directory first in PATH, ``ccm populate`` goes through this module: the first time a cluster is populated it's also
+started and stopped once and its node directories are saved as a template, the next times the template is copied
+(reflinked where the filesystem supports it) into the ccm directory instead.
+
+The templates are keyed by the scylla version, the install dir fingerprint, the create/populate arguments and the
+cluster name, since scylla refuses to start on data of a cluster with another name.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import subprocess
+from pathlib import Path
+from typing import List
+
+LOGGER = logging.getLogger(__name__)
+
+SHIM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ccm_shim")
+# Under ~/.ccm, so the templates are on the same filesystem as the clusters and can be reflinked
+DEFAULT_TEMPLATES_DIR = os.path.join(os.path.expanduser("~"), ".ccm", "templates")
+STATE_FILE = ".templates-state.json"
+# Files of the cluster that can keep the absolute path of the ccm directory
+TEXT_SUFFIXES = (".conf", ".yaml", ".yml", ".properties", ".sh", ".json", ".txt", "")
+
+
+def shim_env(env: dict, templates_dir: str = DEFAULT_TEMPLATES_DIR) -> dict:
+    """
+    The environment of the tests process with the ccm shim in front of the real ccm
+    """
+    real_ccm = shutil.which("ccm", path=env.get("PATH"))
+    if not real_ccm:
+        LOGGER.warning("ccm is not installed, the cluster templates are not used")
+        return env
+    return dict(env, PATH=f"{SHIM_DIR}{os.pathsep}{env.get('PATH', '')}", CCM_REAL=real_ccm,
+                CCM_TEMPLATES_DIR=templates_dir)
+
+
+def _ccm_dir() -> Path:
+    return Path(os.environ.get("CCM_CONFIG_DIR", os.path.join(os.path.expanduser("~"), ".ccm")))
+
+
+def _real_ccm(args: List[str]) -> int:
+    return subprocess.call([os.environ["CCM_REAL"], *args])
+
+
+def _install_fingerprint(create_args: List[str]) -> str:
+    install_dir = next((arg.split("=", 1)[1] for arg in create_args if arg.startswith("--install-dir=")), None)
+    if install_dir is None and "--install-dir" in create_args:
+        install_dir = create_args[create_args.index("--install-dir") + 1]
+    if not install_dir:
+        return ""
+    scylla = Path(install_dir) / "scylla"
+    stat = scylla.stat() if scylla.exists() else Path(install_dir).stat()
+    return f"{os.path.realpath(install_dir)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def template_key(cluster_name: str, create_args: List[str], populate_args: List[str]) -> str:
+    parts = dict(name=cluster_name, create=create_args, populate=populate_args,
+                 scylla_version=os.environ.get("SCYLLA_VERSION", ""), install=_install_fingerprint(create_args))
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def _rewrite_paths(cluster_dir: Path, old_path: str, new_path: str) -> None:
+    if old_path == new_path:
+        return
+    for node_file in cluster_dir.rglob("*"):
+        # The data directories are binary and keep no paths, only the configuration is rewritten
+        if "data" in node_file.relative_to(cluster_dir).parts or node_file.is_symlink() or not node_file.is_file() \
+                or node_file.suffix not in TEXT_SUFFIXES or node_file.stat().st_size > 1024 * 1024:
+            continue
+        try:
+            content = node_file.read_text()
+        except UnicodeDecodeError:
+            continue
+        if old_path in content:
+            node_file.write_text(content.replace(old_path, new_path))
+
+
+def _copy_tree(source: Path, dest: Path) -> None:
+    subprocess.check_call(["cp", "-a", "--reflink=auto", str(source), str(dest)])
+
+
+def restore(template_dir: Path, cluster_dir: Path) -> None:
+    shutil.rmtree(cluster_dir, ignore_errors=True)
+    _copy_tree(template_dir, cluster_dir)
+    _rewrite_paths(cluster_dir, (template_dir / "origin").read_text(), str(cluster_dir))
+    (cluster_dir / "origin").unlink()
+
+
+def capture(cluster_dir: Path, template_dir: Path) -> None:
+    tmp_dir = template_dir.with_name(f"{template_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.parent.mkdir(parents=True, exist_ok=True)
+    _copy_tree(cluster_dir, tmp_dir)
+    for log_dir in tmp_dir.glob("*/logs"):
+        shutil.rmtree(log_dir, ignore_errors=True)
+        log_dir.mkdir()
+    (tmp_dir / "origin").write_text(str(cluster_dir))
+    try:
+        tmp_dir.rename(template_dir)
+    except OSError:
+        # Another process captured the same template meanwhile
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _load_state(ccm_dir: Path) -> dict:
+    state_file = ccm_dir / STATE_FILE
+    return json.loads(state_file.read_text()) if state_file.exists() else {}
+
+
+def _save_state(ccm_dir: Path, state: dict) -> None:
+    (ccm_dir / STATE_FILE).write_text(json.dumps(state))
+
+
+def shim(args: List[str]) -> int:
+    """
+    Entry point of ccm_shim/ccm: every command but create and populate goes to the real ccm as is
+    """
+    if not args or args[0] not in ("create", "populate"):
+        return _real_ccm(args)
+    ccm_dir = _ccm_dir()
+    if args[0] == "create":
+        returncode = _real_ccm(args)
+        if returncode == 0 and len(args) > 1:
+            ccm_dir.mkdir(parents=True, exist_ok=True)
+            state = _load_state(ccm_dir)
+            state[args[1]] = args[2:]
+            _save_state(ccm_dir, state)
+        return returncode
+
+    current_file = ccm_dir / "CURRENT"
+    cluster_name = current_file.read_text().strip() if current_file.exists() else None
+    create_args = _load_state(ccm_dir).get(cluster_name)
+    if cluster_name is None or create_args is None:
+        return _real_ccm(args)
+    cluster_dir = ccm_dir / cluster_name
+    template_dir = Path(os.environ["CCM_TEMPLATES_DIR"]) / template_key(cluster_name, create_args, args[1:])
+    if template_dir.exists():
+        LOGGER.info("Restoring the cluster '%s' from the template '%s'", cluster_name, template_dir)
+        restore(template_dir, cluster_dir)
+        return 0
+
+    returncode = _real_ccm(args)
+    if returncode != 0:
+        return returncode
+    LOGGER.info("Initializing the cluster '%s' once to save it as the template '%s'", cluster_name, template_dir)
+    if _real_ccm(["start", "--wait-for-binary-proto"]) == 0 and _real_ccm(["stop"]) == 0:
+        capture(cluster_dir, template_dir)
+    else:
+        _real_ccm(["stop"])
+        LOGGER.warning("Failed to initialize the cluster '%s', no template was saved", cluster_name)
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="ccm-templates: %(message)s", stream=sys.stderr)
+    sys.exit(shim(sys.argv[1:]))
@@ -1,10 +1,12 @@
 import os
 import json
+import uuid
+import base64
 import smtplib
 import os.path
 import logging
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
+import tempfile
+from email import policy as email_policy
 from email.mime.text import MIMEText
 from datetime import datetime
 from pathlib import Path
@@ -13,11 +15,18 @@ from subprocess import check_output
 import jinja2
 import boto3
 
+from attachments import prepare_attachments
+
 KEYSTORE_S3_BUCKET = "scylla-qa-keystore"
 
 LOGGER = logging.getLogger(__name__)
 
 
+def _header(name: str, value: str) -> bytes:
+    # Parsed by the header registry, so the non-ASCII text is encoded (RFC 2047, and RFC 2231 for the file names)
+    return email_policy.SMTP.header_factory(name, value).fold(policy=email_policy.SMTP).encode("ascii")
+
+
 class KeyStore:
     def __init__(self):
         self.s3 = boto3.resource("s3")
@@ -55,21 +64,35 @@ class BodySizeExceeded(Exception):
 class Email:
     #  pylint: disable=too-many-instance-attributes
     """
-    Responsible for sending emails
+    Responsible for sending emails, a single SMTP session is kept for all the emails sent by the instance.
+    SMTP_SERVER=host:port sends through a local server instead (e.g. a test stand-in, "python3 -m aiosmtpd -n"),
+    without the credentials and TLS.
     """
     _attachments_size_limit = 10485760  # 10Mb = 20 * 1024 * 1024
     _body_size_limit = 26214400  # 25Mb = 20 * 1024 * 1024
+    _spool_size = 1048576  # the messages above 1Mb are built in a temporary file instead of the memory
 
-    def __init__(self):
+    def __init__(self, server: str = None):
         self.sender = "qa@scylladb.com"
         self._password = ""
         self._user = ""
         self._server_host = "smtp.gmail.com"
         self._server_port = "587"
-        self._conn = None
-        self._retrieve_credentials()
+        self.conn = None
+        server = server or os.getenv("SMTP_SERVER")
+        if server:
+            self._server_host, _, self._server_port = server.partition(":")
+            self._server_port = self._server_port or "25"
+            self._local = True
+        else:
+            self._local = False
+            self._retrieve_credentials()
         self._connect()
 
+    @property
+    def attachments_size_limit(self):
+        return self._attachments_size_limit
+
     def _retrieve_credentials(self):
         keystore = KeyStore()
         creds = keystore.get_email_credentials()
@@ -79,35 +102,42 @@ class Email:
     def _connect(self):
         self.conn = smtplib.SMTP(host=self._server_host, port=self._server_port)
         self.conn.ehlo()
-        self.conn.starttls()
-        self.conn.login(user=self._user, password=self._password)
+        if not self._local:
+            self.conn.starttls()
+            self.conn.login(user=self._user, password=self._password)
 
     def prepare_email(self, subject, content, recipients, html=True, files=()):  # pylint: disable=too-many-arguments
-        msg = MIMEMultipart()
-        msg['subject'] = subject
-        msg['from'] = self.sender
+        """
+        The message is written part by part, the attachments are base64 encoded chunk by chunk.
+        Returns a file with the message, positioned at its start
+        """
         assert recipients, "No recipients provided"
-        msg['to'] = ','.join(recipients)
-        if html:
-            text_part = MIMEText(content, "html")
-        else:
-            text_part = MIMEText(content, "plain")
-        msg.attach(text_part)
-        attachment_size = 0
-        for path in files:
-            attachment_size += os.path.getsize(path)
-            with open(path, "rb") as fil:
-                part = MIMEApplication(
-                    fil.read(),
-                    Name=os.path.basename(path)
-                )
-            part['Content-Disposition'] = 'attachment; filename="%s"' % os.path.basename(path)
-            msg.attach(part)
+        attachment_size = sum(os.path.getsize(path) for path in files)
         if attachment_size >= self._attachments_size_limit:
             raise AttachementSizeExceeded(current_size=attachment_size, limit=self._attachments_size_limit)
-        email = msg.as_string()
-        if len(email) >= self._body_size_limit:
-            raise BodySizeExceeded(current_size=len(email), limit=self._body_size_limit)
+        boundary = f"==============={uuid.uuid4().hex}=="
+        email = tempfile.SpooledTemporaryFile(max_size=self._spool_size)
+        for name, value in (("Subject", subject), ("From", self.sender), ("To", ','.join(recipients)),
+                            ("MIME-Version", "1.0"), ("Content-Type", f'multipart/mixed; boundary="{boundary}"')):
+            email.write(_header(name, value))
+        email.write(f"\r\n--{boundary}\r\n".encode())
+        text_part = MIMEText(content, "html" if html else "plain", "utf-8")
+        email.write(text_part.as_bytes(policy=email_policy.SMTP))
+        for path in files:
+            name = os.path.basename(path)
+            email.write(f"\r\n--{boundary}\r\n".encode())
+            email.write(_header("Content-Type", f'application/octet-stream; name="{name}"'))
+            email.write(b"Content-Transfer-Encoding: base64\r\n")
+            email.write(_header("Content-Disposition", f'attachment; filename="{name}"'))
+            email.write(b"\r\n")
+            with open(path, "rb") as fil:
+                # Multiple of the 57 bytes encoded to a line of 76 characters, so the lines are kept whole
+                for chunk in iter(lambda: fil.read(57 * 1024), b""):  # pylint: disable=cell-var-from-loop
+                    email.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+        email.write(f"\r\n--{boundary}--\r\n".encode())
+        if email.tell() >= self._body_size_limit:
+            raise BodySizeExceeded(current_size=email.tell(), limit=self._body_size_limit)
+        email.seek(0)
         return email
 
     def send(self, subject, content, recipients, html=True, files=()):  # pylint: disable=too-many-arguments
@@ -119,30 +149,107 @@ class Email:
         :param files: paths of the files that will be attached to the email
         :return:
         """
-        email = self.prepare_email(subject, content, recipients, html, files)
-        self.send_email(recipients, email)
+        with self.prepare_email(subject, content, recipients, html, files) as email:
+            self.send_email(recipients, email)
 
     def send_email(self, recipients, email):
-        self.conn.sendmail(self.sender, recipients, email)
+        """
+        :param email: the message, as text or as a file to stream it from
+        """
+        try:
+            self._send_email(recipients, email)
+        except smtplib.SMTPServerDisconnected:
+            # The session timed out between the emails
+            LOGGER.info("The SMTP server disconnected, reconnecting")
+            self._connect()
+            if not isinstance(email, (str, bytes)):
+                email.seek(0)
+            self._send_email(recipients, email)
+
+    def _send_email(self, recipients, email):
+        if isinstance(email, (str, bytes)):
+            self.conn.sendmail(self.sender, recipients, email)
+            return
+        self.conn.ehlo_or_helo_if_needed()
+        code, response = self.conn.mail(self.sender)
+        if code != 250:
+            self.conn.rset()
+            raise smtplib.SMTPSenderRefused(code, response, self.sender)
+        refused = {}
+        for recipient in recipients:
+            code, response = self.conn.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            self.conn.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        self.conn.putcmd("data")
+        code, response = self.conn.getreply()
+        if code != 354:
+            self.conn.rset()
+            raise smtplib.SMTPDataError(code, response)
+        buffer = []
+        buffered = 0
+        for line in email:
+            # The dot at the start of a line is doubled, so it isn't taken for the end of the data
+            if line.startswith(b"."):
+                line = b"." + line
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= 65536:
+                self.conn.send(b"".join(buffer))
+                buffer, buffered = [], 0
+        self.conn.send(b"".join(buffer) + b".\r\n")
+        code, response = self.conn.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, response)
+        if refused:
+            LOGGER.warning("Some of the recipients were refused: %s", refused)
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def __del__(self):
-        self.conn.quit()
+        self.close()
 
 
-def send_mail(recipients, report):
+def render_report(report):
     loader = jinja2.FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_templates'))
     env = jinja2.Environment(loader=loader, autoescape=True, extensions=['jinja2.ext.loopcontrols'])
     template = env.get_template("report.html")
-    html = template.render(report)
-    LOGGER.info("Results has been rendered to html")
+    return template.render(report)
 
-    email_client = Email()
-    LOGGER.info("Sending email to '%s'", recipients)
-    subject = f"{report['status']}: {report['job_name']} {report['build_id']} - {datetime.now()}"
 
-    email_client.send(subject=subject,
-                      content=html,
-                      recipients=recipients)
+def send_mail(recipients, report, attachments=(), recipient_groups=()):
+    """
+    :param attachments: attachments.Attachment of the files to attach, compressed and trimmed to fit the email
+    :param recipient_groups: more lists of recipients, each one gets its own email over the same SMTP session
+    """
+    with Email() as email_client, tempfile.TemporaryDirectory() as work_dir:
+        files, notes = prepare_attachments(list(attachments), Path(work_dir), email_client.attachments_size_limit)
+        html = render_report(dict(report, attachment_notes=notes))
+        LOGGER.info("Results has been rendered to html")
+
+        subject = f"{report['status']}: {report['job_name']} {report['build_id']} - {datetime.now()}"
+        for group in [recipients, *recipient_groups]:
+            if not group:
+                continue
+            LOGGER.info("Sending email to '%s'", group)
+            email_client.send(subject=subject,
+                              content=html,
+                              recipients=group,
+                              files=files)
 
 
 def get_scylla_build_info():
@@ -0,0 +1,191 @@
+import re
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from subprocess import Popen
+from typing import Callable, Dict, List, NamedTuple, Optional, TextIO
+
+from junit import TestCase
+
+LOGGER = logging.getLogger(__name__)
+
+RUNNING_RE = re.compile(r"\[==========] Running (\d+) test.? from (\d+) test.? case")
+RAN_RE = re.compile(r"\[==========] (\d+) test.? from (\d+) test case.? ran")
+RUN_RE = re.compile(r"\[ RUN      ] (\S+)")
+OK_RE = re.compile(r"\[       OK ] (\S+) \((\d+) ms\)")
+FAILED_RE = re.compile(r"\[[ ]{2}FAILED[ ]{2}] (\S+?),? ")
+PASSED_SUMMARY_RE = re.compile(r"\[[ ]{2}PASSED[ ]{2}] (\d+) test")
+FAILED_SUMMARY_RE = re.compile(r"\[[ ]{2}FAILED[ ]{2}] (\d+) test")
+FAILURE_RE = re.compile(r":\d+: Failure$")
+OUTPUT_TAIL = 20  # lines of the running test's output kept for its failure message
+
+
+class TestEvent(NamedTuple):
+    name: str
+    status: str  # "running", "passed" or "failed"
+    started: float  # time.monotonic() of the RUN line
+    finished: Optional[float]
+    duration_ms: Optional[int]  # as reported by gtest
+
+
+class GtestEventParser:
+    """
+    Incremental parser of the gtest output, fed line by line while the tests are running.
+    Its memory depends on the number of tests only, not on the size of the output.
+    """
+
+    def __init__(self):
+        self.running_tests = 0
+        self.ran_tests = 0
+        self.summary_passed = None
+        self.summary_failed = None
+        self.current_test: Optional[str] = None
+        self.tests: Dict[str, TestEvent] = {}
+        self.failed_tests: List[str] = []
+        self.messages: Dict[str, str] = {}  # the failure messages known without the XML
+        self._output = deque(maxlen=OUTPUT_TAIL)
+
+    def feed(self, line: str, now: float = None) -> Optional[TestEvent]:
+        """
+        Parse a single line of the output, returns the test event the line produced (if any)
+        """
+        if not line.startswith("["):
+            if self.current_test is not None:
+                self._output.append(line.rstrip())
+            return None
+        now = time.monotonic() if now is None else now
+        if match := RUN_RE.match(line):
+            self.current_test = match.group(1)
+            self._output.clear()
+            event = TestEvent(name=self.current_test, status="running", started=now, finished=None, duration_ms=None)
+            self.tests[event.name] = event
+            return event
+        if match := OK_RE.match(line):
+            return self._finish(match.group(1), "passed", now, int(match.group(2)))
+        if match := FAILED_SUMMARY_RE.match(line):
+            self.summary_failed = int(match.group(1))
+            return None
+        if match := FAILED_RE.match(line):
+            name = match.group(1)
+            if name in self.tests and self.tests[name].status == "running":
+                self.messages.setdefault(name, self._failure_message())
+                duration = re.search(r"\((\d+) ms\)", line)
+                return self._finish(name, "failed", now, int(duration.group(1)) if duration else None)
+            return None
+        if match := RUNNING_RE.match(line):
+            self.running_tests = int(match.group(1))
+        elif match := RAN_RE.match(line):
+            self.ran_tests = int(match.group(1))
+        elif match := PASSED_SUMMARY_RE.match(line):
+            self.summary_passed = int(match.group(1))
+        return None
+
+    def _finish(self, name: str, status: str, now: float, duration_ms: Optional[int]) -> TestEvent:
+        started = self.tests[name].started if name in self.tests else now
+        event = TestEvent(name=name, status=status, started=started, finished=now, duration_ms=duration_ms)
+        self.tests[name] = event
+        if status == "failed" and name not in self.failed_tests:
+            self.failed_tests.append(name)
+        if self.current_test == name:
+            self.current_test = None
+        return event
+
+    def _failure_message(self) -> str:
+        # From the last gtest "<file>:<line>: Failure" on, or the last lines of the test's output
+        lines = list(self._output)
+        starts = [index for index, line in enumerate(lines) if FAILURE_RE.search(line)]
+        return "\n".join(lines[starts[-1]:] if starts else lines[-5:])
+
+    def interrupt(self, name: str, message: str, now: float = None) -> TestEvent:
+        """
+        Fail the test that never finished, its process was killed
+        """
+        self.messages[name] = message
+        return self._finish(name, "failed", time.monotonic() if now is None else now, None)
+
+    def test_cases(self, names: List[str] = None) -> List[TestCase]:
+        events = self.tests.values() if names is None else [self.tests[name] for name in names]
+        return [TestCase(name=event.name, status=event.status if event.status != "running" else "failed",
+                         duration=event.duration_ms / 1000 if event.duration_ms is not None
+                         else (event.finished or time.monotonic()) - event.started,
+                         message=self.messages.get(event.name, ''))
+                for event in events]
+
+    @property
+    def passed(self) -> int:
+        if self.summary_passed is not None:
+            return self.summary_passed
+        return sum(1 for event in self.tests.values() if event.status == "passed")
+
+    @property
+    def failed(self) -> int:
+        if self.summary_failed is not None:
+            return self.summary_failed
+        return len(self.failed_tests)
+
+
+class OutputPump:
+    """
+    Reads stdout and stderr of the process concurrently, so neither of the pipes can fill up and block it.
+    The lines are echoed to the console, written to the files and stdout is fed to the parser.
+    stdout_log (an output_log.OutputLogWriter) gets the stdout lines along with the test events they produced.
+    Only the last lines of stderr are kept in memory.
+    """
+    _stderr_tail_size = 200
+
+    def __init__(self, process: Popen, parser: GtestEventParser, stdout_file: TextIO = None,
+                 stderr_file: TextIO = None, output_prefix: str = '', stdout_log=None):
+        self._process = process
+        self._parser = parser
+        self._files = {"stdout": stdout_file, "stderr": stderr_file}
+        self._stdout_log = stdout_log
+        self._output_prefix = output_prefix
+        self._lines = queue.Queue(maxsize=10000)
+        self.stderr_tail = deque(maxlen=self._stderr_tail_size)
+
+    def _reader(self, name: str, stream: TextIO) -> None:
+        try:
+            for line in stream:
+                self._lines.put((name, line))
+        finally:
+            self._lines.put((name, None))
+
+    def run(self, on_idle: Callable[[], None] = None, poll_interval: float = 1.0) -> None:
+        """
+        Pump the output until both streams are closed.
+        on_idle is called every poll_interval seconds, regardless of the output.
+        """
+        readers = [threading.Thread(target=self._reader, args=(name, getattr(self._process, name)), daemon=True)
+                   for name in ("stdout", "stderr")]
+        for reader in readers:
+            reader.start()
+        open_streams = len(readers)
+        last_idle = time.monotonic()
+        while open_streams:
+            try:
+                name, line = self._lines.get(timeout=poll_interval)
+            except queue.Empty:
+                name = line = None
+            else:
+                if line is None:
+                    open_streams -= 1
+                else:
+                    self._handle(name, line)
+            if on_idle and time.monotonic() - last_idle >= poll_interval:
+                last_idle = time.monotonic()
+                on_idle()
+        for reader in readers:
+            reader.join()
+
+    def _handle(self, name: str, line: str) -> None:
+        print(f"{self._output_prefix}{line}", end='')
+        if self._files[name]:
+            self._files[name].write(line)
+        if name == "stdout":
+            event = self._parser.feed(line)
+            if self._stdout_log is not None:
+                self._stdout_log.write(line, event)
+        else:
+            self.stderr_tail.append(line)
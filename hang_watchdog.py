@@ -0,0 +1,211 @@
+"""
+Watchdog of the hung tests.
+
+The tests binary has no timeouts of its own, a single test waiting forever (e.g. for a reconnection) stalls the whole
+version until the CI job is killed and all its results are lost. The watchdog follows the tests output through the
+GtestEventParser and knows which test runs and since when. When the test, its suite or the gap between two tests
+exceed their budget, the diagnostics are saved, the process group of the tests and the nodes of the ccm cluster are
+killed, and the tests binary is started again for the remaining tests.
+
+The budgets are in seconds, the defaults can be overridden per test or suite in the "timeouts" section of the
+version's ignore.yaml, by the same patterns as the ignored tests:
+
+    timeouts:
+      test: 900
+      suite: 3600
+      tests:
+        ControlConnectionTests.*: 1800
+      suites:
+        SchemaMetadataTest: 7200
+"""
+import os
+import time
+import shutil
+import signal
+import logging
+import subprocess
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from gtest_stream import GtestEventParser
+from scheduler import suite_name
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TEST_TIMEOUT = 900
+DEFAULT_SUITE_TIMEOUT = None
+POLL_INTERVAL = 5.0
+TESTS_BINARY_NAME = "cassandra-integration-tests"
+DIAGNOSTICS_TIMEOUT = 120
+
+
+class TimeoutBudgets(NamedTuple):
+    test: Optional[float]  # seconds, None for no limit
+    suite: Optional[float]
+    tests: Dict[str, float] = {}  # pattern -> seconds
+    suites: Dict[str, float] = {}
+
+    @classmethod
+    def from_config(cls, config: Optional[dict], test: Optional[float] = DEFAULT_TEST_TIMEOUT,
+                    suite: Optional[float] = DEFAULT_SUITE_TIMEOUT) -> "TimeoutBudgets":
+        """
+        The "timeouts" section of ignore.yaml on top of the defaults, 0 means no limit
+        """
+        config = config or {}
+        return cls(test=config.get("test", test) or None, suite=config.get("suite", suite) or None,
+                   tests=dict(config.get("tests") or {}), suites=dict(config.get("suites") or {}))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.test or self.suite or self.tests or self.suites)
+
+    @staticmethod
+    def _budget(name: str, overrides: Dict[str, float], default: Optional[float]) -> Optional[float]:
+        if name in overrides:
+            return overrides[name] or None
+        for pattern, budget in overrides.items():
+            if fnmatchcase(name, pattern):
+                return budget or None
+        return default
+
+    def test_budget(self, test: str) -> Optional[float]:
+        return self._budget(test, self.tests, self.test)
+
+    def suite_budget(self, suite: str) -> Optional[float]:
+        return self._budget(suite, self.suites, self.suite)
+
+
+class Hang(NamedTuple):
+    reason: str
+    test: Optional[str]  # the test that was running, None if it hung between the tests
+    skip: List[str]  # what else not to run when the tests are resumed, e.g. the rest of the suite
+
+
+class HangWatchdog:
+    """
+    Checks the budgets of the running test and suite, check() is called periodically while the tests run
+    """
+
+    def __init__(self, budgets: TimeoutBudgets, parser: GtestEventParser):
+        self._budgets = budgets
+        self._parser = parser
+        self._suites_started: Dict[str, float] = {}
+        self._process_started = time.monotonic()
+
+    def restart(self, now: float = None) -> None:
+        """
+        A new tests process was started, the gap before its first test counts from now
+        """
+        self._process_started = time.monotonic() if now is None else now
+
+    def check(self, now: float = None) -> Optional[Hang]:
+        now = time.monotonic() if now is None else now
+        test = self._parser.current_test
+        if test is None:
+            # Between the tests: the setup/teardown of a suite or the binary itself got stuck
+            last_activity = max([self._process_started] + [event.finished for event in self._parser.tests.values()
+                                                            if event.finished is not None])
+            if self._budgets.test and now - last_activity > self._budgets.test:
+                return Hang(reason=f"no test started for {now - last_activity:.0f} seconds "
+                                   f"(budget {self._budgets.test:.0f})", test=None, skip=[])
+            return None
+        started = self._parser.tests[test].started
+        budget = self._budgets.test_budget(test)
+        if budget and now - started > budget:
+            return Hang(reason=f"{test} ran for {now - started:.0f} seconds (budget {budget:.0f})", test=test, skip=[])
+        suite = suite_name(test)
+        if suite not in self._suites_started:
+            self._suites_started[suite] = min(event.started for event in self._parser.tests.values()
+                                              if suite_name(event.name) == suite)
+        budget = self._budgets.suite_budget(suite)
+        if budget and now - self._suites_started[suite] > budget:
+            return Hang(reason=f"{suite} ran for {now - self._suites_started[suite]:.0f} seconds "
+                               f"(budget {budget:.0f})", test=test, skip=[f"{suite}.*"])
+        return None
+
+
+def _command_output(cmd: List[str], env: dict = None) -> str:
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env,
+                                timeout=DIAGNOSTICS_TIMEOUT)
+        return result.stdout
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        return f"{exc}\n"
+
+
+def _session_pids(session_id: int) -> List[int]:
+    pids = []
+    for proc_dir in Path("/proc").iterdir():
+        if not proc_dir.name.isdigit():
+            continue
+        try:
+            if os.getsid(int(proc_dir.name)) == session_id:
+                pids.append(int(proc_dir.name))
+        except OSError:
+            continue
+    return pids
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        return (Path("/proc") / str(pid) / "cmdline").read_text().replace("\0", " ")
+    except OSError:
+        return ""
+
+
+def ccm_node_pids(ccm_config_dir: str) -> List[int]:
+    """
+    The scylla nodes started from the ccm directory, ccm detaches them so they aren't children of the tests
+    """
+    # With the separator, so the nodes of ~/.ccm/shard-10 aren't taken for the nodes of ~/.ccm/shard-1
+    ccm_dir = os.path.join(os.path.realpath(ccm_config_dir), "")
+    return [int(proc_dir.name) for proc_dir in Path("/proc").iterdir()
+            if proc_dir.name.isdigit() and "scylla" in (cmdline := _cmdline(int(proc_dir.name))) and ccm_dir in cmdline]
+
+
+def dump_diagnostics(hang: Hang, session_id: int, env: dict, diagnostics_file: Path, stderr_tail: Iterable[str]) -> None:
+    """
+    Save what is needed to understand the hang: the processes, the stacks of the tests binary,
+    the state of the ccm cluster and the end of the tests stderr
+    """
+    sections = [("Hang", hang.reason + "\n")]
+    pids = _session_pids(session_id)
+    if pids:
+        sections.append(("Processes", _command_output(["ps", "-o", "pid,ppid,etime,time,stat,args", "-p",
+                                                       ",".join(map(str, pids))])))
+    if shutil.which("gdb"):
+        for pid in pids:
+            if TESTS_BINARY_NAME in _cmdline(pid):
+                sections.append((f"Stacks of {pid}", _command_output(["gdb", "-p", str(pid), "-batch", "-nx",
+                                                                      "-ex", "thread apply all bt"])))
+    else:
+        sections.append(("Stacks", "gdb is not installed\n"))
+    if shutil.which("ccm", path=env.get("PATH")):
+        sections.append(("ccm status", _command_output(["ccm", "status", "-v"], env=env)))
+    sections.append(("stderr", "".join(stderr_tail)))
+    diagnostics_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(diagnostics_file, "w") as diagnostics:
+        for title, content in sections:
+            diagnostics.write(f"===== {title} =====\n{content}\n")
+    LOGGER.info("The diagnostics of the hang are saved to '%s'", diagnostics_file)
+
+
+def kill_tests(session_id: int, env: dict) -> None:
+    """
+    Kill the process group of the tests (started in its own session) and the nodes of its ccm cluster
+    """
+    try:
+        os.killpg(session_id, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    if shutil.which("ccm", path=env.get("PATH")):
+        # The cluster is left in the ccm directory, the next test removes it or creates its own
+        _command_output(["ccm", "stop", "--not-gently"], env=env)
+    ccm_config_dir = env.get("CCM_CONFIG_DIR") or os.path.join(os.path.expanduser("~"), ".ccm")
+    for pid in ccm_node_pids(ccm_config_dir):
+        LOGGER.info("Killing the scylla node %d", pid)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
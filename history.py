@@ -0,0 +1,191 @@
+import os
+import time
+import sqlite3
+import logging
+import argparse
+from typing import Iterable, List, NamedTuple
+
+from junit import TestCase
+
+LOGGER = logging.getLogger(__name__)
+
+# ~/.local is kept between the runs of the docker container (see scripts/run_test.sh)
+DEFAULT_DB = os.path.join(os.path.expanduser("~"), ".local", "share", "cpp-driver-matrix", "history.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    driver_type TEXT NOT NULL,
+    driver_version TEXT NOT NULL,
+    scylla_build TEXT NOT NULL,
+    build_id TEXT NOT NULL,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    test TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_test ON results (test, run_id);
+CREATE INDEX IF NOT EXISTS runs_driver ON runs (driver_type, driver_version);
+"""
+
+# The ids of the last N runs of every driver version, the parameters are the driver type and N
+LAST_RUNS = """
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY driver_version ORDER BY id DESC) AS age
+        FROM runs WHERE driver_type = ?
+    ) WHERE age <= ?"""
+
+
+class SlowTest(NamedTuple):
+    test: str
+    avg_duration: float
+    max_duration: float
+    runs: int
+
+
+class DurationRegression(NamedTuple):
+    test: str
+    duration: float  # in the latest run
+    baseline: float  # average of the previous runs
+    ratio: float
+
+
+class FlakyTest(NamedTuple):
+    test: str
+    passed: int
+    failed: int
+
+
+class HistoryStore:
+    """
+    Outcome and duration of every test, by the driver type and version, the scylla build and the CI build id
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # The matrix jobs running at the same time share the file, so wait for the lock instead of failing
+        self._conn = sqlite3.connect(db_path, timeout=60)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def record(self, driver_type: str, driver_version: str, scylla_build: str, build_id: str,
+               tests: Iterable[TestCase]) -> int:
+        with self._conn:
+            run_id = self._conn.execute(
+                "INSERT INTO runs (driver_type, driver_version, scylla_build, build_id, started_at) "
+                "VALUES (?, ?, ?, ?, ?)", (driver_type, driver_version, scylla_build, build_id, time.time())).lastrowid
+            self._conn.executemany("INSERT INTO results (run_id, test, status, duration) VALUES (?, ?, ?, ?)",
+                                   ((run_id, test.name, test.status, test.duration) for test in tests))
+        return run_id
+
+    def record_results(self, driver_type: str, scylla_build: str, build_id: str, results: dict) -> None:
+        """
+        Record the tests of every version that ran them. The versions that failed with an exception, were restored
+        from the cache or rerun by --rerun-failed (the tests of the previous run, recorded by it) are skipped.
+        """
+        for version, result in results.items():
+            if isinstance(result, dict) or not result.tests or result.cached_from or result.rerun:
+                continue
+            self.record(driver_type=driver_type, driver_version=version, scylla_build=scylla_build,
+                        build_id=build_id, tests=result.tests)
+
+    def durations(self, driver_type: str, driver_version: str = None, last_runs: int = 10) -> dict:
+        """
+        Average passed duration of every test over the last runs (of the driver version if given), in seconds
+        """
+        rows = self._conn.execute(f"""
+            SELECT test, AVG(duration) FROM results
+            WHERE run_id IN ({LAST_RUNS}) AND status = 'passed'
+            AND (? IS NULL OR run_id IN (SELECT id FROM runs WHERE driver_version = ?))
+            GROUP BY test""", (driver_type, last_runs, driver_version, driver_version))
+        durations = dict(rows)
+        if driver_version and not durations:
+            # A new version, the durations of the other versions are the best guess
+            return self.durations(driver_type, last_runs=last_runs)
+        return durations
+
+    def slowest_tests(self, driver_type: str, last_runs: int = 10, limit: int = 20) -> List[SlowTest]:
+        rows = self._conn.execute(f"""
+            SELECT test, AVG(duration), MAX(duration), COUNT(*) FROM results
+            WHERE run_id IN ({LAST_RUNS})
+            GROUP BY test ORDER BY AVG(duration) DESC LIMIT ?""", (driver_type, last_runs, limit))
+        return [SlowTest(*row) for row in rows]
+
+    def duration_regressions(self, driver_type: str, last_runs: int = 10, threshold: float = 1.5,
+                             min_duration: float = 1.0) -> List[DurationRegression]:
+        """
+        Passed tests of the latest run of every driver version that took threshold times longer
+        than their average in the previous last_runs runs of the same version
+        """
+        rows = self._conn.execute("""
+            WITH ranked AS (
+                SELECT results.test, results.duration, runs.driver_version,
+                       ROW_NUMBER() OVER (PARTITION BY runs.driver_version, results.test
+                                          ORDER BY runs.id DESC) AS age
+                FROM results JOIN runs ON runs.id = results.run_id
+                WHERE runs.driver_type = ? AND results.status = 'passed'
+            ),
+            latest AS (SELECT test, driver_version, duration FROM ranked WHERE age = 1),
+            baseline AS (SELECT test, driver_version, AVG(duration) AS duration FROM ranked
+                         WHERE age BETWEEN 2 AND ? GROUP BY test, driver_version)
+            SELECT latest.test, MAX(latest.duration), baseline.duration FROM latest
+            JOIN baseline ON baseline.test = latest.test AND baseline.driver_version = latest.driver_version
+            WHERE latest.duration >= ? AND latest.duration > baseline.duration * ?
+            GROUP BY latest.test ORDER BY latest.duration / baseline.duration DESC""",
+                                   (driver_type, last_runs + 1, min_duration, threshold))
+        return [DurationRegression(test, duration, baseline, duration / baseline if baseline else float("inf"))
+                for test, duration, baseline in rows]
+
+    def flaky_tests(self, driver_type: str, last_runs: int = 10) -> List[FlakyTest]:
+        """
+        Tests that both passed and failed in the last runs of the same driver version
+        """
+        rows = self._conn.execute(f"""
+            SELECT results.test, SUM(results.status = 'passed'), SUM(results.status != 'passed')
+            FROM results JOIN runs ON runs.id = results.run_id
+            WHERE results.run_id IN ({LAST_RUNS}) AND results.status != 'skipped'
+            GROUP BY results.test, runs.driver_version
+            HAVING SUM(results.status = 'passed') > 0 AND SUM(results.status != 'passed') > 0
+            ORDER BY SUM(results.status != 'passed') DESC""", (driver_type, last_runs))
+        flaky = {}
+        for test, passed, failed in rows:
+            known = flaky.get(test, FlakyTest(test, 0, 0))
+            flaky[test] = FlakyTest(test, known.passed + passed, known.failed + failed)
+        return list(flaky.values())
+
+    def report(self, driver_type: str, last_runs: int = 10, limit: int = 10) -> dict:
+        return dict(slowest_tests=self.slowest_tests(driver_type, last_runs, limit),
+                    duration_regressions=self.duration_regressions(driver_type, last_runs)[:limit],
+                    flaky_tests=self.flaky_tests(driver_type, last_runs)[:limit])
+
+
+def _print_report(history: HistoryStore, driver_type: str, last_runs: int, limit: int) -> None:
+    print(f"Slowest tests (average of the last {last_runs} runs):")
+    for test in history.slowest_tests(driver_type, last_runs, limit):
+        print(f"\t{test.avg_duration:10.2f}s (max {test.max_duration:.2f}s, {test.runs} results)  {test.test}")
+    print(f"Duration regressions (latest run vs. average of the {last_runs} previous):")
+    for test in history.duration_regressions(driver_type, last_runs)[:limit]:
+        print(f"\t{test.duration:10.2f}s vs. {test.baseline:.2f}s (x{test.ratio:.1f})  {test.test}")
+    print(f"Flaky tests (passed and failed within the last {last_runs} runs):")
+    for test in history.flaky_tests(driver_type, last_runs)[:limit]:
+        print(f"\tpassed {test.passed}, failed {test.failed}  {test.test}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show the slowest, regressed and flaky tests of the history")
+    parser.add_argument('--driver-type', help='Type of cpp-driver ("scylla", "datastax")', dest='driver_type',
+                        default='scylla')
+    parser.add_argument('--history-db', help=f"path of the history database, default={DEFAULT_DB}",
+                        default=DEFAULT_DB, dest='history_db')
+    parser.add_argument('--last-runs', help="how many runs of each version to look at", type=int, default=10,
+                        dest='last_runs')
+    parser.add_argument('--limit', help="how many tests to show in every section", type=int, default=20)
+    arguments = parser.parse_args()
+    _print_report(HistoryStore(arguments.history_db), arguments.driver_type, arguments.last_runs, arguments.limit)
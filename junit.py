@@ -0,0 +1,145 @@
+import logging
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+COUNTER_ATTRIBUTES = ("tests", "failures", "disabled", "errors", "skipped")
+
+
+class TestCase(NamedTuple):
+    name: str  # <test suite>.<test name>, the same as gtest prints, e.g. "Prefix/Suite.Test/0" for parameterized ones
+    status: str  # "passed", "failed" or "skipped"
+    duration: float  # seconds
+    message: str = ''  # the failure message
+
+
+class JunitReport(NamedTuple):
+    tests: List[TestCase]
+    total: int  # how many tests the report declares
+    time: float
+
+    @property
+    def ran(self) -> int:
+        return len(self.tests)
+
+    @property
+    def failed_tests(self) -> List[str]:
+        return [test.name for test in self.tests if test.status == "failed"]
+
+    @property
+    def passed(self) -> int:
+        return sum(1 for test in self.tests if test.status == "passed")
+
+
+def parse_junit(junit_file: Path) -> Optional[JunitReport]:
+    """
+    Parse the gtest XML report in a single pass, the parsed elements are dropped right away to keep the memory bounded.
+    Returns None when the report is missing or broken (e.g. the tests binary crashed before writing it).
+    """
+    if not junit_file.exists():
+        return None
+    tests = []
+    total = 0
+    total_time = 0.0
+    try:
+        for event, element in ElementTree.iterparse(junit_file, events=("start", "end")):
+            if event == "start":
+                if element.tag == "testsuites":
+                    total = int(element.get("tests", 0))
+                    total_time = float(element.get("time", 0) or 0)
+                continue
+            if element.tag == "testcase":
+                # Tests that were filtered out or disabled are reported with status "notrun"
+                if element.get("status", "run") == "run":
+                    tests.append(_test_case(element))
+                element.clear()
+            elif element.tag == "testsuite":
+                element.clear()
+    except ElementTree.ParseError as exc:
+        LOGGER.error("Failed to parse the JUnit file '%s': %s", junit_file, exc)
+        return None
+    return JunitReport(tests=tests, total=total, time=total_time)
+
+
+def _test_case(element: ElementTree.Element) -> TestCase:
+    failures = [child for child in element if child.tag in ("failure", "error")]
+    if failures:
+        status = "failed"
+    elif element.get("result") == "skipped" or element.find("skipped") is not None:
+        status = "skipped"
+    else:
+        status = "passed"
+    message = "\n".join(failure.get("message") or failure.text or '' for failure in failures)
+    return TestCase(name=f"{element.get('classname')}.{element.get('name')}", status=status,
+                    duration=float(element.get("time", 0) or 0), message=message)
+
+
+def _add_counters(target: ElementTree.Element, source: ElementTree.Element) -> None:
+    for attribute in COUNTER_ATTRIBUTES:
+        if attribute in source.attrib or attribute in target.attrib:
+            target.set(attribute, str(int(target.get(attribute, 0)) + int(source.get(attribute, 0))))
+
+
+def merge_junit_files(junit_files: List[Path], dest_file: Path, concurrent: bool = True) -> None:
+    """
+    Merge the gtest XML reports of the shards into a single report.
+    Test suites that were split between the shards are merged back into one suite.
+    The time of the merged report is the longest shard, since the shards ran concurrently,
+    or the sum of the reports when they ran one after another.
+    """
+    merged = ElementTree.Element("testsuites", name="AllTests", tests="0", failures="0", disabled="0", errors="0",
+                                 time="0")
+    suites = {}
+    for junit_file in junit_files:
+        try:
+            root = ElementTree.parse(junit_file).getroot()
+        except ElementTree.ParseError as exc:
+            LOGGER.error("Failed to parse the JUnit file '%s': %s", junit_file, exc)
+            continue
+        _add_counters(merged, root)
+        if concurrent:
+            merged.set("time", str(max(float(merged.get("time")), float(root.get("time", 0)))))
+        else:
+            merged.set("time", str(float(merged.get("time")) + float(root.get("time", 0))))
+        if "timestamp" in root.attrib and "timestamp" not in merged.attrib:
+            merged.set("timestamp", root.get("timestamp"))
+        for suite in root.iter("testsuite"):
+            name = suite.get("name")
+            if name not in suites:
+                suites[name] = suite
+                merged.append(suite)
+                continue
+            _add_counters(suites[name], suite)
+            suites[name].set("time", str(float(suites[name].get("time", 0)) + float(suite.get("time", 0))))
+            suites[name].extend(list(suite))
+    ElementTree.ElementTree(merged).write(dest_file, encoding="UTF-8", xml_declaration=True)
+
+
+def write_junit_file(tests: List[TestCase], junit_file: Path) -> None:
+    """
+    Write the tests in the gtest XML format, for the tests whose binary didn't get to write its report
+    (e.g. it was killed)
+    """
+    root = ElementTree.Element("testsuites", name="AllTests", tests=str(len(tests)), failures="0", disabled="0",
+                               errors="0", time=f"{sum(test.duration for test in tests):.3f}")
+    suites = {}
+    for test in tests:
+        classname, _, name = test.name.partition(".")
+        if classname not in suites:
+            suites[classname] = ElementTree.SubElement(root, "testsuite", name=classname, tests="0", failures="0",
+                                                       disabled="0", errors="0", time="0")
+        suite = suites[classname]
+        suite.set("tests", str(int(suite.get("tests")) + 1))
+        suite.set("time", f"{float(suite.get('time')) + test.duration:.3f}")
+        case = ElementTree.SubElement(suite, "testcase", name=name, status="run", result="completed",
+                                      time=f"{test.duration:.3f}", classname=classname)
+        if test.status == "failed":
+            ElementTree.SubElement(case, "failure", message=test.message, type="").text = test.message
+            for element in (suite, root):
+                element.set("failures", str(int(element.get("failures")) + 1))
+        elif test.status == "skipped":
+            case.set("result", "skipped")
+            ElementTree.SubElement(case, "skipped", message="")
+    ElementTree.ElementTree(root).write(junit_file, encoding="UTF-8", xml_declaration=True)
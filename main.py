@@ -5,41 +5,197 @@ import argparse
 import run
 import subprocess
 import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from typing import List
 
-from email_sender import send_mail, create_report, get_driver_origin_remote
+import tags
+import timing
+import subprocess_replay
+import worktree
+from builder import BuildOptions, default_jobs, DEFAULT_CACHE_DIR
+from resources import WorkerResources, plan_resources
+from hang_watchdog import DEFAULT_SUITE_TIMEOUT, DEFAULT_TEST_TIMEOUT
+from abort_policy import AbortPolicy, DEFAULT_BOOTSTRAP_FAILURES, DEFAULT_MIN_TESTS
+
+from attachments import Attachment
+from email_sender import send_mail, create_report, get_driver_origin_remote, get_scylla_build_info, get_ci_info
+from history import HistoryStore, DEFAULT_DB as DEFAULT_HISTORY_DB
+from result_cache import (ResultCache, DEFAULT_CACHE_DIR as DEFAULT_RESULT_CACHE_DIR,
+                          DEFAULT_MAX_SIZE_MB as DEFAULT_RESULT_CACHE_SIZE, result_key, scylla_build_id)
+import result_cache
 
 logging.basicConfig(level=logging.INFO)
 
+# The slot of the worker process among the concurrent ones, each slot gets its own part of the host resources
+_worker_slot = 0
+
+
+def _init_worker(slots_counter) -> None:
+    global _worker_slot
+    # The workers that aren't forked don't inherit the wrapped Popen
+    subprocess_replay.install()
+    with slots_counter.get_lock():
+        _worker_slot = slots_counter.value
+        slots_counter.value += 1
+
+
+def run_version(cpp_driver_dir: str, scylla_install_dir: str, driver_type: str, version: str, scylla_version: str,
+                cql_cassandra_version: str, worktrees_dir: str = None, worker_index: int = None, shards: int = 1,
+                build_options: BuildOptions = None, test_durations: dict = None, retries: int = 0,
+                rerun_failed: bool = False, use_snapshots: bool = True, cluster_templates: bool = False,
+                resources_plan: List[List[WorkerResources]] = None, resource_interval: float = None,
+                test_timeout: float = DEFAULT_TEST_TIMEOUT, suite_timeout: float = DEFAULT_SUITE_TIMEOUT,
+                abort_policy: AbortPolicy = None, cache: ResultCache = None, cache_key: str = None,
+                clean_worktree: bool = False):
+    """
+    Test a single driver version, returns TestResults or a dict with the exception on failure.
+    When worker_index is set the version runs in its own git worktree with its own ccm directory and node IPs.
+    With rerun_failed only the failed tests of the previous run are run again, on the existing build.
+    resources_plan has the resources of the clusters of every concurrent worker, by the worker slot.
+    resource_interval is the seconds between the samples of the resources used by the tests and the nodes.
+    test_timeout and suite_timeout are the default budgets of the hang watchdog, ignore.yaml can override them.
+    abort_policy tells when to give up on a hopeless run, e.g. the cluster doesn't start.
+    When the version passes, its results are stored in the cache by cache_key.
+    With clean_worktree the worktree of the version is removed once it finished, instead of kept for the next build.
+    """
+    logging.info(f'=== {driver_type.upper()} CPP DRIVER VERSION {version} ===')
+    run_kwargs = {}
+    worker_dir = None
+    if worker_index is not None:
+        worker_name = f"{driver_type}-{version}"
+        worker_dir = worktree.worktree_path(cpp_driver_dir, worktrees_dir, worker_name)
+        run_kwargs = dict(log_dir=os.path.join(cpp_driver_dir, 'log'),
+                          ccm_config_dir=worktree.ccm_config_dir(worker_name),
+                          ccm_host=worktree.ccm_host(worker_index))
+    test_run = run.Run(cpp_driver_git=str(worker_dir) if worker_dir else cpp_driver_dir,
+                       scylla_install_dir=scylla_install_dir,
+                       driver_type=driver_type,
+                       driver_version=version,
+                       scylla_version=scylla_version,
+                       cql_cassandra_version=cql_cassandra_version,
+                       shards=shards,
+                       build_options=build_options,
+                       test_durations=test_durations,
+                       retries=retries,
+                       use_snapshots=use_snapshots,
+                       cluster_templates=cluster_templates,
+                       resource_interval=resource_interval,
+                       test_timeout=test_timeout,
+                       suite_timeout=suite_timeout,
+                       abort_policy=abort_policy,
+                       **run_kwargs)
+    try:
+        if resources_plan:
+            # The pool has a worker per plan entry, the modulo keeps a respawned worker within the plan
+            test_run.resources = resources_plan[_worker_slot % len(resources_plan)]
+        if rerun_failed:
+            return test_run.rerun_failed()
+        if worker_dir is not None:
+            worktree.add_worktree(cpp_driver_dir, worker_dir)
+        results = test_run.run()
+        if cache is not None and cache_key and is_passed(results):
+            files = [test_run.xml_file, test_run.xml_file.with_name(test_run.metadata_file_name),
+                     test_run.xml_file.with_suffix(".resources.json")]
+            cache.store(cache_key, results, [path for path in files if path.exists()], result_cache.origin())
+        return results
+    except Exception:
+        logging.exception(f"{version} failed")
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        failure_reason = traceback.format_exception(exc_type, exc_value, exc_traceback)
+        test_run.create_metadata_for_failure(reason="\n".join(failure_reason))
+        return dict(exception=failure_reason, phases=dict(test_run.timer.phases))
+    finally:
+        if clean_worktree and worker_dir is not None:
+            try:
+                worktree.remove_worktree(cpp_driver_dir, worker_dir)
+            except (subprocess.CalledProcessError, OSError) as exc:
+                logging.warning(f"Failed to remove the worktree '{worker_dir}': {exc}")
+
 
 def main(cpp_driver_dir: str, scylla_install_dir: str, driver_type: str, versions: str, scylla_version: str,
-         summary_file: str, cql_cassandra_version: str, recipients: list):
+         summary_file: str, cql_cassandra_version: str, recipients: list, parallel_versions: int = 1,
+         worktrees_dir: str = None, shards: int = 1, build_options: BuildOptions = None,
+         history_db: str = DEFAULT_HISTORY_DB, retries: int = 0, rerun_failed: bool = False,
+         use_snapshots: bool = True, cluster_templates: bool = False, smp: int = None, node_memory_mb: int = None,
+         pin_cpus: bool = True, metrics_file: str = None, trace_file: str = None, resource_interval: float = None,
+         test_timeout: float = DEFAULT_TEST_TIMEOUT, suite_timeout: float = DEFAULT_SUITE_TIMEOUT,
+         abort_policy: AbortPolicy = None, result_cache_dir: str = DEFAULT_RESULT_CACHE_DIR,
+         result_cache_size: int = DEFAULT_RESULT_CACHE_SIZE, recipient_groups: List[list] = (),
+         clean_worktrees: bool = False):
     results = {}
     status = 0
+    timer = timing.PhaseTimer()
 
-    for version in versions:
-        logging.info(f'=== {driver_type.upper()} CPP DRIVER VERSION {version} ===')
-        test_run = run.Run(cpp_driver_git=cpp_driver_dir,
-                            scylla_install_dir=scylla_install_dir,
-                            driver_type=driver_type,
-                            driver_version=version,
-                            scylla_version=scylla_version,
-                            cql_cassandra_version=cql_cassandra_version)
-        try:
-            results[version] = test_run.run()
-        except Exception:
-            logging.exception(f"{version} failed")
+    cache = ResultCache(result_cache_dir, result_cache_size) if result_cache_dir and not rerun_failed else None
+    cache_keys = {}
+    if cache is not None:
+        scylla_build = scylla_build_id(get_scylla_build_info(), scylla_version)
+        for version in versions:
+            cache_keys[version] = result_key(cpp_driver_dir, driver_type, version, scylla_build, cql_cassandra_version)
+            cached = cache.restore(cache_keys[version], Path(cpp_driver_dir) / 'log') if cache_keys[version] else None
+            if cached is not None:
+                results[version] = cached
+    all_versions = versions
+    versions = [version for version in versions if version not in results]
+
+    build_options = build_options or BuildOptions()
+    if not build_options.jobs:
+        # The versions are compiled concurrently, so they share the cpus
+        build_options = build_options._replace(jobs=default_jobs(min(parallel_versions, len(versions))))
+    concurrent_versions = min(parallel_versions, len(versions))
+    plan = plan_resources(concurrent_versions * shards, smp=smp, memory_mb=node_memory_mb, pin_cpus=pin_cpus)
+    resources_plan = [plan[index * shards:(index + 1) * shards] for index in range(concurrent_versions)]
+    run_kwargs = dict(resources_plan=resources_plan, cpp_driver_dir=cpp_driver_dir,
+                      scylla_install_dir=scylla_install_dir, driver_type=driver_type, scylla_version=scylla_version,
+                      cql_cassandra_version=cql_cassandra_version, shards=shards,
+                      build_options=build_options, retries=retries, rerun_failed=rerun_failed,
+                      use_snapshots=use_snapshots, cluster_templates=cluster_templates,
+                      resource_interval=resource_interval, test_timeout=test_timeout,
+                      suite_timeout=suite_timeout, abort_policy=abort_policy)
+    history = HistoryStore(history_db) if history_db else None
+    durations = {version: history.durations(driver_type, version) if history and shards > 1 else None
+                 for version in versions}
+    if parallel_versions > 1 and len(versions) > 1:
+        logging.info(f'Running {len(versions)} versions with up to {concurrent_versions} in parallel')
+        with ProcessPoolExecutor(max_workers=concurrent_versions, initializer=_init_worker,
+                                 initargs=(multiprocessing.Value('i', 0),)) as executor:
+            futures = {version: executor.submit(run_version, version=version, worktrees_dir=worktrees_dir,
+                                                clean_worktree=clean_worktrees,
+                                                worker_index=index, test_durations=durations[version],
+                                                cache=cache, cache_key=cache_keys.get(version), **run_kwargs)
+                       for index, version in enumerate(versions)}
+            for version, future in futures.items():
+                try:
+                    results[version] = future.result()
+                except Exception:
+                    # The worker process itself died, e.g. it was killed by OOM
+                    logging.exception(f"{version} failed")
+                    results[version] = dict(exception=traceback.format_exc().splitlines(keepends=True))
+    else:
+        for version in versions:
+            results[version] = run_version(version=version, test_durations=durations[version], cache=cache,
+                                           cache_key=cache_keys.get(version), **run_kwargs)
+    results = {version: results[version] for version in all_versions}
+
+    for result in results.values():
+        if isinstance(result, dict):
             status = 1
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            failure_reason = traceback.format_exception(exc_type, exc_value, exc_traceback)
-            results[version] = dict(exception=failure_reason)
-            test_run.create_metadata_for_failure(reason="\n".join(failure_reason))
 
     logging.info(f'=== {driver_type.upper()} CPP DRIVER MATRIX RESULTS ===')
     for version, result in results.items():
         if isinstance(result, dict):
             continue
         failed_tests = "Failed tests:\n\t%s\n" % '\n\t'.join(result.failed_tests) if result.failed else ''
+        if result.cached_from:
+            failed_tests += "Cached: the results of %s\n" % result.cached_from
+        if result.aborted:
+            failed_tests += "Aborted: %s\n" % result.aborted
+        if result.timed_out:
+            failed_tests += "Timed out:\n\t%s\n" % '\n\t'.join(result.timed_out)
+        if result.passed_on_retry:
+            failed_tests += "Passed on retry:\n\t%s\n" % '\n\t'.join(result.passed_on_retry)
         summary = '\nRunning tests: %d\nRan tests: %d\nPassed: %d\nFailed: %d\n%s' \
                   'Returned code: %d\n\n' % (result.running_tests, result.ran_tests, result.passed, result.failed,
                                              failed_tests, result.returncode)
@@ -48,19 +204,79 @@ def main(cpp_driver_dir: str, scylla_install_dir: str, driver_type: str, version
         if summary_file:
             write_summary_to_file(summary_file=summary_file, title=f"{driver_type.upper()} CPP DRIVER VERSION {version}",
                                   summary=summary)
-        if result.failed > 0 or result.returncode > 0 or result.ran_tests == 0 \
-                or result.failed + result.passed != result.ran_tests:
+        if not is_passed(result):
             status = 1
 
-    if recipients:
-        email_report = create_report(results=results)
+    history_report = {}
+    if history:
+        with timer.phase("history"):
+            record_history(history, driver_type=driver_type, scylla_version=scylla_version, results=results)
+            history_report = history.report(driver_type)
+        history.close()
+
+    if recipients or recipient_groups:
+        email_report = create_report(results=results, history=history_report)
         email_report['driver_remote'] = get_driver_origin_remote(cpp_driver_dir)
         email_report['status'] = "SUCCESS" if status == 0 else "FAILED"
-        send_mail(recipients, email_report)
+        with timer.phase("send_mail"):
+            send_mail(recipients, email_report,
+                      attachments=failure_attachments(results, log_dir=Path(cpp_driver_dir) / 'log',
+                                                      driver_type=driver_type),
+                      recipient_groups=recipient_groups)
 
+    write_phase_metrics(results, timer, driver_type=driver_type, metrics_file=metrics_file, trace_file=trace_file)
     quit(status)
 
 
+def write_phase_metrics(results: dict, timer: timing.PhaseTimer, driver_type: str, metrics_file: str = None,
+                        trace_file: str = None) -> None:
+    """
+    The durations of the phases of every version, and of the phases of the whole matrix (e.g. send_mail)
+    """
+    samples = []
+    for version, result in results.items():
+        phases = result.get("phases") if isinstance(result, dict) else result.phases
+        if phases:
+            samples.append((dict(driver_type=driver_type, driver_version=version), phases))
+    samples.append((dict(driver_type=driver_type, driver_version="all"), timer.phases))
+    for labels, phases in samples:
+        logging.info("Phases of %s: %s", labels["driver_version"],
+                     ", ".join(f"{phase}={seconds:.1f}s" for phase, seconds in phases.items()))
+    if metrics_file:
+        timing.write_prometheus(metrics_file, samples)
+    if trace_file:
+        timing.append_trace(trace_file, samples)
+
+
+def is_passed(result) -> bool:
+    return not (result.failed > 0 or result.returncode > 0 or result.ran_tests == 0
+                or result.failed + result.passed != result.ran_tests or result.running_tests != result.ran_tests)
+
+
+def failure_attachments(results: dict, log_dir: Path, driver_type: str) -> List[Attachment]:
+    """
+    The JUnit XML and the tests output of the versions that failed, with their failed tests to trim them to
+    """
+    attachments = []
+    for version, result in results.items():
+        failed_tests = () if isinstance(result, dict) else tuple(result.failed_tests)
+        if not isinstance(result, dict) and is_passed(result):
+            continue
+        attachments.append(Attachment(log_dir / f"TEST-{driver_type}-{version}.xml", failed_tests))
+        attachments.append(Attachment(log_dir / f"{driver_type}-{version}.stdout.log.gz", failed_tests))
+    return attachments
+
+
+def record_history(history: HistoryStore, driver_type: str, scylla_version: str, results: dict) -> None:
+    build_info = get_scylla_build_info()
+    if build_info:
+        scylla_build = f"{build_info.get('scylla-version')}-{build_info.get('scylla-release')}"
+    else:
+        scylla_build = scylla_version or "N/A"
+    history.record_results(driver_type=driver_type, scylla_build=scylla_build, build_id=get_ci_info()["build_id"],
+                           results=results)
+
+
 # Save summary of all test results in the one file
 def write_summary_to_file(summary_file, title, summary):
     with open(summary_file, 'a') as f:
@@ -69,27 +285,29 @@ def write_summary_to_file(summary_file, title, summary):
 
 
 def extract_n_latest_repo_tags(repo_directory: str, major_versions: List[str], latest_tags_size: int = 2,
-                               is_scylla_driver: bool = True) -> List[str]:
+                               is_scylla_driver: bool = True, mirrors_dir: str = tags.DEFAULT_MIRRORS_DIR,
+                               tags_ttl: int = tags.DEFAULT_TTL) -> List[str]:
     major_versions = sorted(major_versions, key=lambda major_ver: float(major_ver))
-    filter_version = f"| grep {'' if is_scylla_driver else '-v '} '\\-1'"
-    commands = [f"cd {repo_directory}", "git checkout .", ]
-    if not os.environ.get("DEV_MODE", False):
-        commands.append("git fetch -p --all")
-    commands.append(f"git tag --sort=-creatordate {filter_version} | grep -E '^[0-9]*\.[0-9]*\.[0-9]*(-1)?$'")
+    subprocess.call(["git", "checkout", "."], cwd=repo_directory)
+    if os.environ.get("DEV_MODE", False):
+        repo_tags = tags.local_tags(repo_directory)
+    else:
+        repo_tags = tags.TagIndex(repo_directory, mirrors_dir=mirrors_dir, ttl=tags_ttl).tags()
 
     selected_tags = {}
     ignore_tags = set()
     result = []
-    lines = subprocess.check_output("\n".join(commands), shell=True).decode().splitlines()
-    for repo_tag in lines:
-        if "." in repo_tag:
-            version = tuple(repo_tag.split(".", maxsplit=2)[:2])
-            if version not in ignore_tags:
-                ignore_tags.add(version)
-                selected_tags.setdefault(repo_tag[0], []).append(repo_tag)
+    for repo_tag in repo_tags:
+        # The scylla driver releases are tagged with the "-1" suffix, the datastax ones without it
+        if repo_tag.endswith("-1") != is_scylla_driver:
+            continue
+        version = tuple(repo_tag.split(".", maxsplit=2)[:2])
+        if version not in ignore_tags:
+            ignore_tags.add(version)
+            selected_tags.setdefault(version[0], []).append(repo_tag)
 
     for major_version in major_versions:
-        if len(selected_tags[major_version]) < latest_tags_size:
+        if len(selected_tags.get(major_version, [])) < latest_tags_size:
             raise ValueError(f"There are no '{latest_tags_size}' different versions that start with the major version"
                              f" '{major_version}'")
         result.extend(selected_tags[major_version][:latest_tags_size])
@@ -118,16 +336,114 @@ if __name__ == '__main__':
                                                'For example, the user selects the 2 latest versions for version 4.'
                                                'The values to be returned are: 4.9.0-1 and 4.8.0-1',
                         type=int, default=None, nargs='?')
+    parser.add_argument('--tags-ttl', help="seconds the fetched tags of the driver repository are reused for, "
+                                           "the jobs starting within it share a single fetch",
+                        type=int, default=tags.DEFAULT_TTL, dest='tags_ttl')
     parser.add_argument('--recipients', help="whom to send mail at the end of the run",  nargs='+', default=None)
+    parser.add_argument('--recipients-group', help="another group of recipients that gets its own email, "
+                                                   "sent over the same SMTP session, can be repeated",
+                        nargs='+', action='append', default=[], dest='recipient_groups')
+    parser.add_argument('--parallel-versions', help="how many versions to test concurrently, each one in its own "
+                                                    "git worktree, build directory and ccm cluster",
+                        type=int, default=1, dest='parallel_versions')
+    parser.add_argument('--worktrees-dir', help="folder for the per version git worktrees, "
+                                                "default=<cpp_driver_dir>/.matrix-worktrees",
+                        default=None, dest='worktrees_dir')
+    parser.add_argument('--clean-worktrees', help="remove the worktree of every version once it finished, "
+                                                  "by default they are kept to build the next runs incrementally",
+                        action='store_true', dest='clean_worktrees')
+    parser.add_argument('--shards', help="split the tests of each version between N concurrent test processes, "
+                                         "each one with its own ccm cluster",
+                        type=int, default=1)
+    parser.add_argument('--build-jobs', help="parallel compilation jobs, default=number of cpus / parallel versions",
+                        type=int, default=None, dest='build_jobs')
+    parser.add_argument('--ninja', help="use the Ninja generator instead of make", action='store_true')
+    parser.add_argument('--no-ccache', help="don't use ccache even if it is installed",
+                        action='store_false', dest='ccache')
+    parser.add_argument('--no-build-cache', help="always compile, don't restore the identical build from the cache",
+                        action='store_false', dest='build_cache')
+    parser.add_argument('--build-cache-dir', help=f"folder of the build cache, default={DEFAULT_CACHE_DIR}",
+                        default=DEFAULT_CACHE_DIR, dest='build_cache_dir')
+    parser.add_argument('--retries', help="how many times to run the failed tests again, the tests that pass are "
+                                          "reported as passed on retry",
+                        type=int, default=0)
+    parser.add_argument('--rerun-failed', help="don't run the whole suite, run again only the failed tests of the "
+                                               "previous run, reusing its build directory",
+                        action='store_true', dest='rerun_failed')
+    parser.add_argument('--no-snapshots', help="always check out the tag and apply the patch, don't switch to the "
+                                               "patched snapshot saved by the previous runs",
+                        action='store_false', dest='use_snapshots')
+    parser.add_argument('--cluster-templates', help="restore the ccm clusters of the tests from the templates of the "
+                                                    "initialized clusters, saved the first time each one is created",
+                        action='store_true', dest='cluster_templates')
+    parser.add_argument('--smp', help="cpus of every scylla node, default=sized by the host cpus and the "
+                                      "number of clusters running at the same time",
+                        type=int, default=None)
+    parser.add_argument('--node-memory', help="memory of every scylla node in MB, default=sized by the host memory "
+                                              "and the number of clusters running at the same time",
+                        type=int, default=None, dest='node_memory')
+    parser.add_argument('--no-cpu-pinning', help="don't pin the clusters running at the same time to separate cpus",
+                        action='store_false', dest='pin_cpus')
+    parser.add_argument('--sample-resources', help="every N seconds sample the cpu, memory, open files and disk io of "
+                                                   "the tests binary and the scylla nodes, the samples are saved next "
+                                                   "to the JUnit XML as <xml name>.resources.json",
+                        type=float, default=None, metavar='N', dest='resource_interval')
+    parser.add_argument('--test-timeout', help="seconds a single test may run before it's killed as hung and the "
+                                               "rest of the tests are resumed, 0 for no limit, the \"timeouts\" "
+                                               f"section of ignore.yaml overrides it, default={DEFAULT_TEST_TIMEOUT}",
+                        type=float, default=DEFAULT_TEST_TIMEOUT, dest='test_timeout')
+    parser.add_argument('--suite-timeout', help="seconds all the tests of a suite may run before the suite is killed "
+                                                "as hung, 0 for no limit",
+                        type=float, default=DEFAULT_SUITE_TIMEOUT or 0, dest='suite_timeout')
+    parser.add_argument('--abort-on-bootstrap', help="abort the version when the cluster failed to start in N tests "
+                                                     "in a row, 0 to never (the default)",
+                        type=int, default=DEFAULT_BOOTSTRAP_FAILURES, metavar='N', dest='abort_bootstrap')
+    parser.add_argument('--abort-consecutive', help="abort the version when K tests in a row failed with the same "
+                                                    "error, 0 to never (the default)",
+                        type=int, default=0, metavar='K', dest='abort_consecutive')
+    parser.add_argument('--abort-failure-ratio', help="abort the version when more than this part (e.g. 0.5) of "
+                                                      "the tests failed, once --abort-min-tests tests finished, "
+                                                      "0 to never (the default)",
+                        type=float, default=0.0, metavar='RATIO', dest='abort_failure_ratio')
+    parser.add_argument('--abort-min-tests', help="how many tests have to finish before the failure ratio is "
+                                                  f"checked, default={DEFAULT_MIN_TESTS}",
+                        type=int, default=DEFAULT_MIN_TESTS, metavar='N', dest='abort_min_tests')
+    parser.add_argument('--result-cache-dir', help="folder of the results of the versions that passed, a version "
+                                                   "with the same driver commit, patches, ignore.yaml, scylla build "
+                                                   "and CQL version isn't run again, "
+                                                   f"default={DEFAULT_RESULT_CACHE_DIR}",
+                        default=DEFAULT_RESULT_CACHE_DIR, dest='result_cache_dir')
+    parser.add_argument('--no-cache', help="always run the tests, don't restore nor store the results in the cache",
+                        action='store_const', const=None, dest='result_cache_dir')
+    parser.add_argument('--result-cache-size', help="size of the results cache in MB, the least recently used "
+                                                    "results are evicted above it, "
+                                                    f"default={DEFAULT_RESULT_CACHE_SIZE}",
+                        type=int, default=DEFAULT_RESULT_CACHE_SIZE, dest='result_cache_size')
+    parser.add_argument('--history-db', help="sqlite file keeping the duration and outcome of every test, "
+                                             f"default={DEFAULT_HISTORY_DB}",
+                        default=DEFAULT_HISTORY_DB, dest='history_db')
+    parser.add_argument('--no-history', help="don't record the results in the history",
+                        action='store_const', const=None, dest='history_db')
+    parser.add_argument('--metrics-file', help="write the durations of the phases of every version (checkout, patch, "
+                                               "compile, tests etc.) in the Prometheus textfile format, e.g. into "
+                                               "the node_exporter textfile collector directory",
+                        default=None, dest='metrics_file')
+    parser.add_argument('--trace-file', help="append the durations of the phases as JSON lines",
+                        default=None, dest='trace_file')
 
     arguments = parser.parse_args()
+    subprocess_replay.install()
+    # The fixtures of SUBPROCESS_RECORD keep these as placeholders, to be replayed with other directories
+    subprocess_replay.set_roots(cpp_driver_dir=arguments.cpp_driver_dir,
+                                scylla_install_dir=arguments.scylla_install_dir, worktrees_dir=arguments.worktrees_dir)
     if not isinstance(arguments.versions, list):
         versions = arguments.versions.split(',')
 
     if arguments.version_size:
         versions = extract_n_latest_repo_tags(arguments.cpp_driver_dir, list({v.split('.')[0] for v in versions}),
                                               latest_tags_size=arguments.version_size,
-                                              is_scylla_driver=arguments.driver_type == "scylla")
+                                              is_scylla_driver=arguments.driver_type == "scylla",
+                                              tags_ttl=arguments.tags_ttl)
     main(cpp_driver_dir=arguments.cpp_driver_dir,
          scylla_install_dir=arguments.scylla_install_dir,
          driver_type=arguments.driver_type,
@@ -135,4 +451,29 @@ if __name__ == '__main__':
          scylla_version=arguments.scylla_version,
          summary_file=arguments.summary_file,
          cql_cassandra_version=arguments.cql_cassandra_version,
-         recipients=arguments.recipients)
+         recipients=arguments.recipients,
+         parallel_versions=arguments.parallel_versions,
+         worktrees_dir=arguments.worktrees_dir,
+         clean_worktrees=arguments.clean_worktrees,
+         shards=arguments.shards,
+         build_options=BuildOptions(jobs=arguments.build_jobs, ninja=arguments.ninja, ccache=arguments.ccache,
+                                    cache=arguments.build_cache, cache_dir=arguments.build_cache_dir),
+         history_db=arguments.history_db,
+         retries=arguments.retries,
+         rerun_failed=arguments.rerun_failed,
+         use_snapshots=arguments.use_snapshots,
+         cluster_templates=arguments.cluster_templates,
+         smp=arguments.smp,
+         node_memory_mb=arguments.node_memory,
+         pin_cpus=arguments.pin_cpus,
+         metrics_file=arguments.metrics_file,
+         trace_file=arguments.trace_file,
+         resource_interval=arguments.resource_interval,
+         test_timeout=arguments.test_timeout,
+         suite_timeout=arguments.suite_timeout,
+         abort_policy=AbortPolicy(consecutive=arguments.abort_consecutive,
+                                  failure_ratio=arguments.abort_failure_ratio,
+                                  min_tests=arguments.abort_min_tests, bootstrap=arguments.abort_bootstrap),
+         result_cache_dir=arguments.result_cache_dir,
+         result_cache_size=arguments.result_cache_size,
+         recipient_groups=arguments.recipient_groups)
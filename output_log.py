@@ -0,0 +1,134 @@
+"""
+Compressed per-test logs of the tests output.
+
+The output of the tests binary (with --verbose=ccm it's big) is written as a gzip file made of independent members,
+one per test and one per gap between the tests, with an index of the offset and length of every member. A multi
+member gzip is still a regular gzip file (zcat, zless), and the log of a single test is read by decompressing only
+its members:
+
+    python3 output_log.py log/scylla-2.16.2-1.stdout.log.gz --test BasicsTests.Integration_Cassandra_Basics
+    python3 output_log.py log/scylla-2.16.2-1.stdout.log.gz --list
+"""
+import sys
+import json
+import zlib
+import argparse
+from pathlib import Path
+from typing import List, Optional
+
+from gtest_stream import TestEvent
+
+GZIP_WBITS = 31  # zlib with the gzip header and trailer
+COMPRESS_LEVEL = 6
+
+
+def index_path(log_file: Path) -> Path:
+    # log/scylla-2.16.2-1.stdout.log.gz -> log/scylla-2.16.2-1.stdout.log.idx
+    return log_file.with_suffix(".idx")
+
+
+class OutputLogWriter:
+    """
+    Writes the lines of the output, each test to its own gzip member. The index has a JSON line per member
+    (appended when the member is complete, so it's usable even if the run is killed).
+    """
+
+    def __init__(self, log_file: Path):
+        self._log = open(log_file, "wb")
+        self._index = open(index_path(log_file), "w")
+        self._compressor = None
+        self._test = None
+        self._offset = 0
+        self._lines = 0
+        self._size = 0
+
+    def write(self, line: str, event: Optional[TestEvent] = None) -> None:
+        """
+        Write a line, the event is what the line meant to the GtestEventParser, if anything
+        """
+        if event is not None and event.status == "running":
+            self._start(event.name)
+        elif self._compressor is None:
+            self._start(self._test)
+        data = line.encode(errors="replace")
+        self._log.write(self._compressor.compress(data))
+        self._lines += 1
+        self._size += len(data)
+        if event is not None and event.status != "running":
+            # Whatever comes until the next test (e.g. the teardown of the cluster) is between the tests
+            self.end_test()
+
+    def end_test(self) -> None:
+        """
+        The output of the running test is over without its result, e.g. its process was killed
+        """
+        self._finish()
+        self._test = None
+
+    def _start(self, test: Optional[str]) -> None:
+        self._finish()
+        self._compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+        self._test = test
+        self._offset = self._log.tell()
+        self._lines = self._size = 0
+
+    def _finish(self) -> None:
+        if self._compressor is None:
+            return
+        self._log.write(self._compressor.flush())
+        self._log.flush()
+        self._compressor = None
+        self._index.write(json.dumps(dict(test=self._test, offset=self._offset,
+                                          length=self._log.tell() - self._offset, lines=self._lines,
+                                          size=self._size)) + "\n")
+        self._index.flush()
+
+    def close(self) -> None:
+        self._finish()
+        self._log.close()
+        self._index.close()
+
+    def __enter__(self) -> "OutputLogWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_index(log_file: Path) -> List[dict]:
+    with open(index_path(log_file)) as index:
+        return [json.loads(line) for line in index if line.strip()]
+
+
+def read_test_log(log_file: Path, test: str) -> str:
+    """
+    The output of a single test, only its gzip members are read and decompressed.
+    A truncated member (e.g. the file was cut) is read as far as it goes
+    """
+    output = []
+    with open(log_file, "rb") as log:
+        for member in read_index(log_file):
+            if member["test"] != test:
+                continue
+            log.seek(member["offset"])
+            data = zlib.decompressobj(GZIP_WBITS).decompress(log.read(member["length"]))
+            output.append(data.decode(errors="replace"))
+    return "".join(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print the output of a single test from the compressed tests log")
+    parser.add_argument('log_file', help="the compressed log, e.g. log/scylla-2.16.2-1.stdout.log.gz", type=Path)
+    parser.add_argument('--test', help="full name of the test, e.g. BasicsTests.Integration_Cassandra_Basics")
+    parser.add_argument('--list', help="list the tests in the log with the size of their output",
+                        action='store_true')
+    arguments = parser.parse_args()
+    if arguments.list or not arguments.test:
+        for member in read_index(arguments.log_file):
+            if member["test"]:
+                print(f"{member['test']}\t{member['lines']} lines\t{member['size']} bytes")
+        sys.exit(0)
+    test_log = read_test_log(arguments.log_file, arguments.test)
+    if not test_log:
+        sys.exit(f"No output of '{arguments.test}' in '{arguments.log_file}'")
+    sys.stdout.write(test_log)
@@ -0,0 +1,187 @@
+"""
+Sampling of the resources used by the tests binary and the scylla nodes while the tests run.
+
+The tests binary is sampled with its whole process tree. The scylla nodes are started by ccm and outlive it, so they
+are reparented and aren't in that tree, they are found by the ccm directory in their command line instead.
+The samples are kept as a compact table, written as JSON next to the JUnit XML with the percentiles of every metric
+and its peaks, each one with the test that was running at the time.
+"""
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+PROC = Path("/proc")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+GROUPS = ("binary", "scylla")
+METRICS = ("cpu", "rss_mb", "fds", "read_kbps", "write_kbps")
+COLUMNS = ("time", "test", *(f"{group}_{metric}" for group in GROUPS for metric in METRICS))
+PERCENTILES = (50, 90, 99)
+PEAKS = 5
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text()
+    except OSError:
+        # The process is gone or isn't ours
+        return None
+
+
+def _processes() -> Dict[int, dict]:
+    processes = {}
+    for proc_dir in PROC.iterdir():
+        if not proc_dir.name.isdigit():
+            continue
+        stat = _read(proc_dir / "stat")
+        if not stat:
+            continue
+        # The command name is in parentheses and can have spaces, the fields after it are fixed
+        fields = stat[stat.rfind(")") + 2:].split()
+        processes[int(proc_dir.name)] = dict(ppid=int(fields[1]), ticks=int(fields[11]) + int(fields[12]))
+    return processes
+
+
+def _tree(processes: Dict[int, dict], root_pid: int) -> List[int]:
+    children = {}
+    for pid, process in processes.items():
+        children.setdefault(process["ppid"], []).append(pid)
+    tree = [root_pid] if root_pid in processes else []
+    for pid in tree:
+        tree.extend(children.get(pid, []))
+    return tree
+
+
+def _rss_mb(pid: int) -> float:
+    statm = _read(PROC / str(pid) / "statm")
+    return int(statm.split()[1]) * PAGE_SIZE / 1024 / 1024 if statm else 0.0
+
+
+def _fds(pid: int) -> int:
+    try:
+        return len(os.listdir(PROC / str(pid) / "fd"))
+    except OSError:
+        return 0
+
+
+def _io_bytes(pid: int) -> tuple:
+    read_bytes = write_bytes = 0
+    for line in (_read(PROC / str(pid) / "io") or "").splitlines():
+        name, _, value = line.partition(":")
+        if name == "read_bytes":
+            read_bytes = int(value)
+        elif name == "write_bytes":
+            write_bytes = int(value)
+    return read_bytes, write_bytes
+
+
+def percentile(values: List[float], percent: int) -> float:
+    """
+    The nearest-rank percentile
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))]
+
+
+class ResourceSampler:
+    """
+    Samples the tests binary (root_pid and its descendants) and the scylla nodes of the ccm directory.
+    sample() is called periodically by whoever waits for the process, e.g. OutputPump.run(on_idle=...).
+    """
+
+    def __init__(self, root_pid: int, ccm_config_dir: str = None):
+        # Can change during the run, when a hung tests binary is killed and started again
+        self.root_pid = root_pid
+        ccm_dir = os.path.realpath(ccm_config_dir or os.path.join(os.path.expanduser("~"), ".ccm"))
+        # With the separator, so the nodes of ~/.ccm/shard-10 aren't taken for the nodes of ~/.ccm/shard-1
+        self._ccm_dir = os.path.join(ccm_dir, "")
+        self._started = time.monotonic()
+        self._previous_time = None
+        self._previous = {}  # pid -> (ticks, read_bytes, write_bytes)
+        self._scylla_pids = {}  # pid -> whether it belongs to the ccm directory, the command line doesn't change
+        self.tests: List[str] = []
+        self._test_indexes: Dict[str, int] = {}
+        self.samples: List[list] = []
+
+    def _is_scylla(self, pid: int) -> bool:
+        if pid not in self._scylla_pids:
+            cmdline = (_read(PROC / str(pid) / "cmdline") or "").replace("\0", " ")
+            self._scylla_pids[pid] = "scylla" in cmdline and self._ccm_dir in cmdline
+        return self._scylla_pids[pid]
+
+    def sample(self, current_test: Optional[str] = None) -> None:
+        now = time.monotonic()
+        processes = _processes()
+        binary_pids = set(_tree(processes, self.root_pid))
+        groups = {"binary": binary_pids,
+                  "scylla": {pid for pid in processes if pid not in binary_pids and self._is_scylla(pid)}}
+        elapsed = now - self._previous_time if self._previous_time else None
+        current = {}
+        row = [round(now - self._started, 1), self._test_index(current_test)]
+        for group in GROUPS:
+            cpu = rss_mb = fds = read_bytes = write_bytes = 0
+            for pid in groups[group]:
+                ticks = processes[pid]["ticks"]
+                io = _io_bytes(pid)
+                current[pid] = (ticks, *io)
+                # The first time a process is seen there's nothing to compare with
+                previous = self._previous.get(pid, current[pid])
+                cpu += ticks - previous[0]
+                read_bytes += io[0] - previous[1]
+                write_bytes += io[1] - previous[2]
+                rss_mb += _rss_mb(pid)
+                fds += _fds(pid)
+            if elapsed:
+                row += [round(cpu / CLOCK_TICKS / elapsed * 100, 1), round(rss_mb, 1), fds,
+                        round(read_bytes / 1024 / elapsed, 1), round(write_bytes / 1024 / elapsed, 1)]
+            else:
+                row += [0.0, round(rss_mb, 1), fds, 0.0, 0.0]
+        self._previous = current
+        self._previous_time = now
+        # Drop the processes that are gone, the pids can be reused
+        self._scylla_pids = {pid: is_scylla for pid, is_scylla in self._scylla_pids.items() if pid in processes}
+        self.samples.append(row)
+
+    def _test_index(self, test: Optional[str]) -> Optional[int]:
+        # The samples refer to the tests by their index, so the name is kept once
+        if test is None:
+            return None
+        if test not in self._test_indexes:
+            self._test_indexes[test] = len(self.tests)
+            self.tests.append(test)
+        return self._test_indexes[test]
+
+    def summary(self) -> dict:
+        """
+        The percentiles and the maximum of every metric, and its highest samples with the tests that were running
+        """
+        summary = {}
+        for column_index, column in enumerate(COLUMNS[2:], start=2):
+            values = [row[column_index] for row in self.samples]
+            peaks = sorted(self.samples, key=lambda row: row[column_index], reverse=True)[:PEAKS]
+            summary[column] = dict(
+                **{f"p{percent}": percentile(values, percent) for percent in PERCENTILES},
+                max=max(values, default=0.0),
+                peaks=[dict(time=row[0], value=row[column_index],
+                            test=self.tests[row[1]] if row[1] is not None else None)
+                       for row in peaks if row[column_index] > 0])
+        return summary
+
+    def write(self, resources_file: Path, interval: float) -> None:
+        summary = self.summary()
+        resources_file.write_text(json.dumps(dict(interval=interval, columns=COLUMNS, tests=self.tests,
+                                                  samples=self.samples, summary=summary),
+                                             separators=(",", ":")))
+        LOGGER.info("Resources of the tests binary and scylla nodes (p90/max), cpu%%: %s/%s and %s/%s, "
+                    "rss MB: %s/%s and %s/%s, saved to '%s'",
+                    summary["binary_cpu"]["p90"], summary["binary_cpu"]["max"],
+                    summary["scylla_cpu"]["p90"], summary["scylla_cpu"]["max"],
+                    summary["binary_rss_mb"]["p90"], summary["binary_rss_mb"]["max"],
+                    summary["scylla_rss_mb"]["p90"], summary["scylla_rss_mb"]["max"], resources_file)
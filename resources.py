@@ -0,0 +1,87 @@
+import os
+import logging
+from typing import List, NamedTuple, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+NODES_PER_CLUSTER = 3  # the largest topology the tests start
+MIN_NODE_MEMORY_MB = 512
+HOST_MEMORY_RESERVE = 0.2  # for the tests binaries, ccm, the build etc.
+
+
+class WorkerResources(NamedTuple):
+    """
+    What the scylla nodes of a single cluster (a test process) are allowed to use
+    """
+    smp: int  # per node
+    memory_mb: int  # per node
+    cpuset: Optional[str]  # cpus of all the nodes of the cluster, e.g. "0-7", None to not pin
+
+    def scylla_options(self) -> str:
+        options = [f"--memory {self.memory_mb}M"]
+        if self.cpuset:
+            # The nodes of the cluster share the cpus
+            options += [f"--cpuset {self.cpuset}", "--overprovisioned"]
+        return " ".join(options)
+
+
+def host_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def host_memory_mb() -> int:
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return 4096
+
+
+def _cpuset(cpus: List[int]) -> str:
+    # [0, 1, 2, 5, 6] -> "0-2,5-6"
+    ranges = []
+    for cpu in cpus:
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{first}-{last}" if first != last else str(first) for first, last in ranges)
+
+
+def plan_resources(workers: int, smp: int = None, memory_mb: int = None, pin_cpus: bool = True,
+                   cpus: List[int] = None, total_memory_mb: int = None) -> List[WorkerResources]:
+    """
+    Split the host between the clusters that run at the same time, so they don't overcommit it.
+    Every worker gets its own cpus, its nodes get an equal part of them and of the memory.
+    smp and memory_mb override the computed values.
+    """
+    cpus = cpus or host_cpus()
+    total_memory_mb = total_memory_mb or host_memory_mb()
+    workers = max(1, workers)
+    cpus_per_worker = max(1, len(cpus) // workers)
+    if smp is None:
+        smp = max(1, min(2, cpus_per_worker // NODES_PER_CLUSTER))
+    if memory_mb is None:
+        memory_mb = int(total_memory_mb * (1 - HOST_MEMORY_RESERVE)) // (workers * NODES_PER_CLUSTER)
+        memory_mb = max(MIN_NODE_MEMORY_MB, memory_mb)
+    if workers * NODES_PER_CLUSTER * memory_mb > total_memory_mb:
+        LOGGER.warning("%d clusters of %d nodes with %dM each overcommit the host memory of %dM", workers,
+                       NODES_PER_CLUSTER, memory_mb, total_memory_mb)
+    # Pinning makes sense only when there are a few workers and every one of them gets its own cpus
+    pin_cpus = pin_cpus and 1 < workers <= len(cpus)
+    if pin_cpus and smp > cpus_per_worker:
+        LOGGER.warning("smp=%d is more than the %d cpus of every cluster, the cpus are not pinned", smp,
+                       cpus_per_worker)
+        pin_cpus = False
+    plan = []
+    for index in range(workers):
+        cpuset = _cpuset(cpus[index * cpus_per_worker:(index + 1) * cpus_per_worker]) if pin_cpus else None
+        plan.append(WorkerResources(smp=smp, memory_mb=memory_mb, cpuset=cpuset))
+    LOGGER.info("Resources of each of the %d clusters: smp=%d, memory=%dM per node, cpus: %s", workers, smp,
+                memory_mb, ", ".join(worker.cpuset or "any" for worker in plan))
+    return plan
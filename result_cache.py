@@ -0,0 +1,138 @@
+"""
+Cache of the results of the matrix cells.
+
+Retriggered and duplicate CI jobs often test the very same combination again. The results are keyed by everything
+that decides them: the driver commit, the patch files, the ignore.yaml, the scylla build and the CQL version. On a hit
+the stored TestResults, JUnit XML and metadata are restored instead of checking out, compiling and running the tests.
+Only the runs that passed are stored, so a retriggered job still runs the versions that failed.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+from builder import files_hash
+from junit import TestCase
+from run import Run, TestResults
+
+LOGGER = logging.getLogger(__name__)
+
+# ~/.local is kept between the runs of the docker container (see scripts/run_test.sh)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "cpp-driver-matrix", "results")
+DEFAULT_MAX_SIZE_MB = 200
+RESULTS_FILE = "results.json"
+
+
+def scylla_build_id(build_info: Optional[dict], scylla_version: Optional[str]) -> Optional[str]:
+    """
+    The exact scylla build, None when it can't be told (e.g. a local install dir or the "latest" build)
+    """
+    if build_info:
+        return json.dumps(build_info, sort_keys=True)
+    if scylla_version and "latest" not in scylla_version:
+        return scylla_version
+    return None
+
+
+def result_key(cpp_driver_dir: str, driver_type: str, driver_version: str, scylla_build: Optional[str],
+               cql_cassandra_version: str) -> Optional[str]:
+    """
+    The key of the results of a version, None when they can't be cached
+    """
+    if scylla_build is None:
+        return None
+    try:
+        driver_commit = subprocess.check_output(["git", "rev-parse", "--verify", "--quiet",
+                                                 f"{driver_version}^{{commit}}"], cwd=cpp_driver_dir,
+                                                text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    version_dir = Run.version_directory(driver_type, driver_version)
+    if version_dir is None:
+        LOGGER.info("No folder of %s %s, its results aren't cached", driver_type, driver_version)
+        return None
+    patch_files = [path for path in version_dir.iterdir() if path.name.startswith("patch")]
+    ignore_files = [path for path in version_dir.iterdir() if path.name == "ignore.yaml"]
+    digest = hashlib.sha256()
+    for part in (driver_type, driver_commit, files_hash(patch_files), files_hash(ignore_files), scylla_build,
+                 cql_cassandra_version or ''):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def _results_to_json(results: TestResults) -> dict:
+    return dict(results._asdict(), tests=[test._asdict() for test in results.tests], phases=None)
+
+
+def _results_from_json(data: dict, cached_from: str) -> TestResults:
+    data = dict(data, tests=tuple(TestCase(**test) for test in data["tests"]),
+                passed_on_retry=tuple(data.get("passed_on_retry", ())), timed_out=tuple(data.get("timed_out", ())),
+                cached_from=cached_from)
+    return TestResults(**{field: value for field, value in data.items() if field in TestResults._fields})
+
+
+class ResultCache:
+    """
+    Keeps the results by the result key, the least recently used ones are evicted above max_size_mb
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size_mb: int = DEFAULT_MAX_SIZE_MB):
+        self._cache_dir = Path(cache_dir)
+        self._max_size = max_size_mb * 1024 * 1024
+
+    def restore(self, key: str, log_dir: Path) -> Optional[TestResults]:
+        entry = self._cache_dir / key
+        results_file = entry / RESULTS_FILE
+        if not results_file.exists():
+            return None
+        try:
+            stored = json.loads(results_file.read_text())
+            results = _results_from_json(stored["results"], stored["origin"])
+        except (ValueError, KeyError, TypeError) as exc:
+            LOGGER.warning("The cached results '%s' are broken, ignoring them: %s", key, exc)
+            return None
+        log_dir.mkdir(parents=True, exist_ok=True)
+        for cached_file in entry.iterdir():
+            if cached_file.name != RESULTS_FILE:
+                shutil.copy2(cached_file, log_dir / cached_file.name)
+        entry.touch()
+        LOGGER.info("The results '%s' were restored from the cache, they are of %s", key, stored["origin"])
+        return results
+
+    def store(self, key: str, results: TestResults, files: List[Path], origin: str) -> None:
+        entry = self._cache_dir / key
+        tmp_entry = self._cache_dir / f"{key}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        tmp_entry.mkdir(parents=True)
+        for file_path in files:
+            shutil.copy2(file_path, tmp_entry / file_path.name)
+        (tmp_entry / RESULTS_FILE).write_text(json.dumps(dict(results=_results_to_json(results), origin=origin)))
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp_entry.rename(entry)
+        LOGGER.info("The results '%s' were stored in the cache", key)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted((entry for entry in self._cache_dir.iterdir() if entry.is_dir() and ".tmp-" not in entry.name),
+                         key=lambda entry: entry.stat().st_mtime, reverse=True)
+        total_size = 0
+        for index, entry in enumerate(entries):
+            total_size += sum(path.stat().st_size for path in entry.iterdir() if path.is_file())
+            # The most recent entry is kept even when it's bigger than the whole cache
+            if total_size > self._max_size and index > 0:
+                LOGGER.info("Evicting the results '%s' from the cache", entry.name)
+                shutil.rmtree(entry, ignore_errors=True)
+
+
+def origin() -> str:
+    """
+    Which job the results are of, shown for the cached results
+    """
+    return f"{os.getenv('JOB_NAME', 'N/A')} {os.getenv('BUILD_DISPLAY_NAME', 'N/A')} " \
+           f"at {time.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -1,13 +1,29 @@
+import gzip
 import json
-import re
 import os
 import yaml
 import logging
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from packaging.version import Version
 
-from typing import NamedTuple
+from typing import List, NamedTuple, Optional
+
+import junit
+import ccm_templates
+import scheduler
+from resource_sampler import ResourceSampler
+from abort_policy import AbortMonitor, AbortPolicy
+from hang_watchdog import (DEFAULT_SUITE_TIMEOUT, DEFAULT_TEST_TIMEOUT, POLL_INTERVAL, HangWatchdog, TimeoutBudgets,
+                           dump_diagnostics, kill_tests)
+from timing import PhaseTimer
+from resources import WorkerResources
+import snapshots
+from gtest_stream import GtestEventParser, OutputPump
+from output_log import OutputLogWriter
+from run_plan import RunPlan, list_tests, plan_run
+from builder import BuildCache, BuildOptions, TESTS_BINARY, build_command, build_key, files_hash
 
 
 class TestResults(NamedTuple):
@@ -18,19 +34,81 @@ class TestResults(NamedTuple):
     passed: int
     returncode: int
     error: str
+    tests: tuple = ()  # junit.TestCase of every test that ran, with its duration
+    passed_on_retry: tuple = ()  # the tests that failed, but then passed when they were run again
+    timed_out: tuple = ()  # the failed tests that were killed by the hang watchdog
+    aborted: str = ''  # why the run was aborted before all the tests ran, empty if it wasn't
+    cached_from: str = ''  # the job the results were restored from, empty if the tests ran
+    rerun: bool = False  # --rerun-failed: the tests of the previous run, with the failed ones run again
+    phases: dict = None  # seconds spent in every phase of the run: checkout, patch, compile, tests etc.
+
+
+def merge_results(results: List[TestResults]) -> TestResults:
+    """
+    Merge the results of the shards that ran parts of the same test suite
+    """
+    failed_tests = []
+    for result in results:
+        failed_tests.extend(test for test in result.failed_tests if test not in failed_tests)
+    return TestResults(running_tests=sum(result.running_tests for result in results),
+                       ran_tests=sum(result.ran_tests for result in results),
+                       failed=sum(result.failed for result in results),
+                       passed=sum(result.passed for result in results),
+                       returncode=max((result.returncode for result in results), default=0),
+                       error="\n".join(result.error for result in results if result.error),
+                       failed_tests=failed_tests,
+                       tests=tuple(test for result in results for test in result.tests),
+                       passed_on_retry=tuple(test for result in results for test in result.passed_on_retry),
+                       timed_out=tuple(test for result in results for test in result.timed_out),
+                       aborted=next((result.aborted for result in results if result.aborted), ''))
 
 
 class Run:
     category = 'CASSANDRA'
 
     def __init__(self, cpp_driver_git: str, scylla_install_dir: str, driver_type: str, driver_version: str,
-                 cql_cassandra_version: str, scylla_version: str = None):
+                 cql_cassandra_version: str, scylla_version: str = None, log_dir: str = None,
+                 ccm_config_dir: str = None, ccm_host: str = None, shards: int = 1,
+                 build_options: BuildOptions = None, test_durations: dict = None, retries: int = 0,
+                 use_snapshots: bool = True, cluster_templates: bool = False,
+                 resources: List[WorkerResources] = None, resource_interval: float = None,
+                 test_timeout: float = DEFAULT_TEST_TIMEOUT, suite_timeout: float = DEFAULT_SUITE_TIMEOUT,
+                 abort_policy: AbortPolicy = None):
         self._driver_version = driver_version
         self._cpp_driver_git = cpp_driver_git
+        # When running from a worktree the logs still have to land in the main checkout, where CI collects them
+        self._log_dir = Path(log_dir or f"{cpp_driver_git}/log")
+        # Separate ccm home directory and node IPs, so a few test runs can share the host
+        self._ccm_config_dir = ccm_config_dir
+        self._ccm_host = ccm_host
+        self._shards = shards
+        self._build_options = build_options or BuildOptions()
+        # The historical duration of the tests by their names, used to balance the shards
+        self._test_durations = test_durations or {}
+        # How many times the failed tests are run again
+        self._retries = retries
+        # Keep the patched tree of every tag as a commit, to switch to it directly the next time
+        self._use_snapshots = use_snapshots
+        # Restore the initialized ccm clusters from the templates instead of creating them from nothing
+        self._cluster_templates = cluster_templates
+        # smp, memory and cpus of the scylla nodes, one per shard
+        self._resources = resources or []
+        self.timer = PhaseTimer()
+        # Seconds between the samples of the cpu, memory, fds and io of the tests and the nodes, None to not sample
+        self._resource_interval = resource_interval
+        # The default budgets of the hang watchdog, ignore.yaml can override them
+        self._test_timeout = test_timeout
+        self._suite_timeout = suite_timeout
+        self._timeouts = None
+        self._abort_policy = abort_policy or AbortPolicy()
+        # Why the run was aborted, set by the first of the shards that hits the abort policy, the rest follow it
+        self._abort_reason = None
         self._scylla_install_dir = scylla_install_dir
         self._scylla_version = scylla_version
         self._cql_cassandra_version = cql_cassandra_version
         self._version_folder = None
+        self._ignore_tests = None
+        self._applied_patch = None
         self.driver_type = driver_type
         logging.info(f'DRIVER TYPE: {self.driver_type}')
         self.run_compile_after_patch = True
@@ -42,6 +120,36 @@ class Run:
         self._version_folder = Path(self.__version_folder(self.driver_type, self._driver_version))
         return self._version_folder
 
+    @classmethod
+    def version_directory(cls, driver_type: str, driver_version: str) -> Optional[Path]:
+        """
+        The folder with the ignore.yaml and patches of the version, without creating a run.
+        None when there is no folder for the version (e.g. it's older than all the defined ones)
+        """
+        try:
+            folder = cls.__version_folder(driver_type, driver_version)
+        except OSError:
+            # No folder of the driver type at all
+            return None
+        return Path(folder) if folder and os.path.isdir(folder) else None
+
+    @property
+    def resources(self) -> List[WorkerResources]:
+        return self._resources
+
+    @resources.setter
+    def resources(self, resources: List[WorkerResources]) -> None:
+        # Set once the worker knows its slot, see main.run_version
+        self._resources = resources or []
+
+    @property
+    def build_dir(self) -> Path:
+        return Path(self._cpp_driver_git) / 'build'
+
+    @property
+    def xml_file(self) -> Path:
+        return self._log_dir / f"TEST-{self.driver_type}-{self._driver_version}.xml"
+
     @property
     def metadata_file_name(self) -> str:
         return f'metadata_{self.driver_type}-{self._driver_version}.json'
@@ -79,13 +187,34 @@ class Run:
         return os.path.join(here, 'versions', self.version_folder, 'ignore.yaml')
 
     def _testsList(self):
+        if self._ignore_tests is not None:
+            return self._ignore_tests
         ignore_tests = []
         with open(self._testsFile()) as f:
             content = yaml.safe_load(f)
             if 'tests' in content:
                 ignore_tests.extend(content['tests'])
+        self._ignore_tests = ignore_tests
         return ignore_tests
 
+    @property
+    def timeouts(self) -> TimeoutBudgets:
+        if self._timeouts is None:
+            with open(self._testsFile()) as f:
+                content = yaml.safe_load(f) or {}
+            self._timeouts = TimeoutBudgets.from_config(content.get('timeouts'), test=self._test_timeout,
+                                                        suite=self._suite_timeout)
+        return self._timeouts
+
+    def plan(self) -> Optional[RunPlan]:
+        """
+        Expand the ignore.yaml patterns against the tests of the built binary, None if the tests can't be listed
+        """
+        tests = list_tests(self.build_dir / TESTS_BINARY, [f"--category={self.category}"])
+        if tests is None:
+            return None
+        return plan_run(tests, self._testsList())
+
     def _run_command_in_shell(self, cmd: str):
         logging.info("Execute the cmd '%s'", cmd)
         with subprocess.Popen(cmd, shell=True, executable="/bin/bash",
@@ -106,6 +235,7 @@ class Run:
                     self._run_command_in_shell(f"git apply -v --check {file_path}")
                     logging.info("Applying patch file '%s'", file_path)
                     self._run_command_in_shell(f"patch -p1 -i {file_path}")
+                    self._applied_patch = file_path
                     return True
                 except Exception as exc:
                     logging.error("Failed to apply patch '%s' to version '%s', with: '%s'",
@@ -114,10 +244,27 @@ class Run:
         if is_dir_empty:
             logging.warning("The '%s' directory does not contain any files", self.version_folder)
 
+    @property
+    def patch_files(self) -> list:
+        return [file_path for file_path in self.version_folder.iterdir() if file_path.name.startswith("patch")]
+
+    def _build_key(self) -> str:
+        driver_commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=self._cpp_driver_git,
+                                                text=True).strip()
+        return build_key(driver_commit, files_hash(self.patch_files), self._build_options, self.build_dir)
+
     def compile_tests(self):
+        self.build_dir.mkdir(exist_ok=True)
+        build_cache = key = None
+        if self._build_options.cache:
+            build_cache = BuildCache(self._build_options.cache_dir, self._build_options.cache_size)
+            key = self._build_key()
+            if build_cache.restore(key, self.build_dir):
+                return
         logging.info('Compiling...')
-        cmd = "cmake -DCASS_BUILD_INTEGRATION_TESTS=ON -S .. -B . && make"
-        subprocess.check_call(cmd, shell=True, cwd=os.path.join(self._cpp_driver_git, 'build'))
+        subprocess.check_call(build_command(self._build_options), shell=True, cwd=self.build_dir)
+        if build_cache:
+            build_cache.store(key, self.build_dir)
 
     def _checkout_tag(self):
         try:
@@ -135,27 +282,57 @@ class Run:
                            failed_tests=[])
 
     def create_metadata_for_failure(self, reason: str) -> None:
-        log_path = Path(f"{self._cpp_driver_git}/log")
-        metadata_file = log_path / self.metadata_file_name
-        if not log_path.exists():
-            log_path.mkdir(exist_ok=True)
+        metadata_file = self._log_dir / self.metadata_file_name
+        self._log_dir.mkdir(parents=True, exist_ok=True)
         metadata = {
             "driver_name": f"TEST-{self.driver_type}-{self._driver_version}",
             "driver_type": "cpp",
             "failure_reason": reason,
+            "phases": self.timer.phases,
         }
         metadata_file.write_text(json.dumps(metadata))
 
-    def run(self) -> TestResults:
-        if not self._checkout_tag():
-             return self._publish_fake_result()
+    def _checkout_patched_tag(self) -> bool:
+        """
+        Check out the tag with the version's patch applied. The first time the patched tree is saved as a snapshot
+        commit, the next times it is checked out directly: the files that didn't change keep their timestamps,
+        so the build stays incremental.
+        """
+        ref = None
+        if self._use_snapshots and self.patch_files:
+            ref = snapshots.snapshot_ref(self._cpp_driver_git, self._driver_version, files_hash(self.patch_files))
+            commit = snapshots.find_snapshot(self._cpp_driver_git, ref) if ref else None
+            if commit:
+                logging.info("Checking out the patched snapshot '%s' of version '%s'", ref, self._driver_version)
+                with self.timer.phase("checkout"):
+                    snapshots.checkout_snapshot(self._cpp_driver_git, commit)
+                return True
 
-        if not self._apply_patch_files():
+        with self.timer.phase("checkout"):
+            if not self._checkout_tag():
+                return False
+        with self.timer.phase("patch"):
+            if not self._apply_patch_files():
+                return False
+
+        if ref:
+            try:
+                commit = snapshots.create_snapshot(self._cpp_driver_git, ref, self._driver_version,
+                                                   [self._applied_patch])
+                snapshots.adopt_snapshot(self._cpp_driver_git, commit)
+            except subprocess.CalledProcessError as exc:
+                logging.warning("Failed to save the snapshot of version '%s': %s", self._driver_version, exc)
+        return True
+
+    def run(self) -> TestResults:
+        if not self._checkout_patched_tag():
             return self._publish_fake_result()
 
         if self.run_compile_after_patch:
-            self.compile_tests()
-        metadata_file = Path(f"{self._cpp_driver_git}/log") / self.metadata_file_name
+            with self.timer.phase("compile"):
+                self.compile_tests()
+        self._log_dir.mkdir(parents=True, exist_ok=True)
+        metadata_file = self._log_dir / self.metadata_file_name
         metadata = {
             "driver_name": f"TEST-{self.driver_type}-{self._driver_version}",
             "driver_type": "cpp",
@@ -164,59 +341,305 @@ class Run:
         # To filter out the test add "minus" before the list of ignored tests
         # gtest_filter = "BasicsTests*"
         gtest_filter = f"-{':'.join(self._testsList())}" if self._testsList() else '*'
+        xml_file = self.xml_file
+        with self.timer.phase("plan"):
+            plan = self.plan()
+        if plan is not None:
+            metadata["expected_tests"] = plan.expected
+            metadata["stale_ignored_tests"] = plan.stale_patterns
+
+        with self.timer.phase("tests"):
+            if self._shards > 1:
+                results = self._run_shards(gtest_filter=gtest_filter, xml_file=xml_file,
+                                           shard_filters=scheduler.shard_filters(self._test_durations, self._shards,
+                                                                                 self._testsList(),
+                                                                                 plan.tests if plan else None))
+            else:
+                results = self._execute_tests(gtest_filter, xml_file,
+                                              self._tests_env(self._ccm_config_dir, self._shard_resources(0)),
+                                              self._ccm_host, self._shard_resources(0))
+        if plan is not None:
+            # The exact number of the tests, the binary prints it only if it got to start them
+            results = results._replace(running_tests=plan.expected)
+        results = self._retry_failed(results)
+        metadata["timed_out_tests"] = list(results.timed_out)
+        if results.aborted:
+            metadata["aborted"] = results.aborted
+        metadata["phases"] = self.timer.phases
+        metadata_file.write_text(json.dumps(metadata))
+        return results._replace(phases=dict(self.timer.phases))
 
+    def rerun_failed(self) -> TestResults:
+        """
+        Run again only the tests that failed in the previous run of this version, reusing its build directory.
+        The failed tests are taken from the previous JUnit XML, or from its output when the XML is missing.
+        """
+        stdout_log = self._log_dir / f"{self.driver_type}-{self._driver_version}.stdout.log.gz"
+        parser = GtestEventParser()
+        if stdout_log.exists():
+            with gzip.open(stdout_log, "rt", errors="replace") as stdout:
+                try:
+                    for line in stdout:
+                        parser.feed(line)
+                except EOFError:
+                    # The previous run was killed in the middle of a test, its last part wasn't completed
+                    pass
+        elif not self.xml_file.exists():
+            raise FileNotFoundError(f"No results of the previous run in '{self._log_dir}'")
+        previous = self.collect_results(self.xml_file, parser, returncode=0, error='')
+        logging.info("Rerunning %d failed tests of the version %s", len(previous.failed_tests), self._driver_version)
+        previous = previous._replace(returncode=1 if previous.failed_tests else 0)
+        results = self._retry_failed(previous, retries=max(1, self._retries))
+        return results._replace(phases=dict(self.timer.phases), rerun=True)
+
+    def _retry_failed(self, results: TestResults, retries: int = None) -> TestResults:
+        """
+        Run the failed tests again, up to 'retries' times, each time only the ones that still fail.
+        The tests that pass are reported as passed_on_retry, the rest stay failed.
+        """
+        retries = self._retries if retries is None else retries
+        remaining = list(results.failed_tests)
+        passed_on_retry = list(results.passed_on_retry)
+        timed_out = set(results.timed_out)
+        returncode = results.returncode
+        retries_dir = self._log_dir / "retries"
+        for attempt in range(1, retries + 1):
+            if not remaining or self._abort_reason:
+                break
+            retries_dir.mkdir(parents=True, exist_ok=True)
+            logging.info("Retry %d of %d: %s", attempt, retries, ', '.join(remaining))
+            # Kept out of the "log/TEST-*.xml" pattern collected by CI, the original results are left as they are
+            xml_file = retries_dir / f"retry{attempt}-{self.xml_file.name}"
+            with self.timer.phase("retries"):
+                attempt_results = self._execute_tests(
+                    ':'.join(remaining), xml_file, self._tests_env(self._ccm_config_dir, self._shard_resources(0)),
+                    self._ccm_host, self._shard_resources(0), f"[retry {attempt}] ",
+                    f"retries/retry{attempt}-{self.driver_type}-{self._driver_version}")
+            timed_out.update(attempt_results.timed_out)
+            passed = {test.name for test in attempt_results.tests if test.status == "passed"}
+            passed_on_retry.extend(test for test in remaining if test in passed)
+            remaining = [test for test in remaining if test not in passed]
+            returncode = attempt_results.returncode
+        if passed_on_retry == list(results.passed_on_retry):
+            return results
+        return results._replace(failed=len(remaining), failed_tests=remaining,
+                                passed=results.passed + len(passed_on_retry) - len(results.passed_on_retry),
+                                passed_on_retry=tuple(passed_on_retry),
+                                timed_out=tuple(test for test in remaining if test in timed_out),
+                                returncode=returncode if not remaining else results.returncode)
+
+    def _shard_resources(self, shard_index: int) -> Optional[WorkerResources]:
+        return self._resources[shard_index] if shard_index < len(self._resources) else None
+
+    def _tests_command(self, gtest_filter: str, xml_file: Path, ccm_host: str = None,
+                       resources: WorkerResources = None) -> str:
         # If run test using relocatable packages, the SCYLLA_VERSION and pathes to relocatables will be
         # taken from environment variables
         # otherwize set where is compiled scylla
         use_install_dir = f"--install-dir={self._scylla_install_dir}" if not self._scylla_version else ""
-        smp = " --smp=2" if self.driver_type == "scylla" else ""
+        smp = f" --smp={resources.smp if resources else 2}" if self.driver_type == "scylla" else ""
+        # The ccm bridge of the integration tests derives the nodes IP prefix from the host address
+        host = f" --host={ccm_host}" if ccm_host else ""
+        return f'./cassandra-integration-tests {use_install_dir} ' \
+               f'--version={self._cql_cassandra_version}{smp}{host} --category={self.category} --verbose=ccm ' \
+               f'--gtest_filter={gtest_filter} ' \
+               f'--gtest_output=xml:{xml_file}'
 
-        cmd = f'./cassandra-integration-tests {use_install_dir} ' \
-              f'--version={self._cql_cassandra_version}{smp} --category={self.category} --verbose=ccm ' \
-              f'--gtest_filter={gtest_filter} ' \
-              f'--gtest_output=xml:{self._cpp_driver_git}/log/TEST-{self.driver_type}-{self._driver_version}.xml'
-        logging.info(cmd)
-        stdout = ''
-        stderr = ''
-        with subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                              cwd=f'{self._cpp_driver_git}/build', text=True, bufsize=1, universal_newlines=True) as process:
-            for line in process.stdout:
-                print(line, end='')
-                stdout += line
-            for line in process.stderr:
-                print(line, end='')
-                stderr += line
-        metadata_file.write_text(json.dumps(metadata))
-        return self.analyze_results(stdout, stderr, process.returncode)
+    def _tests_env(self, ccm_config_dir: str = None, resources: WorkerResources = None, **extra_env) -> dict:
+        env = dict(os.environ, **extra_env)
+        if resources:
+            # ccm appends these to the command line of every scylla node it starts
+            env["SCYLLA_EXT_OPTS"] = f"{env.get('SCYLLA_EXT_OPTS', '')} {resources.scylla_options()}".strip()
+        if ccm_config_dir:
+            Path(ccm_config_dir).mkdir(parents=True, exist_ok=True)
+            env["CCM_CONFIG_DIR"] = ccm_config_dir
+        if self._cluster_templates:
+            env = ccm_templates.shim_env(env)
+        return env
 
-    def analyze_results(self, stdout: str, stderr: str, returncode: int) -> TestResults:
-        running_tests = passed_tests = failed_tests = ran_tests = 0
-        failed_tests_list = []
+    def _execute_tests(self, gtest_filter: str, xml_file: Path, env: dict, ccm_host: str = None,
+                       resources: WorkerResources = None, output_prefix: str = '',
+                       log_name: str = None) -> TestResults:
+        """
+        Run the tests binary, its output is parsed while it runs and is teed to the
+        <log_dir>/<log_name>.stdout.log.gz (indexed by test, see output_log.py) and .stderr.log files
+        instead of being kept in memory.
+        A test that exceeds its time budget is killed and marked as timed out, then the binary is started again
+        for the tests that didn't run yet. When the abort policy gives up on the run, the process is killed
+        and the tests that ran so far are reported. The JUnit XMLs of all the processes are merged into xml_file.
+        """
+        log_name = log_name or f"{self.driver_type}-{self._driver_version}"
+        if xml_file.exists():
+            xml_file.unlink()
+        hangs_dir = self._log_dir / "hangs"
+        parser = GtestEventParser()
+        watchdog = HangWatchdog(self.timeouts, parser) if self.timeouts.enabled else None
+        monitor = AbortMonitor(self._abort_policy, parser) if self._abort_policy.enabled else None
+        sampler = ResourceSampler(None, env.get("CCM_CONFIG_DIR")) if self._resource_interval else None
+        hangs = []
+        killed = 0
+        # The XML of every process, in the order they ran
+        xml_parts = []
+        expected_tests = None
+        process_filter, process_xml = gtest_filter, xml_file
+        with OutputLogWriter(self._log_dir / f"{log_name}.stdout.log.gz") as stdout_log, \
+                open(self._log_dir / f"{log_name}.stderr.log", "w") as stderr_file:
+            while True:
+                seen_tests = set(parser.tests)
+                returncode, hang, aborted, stderr_tail = self._run_tests_process(
+                    self._tests_command(process_filter, process_xml, ccm_host, resources), env, parser,
+                    watchdog, monitor, sampler, stdout_log, stderr_file, output_prefix,
+                    hangs_dir / f"{log_name}-hang{len(hangs) + 1}.txt")
+                expected_tests = expected_tests or parser.running_tests
+                if aborted:
+                    # The test that was running didn't finish
+                    if parser.current_test:
+                        parser.interrupt(parser.current_test, f"Aborted: {self._abort_reason}")
+                elif hang is None:
+                    xml_parts.append(process_xml)
+                    break
+                else:
+                    hangs.append(hang)
+                    if hang.test:
+                        parser.interrupt(hang.test, f"Timed out: {hang.reason}")
+                # Killed before it wrote its XML, its tests are taken from the output
+                stdout_log.end_test()
+                killed += 1
+                hangs_dir.mkdir(parents=True, exist_ok=True)
+                xml_parts.append(hangs_dir / f"part{killed}-{xml_file.name}")
+                junit.write_junit_file(parser.test_cases([test for test in parser.tests if test not in seen_tests]),
+                                       xml_parts[-1])
+                if aborted or self._abort_reason:
+                    break
+                if "GTEST_TOTAL_SHARDS" in env:
+                    logging.warning("The remaining tests of a gtest shard can't be selected, they aren't resumed")
+                    break
+                if hang.test is None and set(parser.tests) == seen_tests:
+                    logging.warning("No test ran since the tests binary was started, the tests aren't resumed")
+                    break
+                process_filter = scheduler.exclude_tests(gtest_filter, list(parser.tests) + hang.skip)
+                # Kept out of the "log/TEST-*.xml" pattern collected by CI, only the merged one counts
+                process_xml = hangs_dir / f"resume{len(hangs)}-{xml_file.name}"
+                logging.info("Resuming the tests after the hang: %s", hang.reason)
+        if sampler is not None:
+            # Next to the XML, e.g. log/TEST-scylla-2.16.0-1.resources.json
+            sampler.write(xml_file.with_suffix(".resources.json"), self._resource_interval)
+        error = ''.join(stderr_tail) if returncode != 0 else ''
+        if not killed:
+            return self.collect_results(xml_file, parser, returncode, error)
+        junit.merge_junit_files([path for path in xml_parts if path.exists()], xml_file, concurrent=False)
+        error = "\n".join([f"Hang: {hang.reason}" for hang in hangs] +
+                          ([f"Aborted: {self._abort_reason}"] if aborted else []) + ([error] if error else []))
+        results = self.collect_results(xml_file, parser, returncode or 1, error)
+        return results._replace(running_tests=expected_tests or results.running_tests,
+                                timed_out=tuple(hang.test for hang in hangs if hang.test),
+                                aborted=self._abort_reason if aborted else '')
 
-        # How many test cases should be run
-        search_result = re.search(r"Running (\d+) test.? from (\d+) test.? case", stdout)
-        if search_result:
-            running_tests = int(search_result.group(1))
+    def _run_tests_process(self, cmd: str, env: dict, parser: GtestEventParser, watchdog: Optional[HangWatchdog],
+                           monitor: Optional[AbortMonitor], sampler: Optional[ResourceSampler],
+                           stdout_log: OutputLogWriter, stderr_file, output_prefix: str,
+                           diagnostics_file: Path) -> tuple:
+        """
+        Run a single tests process, returns its returncode, the hang it was killed for (if any),
+        whether it was killed because the run was aborted and the last lines of its stderr
+        """
+        logging.info(cmd)
+        hang = None
+        aborted = False
+        # In its own session, so the whole process group can be killed on a hang or an abort
+        with subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.build_dir,
+                              env=env, text=True, bufsize=1, universal_newlines=True,
+                              start_new_session=True) as process:
+            pump = OutputPump(process, parser, stderr_file=stderr_file, output_prefix=output_prefix,
+                              stdout_log=stdout_log)
 
-        search_result = re.search(r"\[[ ]{2}PASSED[ ]{2}] (\d+) test", stdout)
-        if search_result:
-            passed_tests = int(search_result.group(1))
+            def on_idle():
+                nonlocal hang, aborted
+                if sampler is not None:
+                    sampler.sample(parser.current_test)
+                if not aborted and hang is None:
+                    reason = monitor.check() if monitor is not None else None
+                    if reason and not self._abort_reason:
+                        logging.error("Aborting the tests of version %s: %s", self._driver_version, reason)
+                        self._abort_reason = reason
+                    if self._abort_reason:
+                        aborted = True
+                        kill_tests(process.pid, env)
+                        return
+                if watchdog is not None and hang is None:
+                    hang = watchdog.check()
+                    if hang is not None:
+                        logging.error("The tests of version %s hung: %s", self._driver_version, hang.reason)
+                        dump_diagnostics(hang, process.pid, env, diagnostics_file, pump.stderr_tail)
+                        kill_tests(process.pid, env)
 
-        search_result = re.search(r"\[[ ]{2}FAILED[ ]{2}] (\d+) test", stdout)
-        if search_result:
-            failed_tests = int(search_result.group(1))
+            if sampler is not None:
+                sampler.root_pid = process.pid
+            if watchdog is not None:
+                watchdog.restart()
+            try:
+                pump.run(on_idle=on_idle if sampler or watchdog or monitor else None,
+                         poll_interval=self._resource_interval or POLL_INTERVAL)
+            except BaseException:
+                # Not in the session of the terminal, so it doesn't get the signals (e.g. Ctrl+C) by itself
+                kill_tests(process.pid, env)
+                raise
+        return process.returncode, hang, aborted, pump.stderr_tail
 
-        # How many test cases were run
-        search_result = re.search(r"\[==========] (\d+) test.? from (\d+) test case.? ran", stdout)
-        if search_result:
-            ran_tests = int(search_result.group(1))
+    @staticmethod
+    def collect_results(xml_file: Path, parser: GtestEventParser, returncode: int, error: str) -> TestResults:
+        """
+        The results are taken from the JUnit XML, the parsed output is used only when the XML is missing
+        """
+        report = junit.parse_junit(xml_file)
+        if report is None:
+            logging.warning("No JUnit results in '%s', taking the results from the tests output", xml_file)
+            return TestResults(running_tests=parser.running_tests, ran_tests=parser.ran_tests, failed=parser.failed,
+                               passed=parser.passed, returncode=returncode, error=error,
+                               failed_tests=list(parser.failed_tests), tests=tuple(parser.test_cases()))
+        failed_tests = report.failed_tests
+        return TestResults(running_tests=parser.running_tests or report.total, ran_tests=report.ran,
+                           failed=len(failed_tests), passed=report.passed, returncode=returncode, error=error,
+                           failed_tests=failed_tests, tests=tuple(report.tests))
 
-        if failed_tests:
-            failed_tests_list = re.findall(r"\[[ ]{2}FAILED[ ]{2}] (\w+.\w+)", stdout)
-            if failed_tests_list:
-                failed_tests_list = list(set(failed_tests_list))
+    def _shard_ccm_host(self, shard_index: int) -> str:
+        # Every shard gets its own loopback subnet, keeping the third octet of the worker (if any) in it
+        octets = (self._ccm_host or "127.0.0.1").split(".")
+        return f"127.{shard_index + 1}.{octets[2]}.1"
 
-        error = stderr if returncode != 0 else ''
+    def _shard_ccm_config_dir(self, shard_index: int) -> str:
+        base_dir = self._ccm_config_dir or os.path.join(os.path.expanduser("~"), ".ccm", "workers",
+                                                        f"{self.driver_type}-{self._driver_version}")
+        return os.path.join(base_dir, f"shard-{shard_index}")
 
-        return TestResults(running_tests=running_tests, ran_tests=ran_tests, failed=failed_tests, passed=passed_tests,
-                           returncode=returncode, error=error, failed_tests=failed_tests_list)
+    def _run_shards(self, gtest_filter: str, xml_file: Path, shard_filters: List[str] = None) -> TestResults:
+        """
+        Run the tests by a few concurrent processes, each one against its own ccm cluster.
+        Without shard_filters the tests are split by the gtest sharding (GTEST_TOTAL_SHARDS/GTEST_SHARD_INDEX),
+        otherwise every shard runs its own filter.
+        """
+        shards_count = len(shard_filters) if shard_filters else self._shards
+        shards_dir = self._log_dir / "shards"
+        shards_dir.mkdir(parents=True, exist_ok=True)
+        shard_xml_files = []
+        futures = []
+        logging.info("Running the tests in %d shards", shards_count)
+        with ThreadPoolExecutor(max_workers=shards_count) as executor:
+            for index in range(shards_count):
+                # Keep the shards XML out of the "log/TEST-*.xml" pattern collected by CI, only the merged one counts
+                shard_xml = shards_dir / f"shard{index}-{xml_file.name}"
+                shard_xml_files.append(shard_xml)
+                if shard_filters:
+                    shard_filter = shard_filters[index]
+                    extra_env = {}
+                else:
+                    shard_filter = gtest_filter
+                    extra_env = dict(GTEST_TOTAL_SHARDS=str(shards_count), GTEST_SHARD_INDEX=str(index))
+                env = self._tests_env(self._shard_ccm_config_dir(index), self._shard_resources(index), **extra_env)
+                futures.append(executor.submit(self._execute_tests, shard_filter, shard_xml, env,
+                                               self._shard_ccm_host(index), self._shard_resources(index),
+                                               f"[shard {index}] ",
+                                               f"shards/shard{index}-{self.driver_type}-{self._driver_version}"))
+        results = merge_results([future.result() for future in futures])
+        junit.merge_junit_files([path for path in shard_xml_files if path.exists()], xml_file)
+        return results
@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import logging
+import subprocess
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+# ~/.local is kept between the runs of the docker container (see scripts/run_test.sh)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "cpp-driver-matrix", "test-lists")
+
+
+class RunPlan(NamedTuple):
+    tests: List[str]  # the tests that are going to run
+    ignored: List[str]  # the tests filtered out by ignore.yaml
+    stale_patterns: List[str]  # ignore.yaml entries that match no test
+
+    @property
+    def expected(self) -> int:
+        return len(self.tests)
+
+
+def parse_tests_list(output: str) -> List[str]:
+    """
+    Parse the --gtest_list_tests output:
+        Suite.
+          Test
+        Prefix/ParamSuite.
+          Test/0  # GetParam() = 1
+    Anything printed before the first suite (e.g. the settings of the integration tests) is skipped.
+    """
+    tests = []
+    suite = None
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        if not line.startswith(" "):
+            name = line.split("#", maxsplit=1)[0].strip()
+            suite = name[:-1] if name.endswith(".") and " " not in name else None
+        elif suite:
+            tests.append(f"{suite}.{line.split('#', maxsplit=1)[0].strip()}")
+    return tests
+
+
+def _binary_hash(binary: Path) -> str:
+    digest = hashlib.sha256()
+    with open(binary, "rb") as binary_file:
+        for chunk in iter(lambda: binary_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_tests(binary: Path, args: List[str], cache_dir: str = DEFAULT_CACHE_DIR) -> Optional[List[str]]:
+    """
+    The tests the binary has for the given arguments (e.g. the category), cached by the hash of the binary
+    """
+    try:
+        digest = hashlib.sha256(_binary_hash(binary).encode())
+    except OSError:
+        # No binary to key the cache by, the tests are still listed, without the cache
+        digest = None
+    else:
+        digest.update(" ".join(args).encode())
+    cache_file = Path(cache_dir) / f"{digest.hexdigest()}.json" if digest else None
+    if cache_file and cache_file.exists():
+        return json.loads(cache_file.read_text())
+    try:
+        output = subprocess.check_output([f"./{binary.name}", "--gtest_list_tests", *args], cwd=binary.parent,
+                                         text=True, stderr=subprocess.DEVNULL, timeout=300)
+    except (OSError, subprocess.SubprocessError) as exc:
+        LOGGER.warning("Failed to list the tests of '%s': %s", binary, exc)
+        return None
+    tests = parse_tests_list(output)
+    if not tests:
+        LOGGER.warning("No tests were listed by '%s'", binary)
+        return None
+    if cache_file:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_text(json.dumps(tests))
+    return tests
+
+
+def matches(test: str, pattern: str) -> bool:
+    # gtest filter patterns, where '*' and '?' match any characters, including '.'
+    return fnmatchcase(test, pattern)
+
+
+def plan_run(tests: List[str], ignore_patterns: List[str]) -> RunPlan:
+    used_patterns = set()
+    to_run = []
+    ignored = []
+    for test in tests:
+        if "DISABLED_" in test:
+            # Listed, but never run by gtest
+            continue
+        matched = [pattern for pattern in ignore_patterns if matches(test, pattern)]
+        if matched:
+            used_patterns.update(matched)
+            ignored.append(test)
+        else:
+            to_run.append(test)
+    stale_patterns = [pattern for pattern in ignore_patterns if pattern not in used_patterns]
+    for pattern in stale_patterns:
+        LOGGER.warning("The ignored test '%s' doesn't match any test, it can be removed", pattern)
+    LOGGER.info("Run plan: %d tests to run, %d ignored", len(to_run), len(ignored))
+    return RunPlan(tests=to_run, ignored=ignored, stale_patterns=stale_patterns)
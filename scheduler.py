@@ -0,0 +1,81 @@
+import heapq
+import logging
+import statistics
+from typing import Dict, List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+
+def suite_name(test: str) -> str:
+    # "Suite.Test" or "Prefix/Suite.Test/0" for the parameterized tests
+    return test.split(".", maxsplit=1)[0]
+
+
+def suite_durations(test_durations: Dict[str, float], tests: List[str] = None) -> Dict[str, float]:
+    """
+    Sum the test durations by suite. The tests without history are assumed to take the median duration.
+    """
+    default = statistics.median(test_durations.values()) if test_durations else 1.0
+    durations = {}
+    for test in (tests if tests is not None else test_durations):
+        suite = suite_name(test)
+        durations[suite] = durations.get(suite, 0.0) + test_durations.get(test, default)
+    return durations
+
+
+def longest_first(weights: Dict[str, float], workers: int) -> List[List[str]]:
+    """
+    Longest-processing-time-first bin packing: the heaviest item goes to the least loaded worker
+    """
+    bins = [[] for _ in range(workers)]
+    loads = [(0.0, index) for index in range(workers)]
+    heapq.heapify(loads)
+    for item, weight in sorted(weights.items(), key=lambda item: (-item[1], item[0])):
+        load, index = heapq.heappop(loads)
+        bins[index].append(item)
+        heapq.heappush(loads, (load + weight, index))
+    for index, items in enumerate(bins):
+        LOGGER.info("Worker %d: %d suites, %.0f seconds expected", index, len(items),
+                    sum(weights[item] for item in items))
+    return bins
+
+
+def _gtest_filter(positive: List[str], negative: List[str]) -> str:
+    return f"{':'.join(positive) or '*'}{'-' if negative else ''}{':'.join(negative)}"
+
+
+def exclude_tests(gtest_filter: str, tests: List[str]) -> str:
+    """
+    Narrow down the --gtest_filter to skip the tests (or patterns), e.g. the ones that already ran
+    """
+    positive, _, negative = gtest_filter.partition("-")
+    positive = [pattern for pattern in positive.split(":") if pattern and pattern != "*"]
+    negative = [pattern for pattern in negative.split(":") if pattern]
+    return _gtest_filter(positive, negative + [test for test in tests if test not in negative])
+
+
+def shard_filters(test_durations: Dict[str, float], workers: int, ignore_tests: List[str],
+                  tests: List[str] = None) -> Optional[List[str]]:
+    """
+    Split the suites between the workers by their historical durations, one --gtest_filter per worker.
+    When the list of tests isn't known, the least loaded worker also runs all the suites missing in the history.
+    With the list of tests but without history, the suites are split evenly by the number of their tests.
+    Returns None when there is neither the history nor the list of tests, then gtest sharding should be used.
+    """
+    if workers < 2 or (not test_durations and tests is None):
+        return None
+    weights = suite_durations(test_durations, tests)
+    bins = longest_first(weights, workers)
+    catch_all = None
+    if tests is None:
+        catch_all = min(range(workers), key=lambda index: sum(weights[suite] for suite in bins[index]))
+    filters = []
+    for index, suites in enumerate(bins):
+        if index == catch_all:
+            others = [f"{suite}.*" for other, other_suites in enumerate(bins) if other != index
+                      for suite in other_suites]
+            filters.append(_gtest_filter([], ignore_tests + others))
+        elif suites:
+            # An empty positive filter means all the tests, so the workers without suites are dropped
+            filters.append(_gtest_filter([f"{suite}.*" for suite in suites], ignore_tests))
+    return filters
@@ -0,0 +1,68 @@
+import os
+import logging
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+REFS_PREFIX = "refs/matrix-snapshots"
+
+# Fixed identity and dates, so the same tag and patch always produce the same snapshot commit
+COMMIT_ENV = dict(GIT_AUTHOR_NAME="cpp-driver-matrix", GIT_AUTHOR_EMAIL="cpp-driver-matrix@localhost",
+                  GIT_COMMITTER_NAME="cpp-driver-matrix", GIT_COMMITTER_EMAIL="cpp-driver-matrix@localhost",
+                  GIT_AUTHOR_DATE="1970-01-01T00:00:00 +0000", GIT_COMMITTER_DATE="1970-01-01T00:00:00 +0000")
+
+
+def _git(args: List[str], cwd: str, env: dict = None) -> str:
+    return subprocess.check_output(["git", *args], cwd=cwd, text=True,
+                                   env=dict(os.environ, **env) if env else None).strip()
+
+
+def snapshot_ref(repo_directory: str, tag: str, patch_hash: str) -> Optional[str]:
+    try:
+        tag_commit = _git(["rev-parse", "--verify", "--quiet", f"{tag}^{{commit}}"], cwd=repo_directory)
+    except subprocess.CalledProcessError:
+        return None
+    return f"{REFS_PREFIX}/{tag_commit}-{patch_hash[:16]}"
+
+
+def find_snapshot(repo_directory: str, ref: str) -> Optional[str]:
+    try:
+        return _git(["rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"], cwd=repo_directory)
+    except subprocess.CalledProcessError:
+        return None
+
+
+def create_snapshot(repo_directory: str, ref: str, tag: str, patch_files: List[Path]) -> str:
+    """
+    Commit the patched tag, the patches are applied to a temporary index so the working tree isn't touched
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_env = dict(GIT_INDEX_FILE=os.path.join(tmp_dir, "index"))
+        _git(["read-tree", tag], cwd=repo_directory, env=index_env)
+        for patch_file in patch_files:
+            _git(["apply", "--cached", str(patch_file)], cwd=repo_directory, env=index_env)
+        tree = _git(["write-tree"], cwd=repo_directory, env=index_env)
+    message = f"{tag} patched with {', '.join(patch_file.name for patch_file in patch_files)}"
+    commit = _git(["commit-tree", tree, "-p", f"{tag}^{{commit}}", "-m", message], cwd=repo_directory, env=COMMIT_ENV)
+    _git(["update-ref", ref, commit], cwd=repo_directory)
+    LOGGER.info("Saved the snapshot '%s' of '%s'", ref, tag)
+    return commit
+
+
+def adopt_snapshot(repo_directory: str, commit: str) -> None:
+    """
+    Point HEAD and the index to the snapshot, when the working tree already has its content (was just patched)
+    """
+    _git(["reset", "--quiet", commit], cwd=repo_directory)
+
+
+def checkout_snapshot(repo_directory: str, commit: str) -> None:
+    """
+    Switch to the snapshot, git rewrites only the files that differ, so switching to the snapshot
+    that is already checked out doesn't touch any file and keeps the build incremental
+    """
+    _git(["checkout", "--quiet", "."], cwd=repo_directory)
+    _git(["checkout", "--quiet", "--detach", commit], cwd=repo_directory)
@@ -0,0 +1,369 @@
+"""
+Record and replay of the subprocesses, to run the whole matrix pipeline offline, without a build and ccm clusters.
+
+SUBPROCESS_RECORD=<fixture dir>: every subprocess started through subprocess.Popen is recorded: its command, cwd,
+exit code, duration and output (stdout and stderr, every chunk with the time it came at), along with the files named
+in its command that it wrote (e.g. the JUnit XML of --gtest_output=xml:<file>).
+SUBPROCESS_REPLAY=<fixture dir>: a small replayer process is started instead of the recorded command, it plays back
+the output and the exit code and writes the recorded files, SUBPROCESS_REPLAY_SPEED times faster (0 for no delays).
+The replayer is a real process, so the pipes, the process group, the timeouts and the kills work as they do for the
+real command. The calls are matched by the command and cwd, in the order they were recorded; a command that wasn't
+recorded fails with exit code 127.
+The directories that differ between the machines (the cpp-driver checkout, the scylla install, the home directory, see
+set_roots) are kept in the fixture as placeholders, so a fixture recorded on one machine replays on another, and the
+recorded files are written to the paths named in the replayed command.
+
+subprocess.Popen is wrapped by install() in these two modes only, the subprocesses of a normal run are left as they are.
+
+The fixture directory has the index.jsonl of the calls, and the output and files of every call under calls/:
+    SUBPROCESS_RECORD=/tmp/fixture python3 main.py ../cpp-driver ...
+    SUBPROCESS_REPLAY=/tmp/fixture SUBPROCESS_REPLAY_SPEED=50 python3 main.py ../cpp-driver ...
+"""
+import io
+import os
+import sys
+import re
+import json
+import gzip
+import time
+import shlex
+import shutil
+import signal
+import inspect
+import logging
+import itertools
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+INDEX_FILE = "index.jsonl"
+CALLS_DIR = "calls"
+CHUNK_SIZE = 65536
+MAX_FILE_SIZE = 64 * 1024 * 1024  # the bigger files written by a command aren't recorded
+NOT_RECORDED_RETURNCODE = 127
+ROOTS_ENV = "SUBPROCESS_ROOTS"
+
+_counter = itertools.count()
+_index_lock = threading.Lock()
+_calls: Dict[str, Dict[tuple, List[dict]]] = {}  # fixture dir -> (command, cwd) -> the calls left to replay
+
+
+def recording() -> Optional[Path]:
+    return Path(os.environ["SUBPROCESS_RECORD"]) if os.getenv("SUBPROCESS_RECORD") else None
+
+
+def replaying() -> Optional[Path]:
+    return Path(os.environ["SUBPROCESS_REPLAY"]) if os.getenv("SUBPROCESS_REPLAY") else None
+
+
+def replay_speed() -> float:
+    return float(os.getenv("SUBPROCESS_REPLAY_SPEED", "1"))
+
+
+def command_string(args) -> str:
+    return args if isinstance(args, (str, bytes)) else " ".join(str(arg) for arg in args)
+
+
+def set_roots(**roots: Optional[str]) -> None:
+    """
+    The directories of this machine that are replaced by {<name>} in the fixture, e.g. cpp_driver_dir.
+    Kept in the environment, so the worker processes and the subprocesses get them too
+    """
+    os.environ[ROOTS_ENV] = json.dumps({name: os.path.abspath(path) for name, path in roots.items() if path})
+
+
+def _root_dirs() -> Dict[str, str]:
+    return dict(json.loads(os.getenv(ROOTS_ENV) or "{}"), home=os.path.expanduser("~"),
+                harness_dir=os.path.dirname(os.path.abspath(__file__)))
+
+
+def _roots() -> List[Tuple[str, str]]:
+    paths = {}
+    for name, path in _root_dirs().items():
+        for variant in (os.path.abspath(path), os.path.realpath(path)):
+            if variant.rstrip(os.sep):
+                paths.setdefault(variant.rstrip(os.sep), name)
+    # The longest first, so a root inside another one (e.g. the worktrees in the checkout) gets its own placeholder
+    return sorted(paths.items(), key=lambda item: len(item[0]), reverse=True)
+
+
+def _normalize(text: Optional[str]) -> Optional[str]:
+    """
+    The text with the roots of this machine replaced by their placeholders
+    """
+    if not text:
+        return text
+    for path, name in _roots():
+        # Only whole path components, /work/cpp-driver isn't a root of /work/cpp-driver-2
+        text = re.sub(re.escape(path) + r"(?![\w.\-])", f"{{{name}}}", text)
+    return text
+
+
+def _expand(text: str) -> str:
+    """
+    The placeholders replaced by the roots of this machine
+    """
+    for name, path in _root_dirs().items():
+        text = text.replace(f"{{{name}}}", path)
+    return text
+
+
+def _popen_arguments(popen, args: tuple, kwargs: dict) -> dict:
+    # The arguments by their names, whether they were passed by position or by keyword
+    return dict(inspect.signature(popen).bind(*args, **kwargs).arguments)
+
+
+def _named_files(command: str, cwd: Optional[str]) -> List[Path]:
+    """
+    The paths in the command line, e.g. the xml file of --gtest_output=xml:<file>
+    """
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        tokens = command.split()
+    paths = set()
+    for token in tokens:
+        value = token.rpartition("=")[2]
+        for candidate in (value, value.rpartition(":")[2]):
+            if "/" in candidate or "." in candidate:
+                paths.add(Path(cwd or ".", candidate))
+    return sorted(paths)
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def _append_index(fixture_dir: Path, call: dict) -> None:
+    line = (json.dumps(call) + "\n").encode()
+    # A single write in append mode, the concurrent versions and shards record to the same index
+    with _index_lock:
+        fixture_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(fixture_dir / INDEX_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            _write_all(fd, line)
+        finally:
+            os.close(fd)
+
+
+class _Recorder:
+    """
+    Tees the output of a real process: the caller gets it as if it was read from the process itself
+    """
+
+    def __init__(self, fixture_dir: Path, process, command: str, cwd: Optional[str], targets: dict):
+        self._fixture_dir = fixture_dir
+        self._process = process
+        self._command = command
+        self._cwd = str(cwd) if cwd else None
+        self._call = dict(id=f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{next(_counter)}",
+                          command=_normalize(command), cwd=_normalize(self._cwd))
+        self._started_at = time.time()
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        calls_dir = fixture_dir / CALLS_DIR
+        calls_dir.mkdir(parents=True, exist_ok=True)
+        self._output = gzip.open(calls_dir / f"{self._call['id']}.jsonl.gz", "wt")
+        self._pumps = []
+        for name, target in targets.items():
+            source = getattr(process, name)
+            if target == subprocess.PIPE:
+                read_fd, forward_fd = os.pipe()
+                setattr(process, name, self._caller_stream(read_fd))
+                close_forward = True
+            else:
+                # Inherited (None), a file descriptor or a file object
+                forward_fd = {"stdout": 1, "stderr": 2}[name] if target is None else \
+                    target if isinstance(target, int) else target.fileno()
+                close_forward = False
+                # The caller didn't ask for a pipe, so it doesn't get one
+                setattr(process, name, None)
+            self._pumps.append(threading.Thread(target=self._pump, args=(name, source, forward_fd, close_forward),
+                                                daemon=True))
+        for pump in self._pumps:
+            pump.start()
+        # Not a daemon, so the call is still written when the interpreter exits right after the process
+        threading.Thread(target=self._finish).start()
+
+    def _caller_stream(self, read_fd: int):
+        stream = open(read_fd, "rb")  # pylint: disable=consider-using-with
+        if self._process.text_mode:
+            return io.TextIOWrapper(stream, encoding=self._process.encoding, errors=self._process.errors)
+        return stream
+
+    def _pump(self, name: str, source, forward_fd: int, close_forward: bool) -> None:
+        try:
+            while True:
+                chunk = os.read(source.fileno(), CHUNK_SIZE)
+                if not chunk:
+                    break
+                with self._lock:
+                    self._output.write(json.dumps([round(time.monotonic() - self._started, 3), name,
+                                                   chunk.decode(errors="surrogateescape")]) + "\n")
+                if forward_fd is not None:
+                    try:
+                        _write_all(forward_fd, chunk)
+                    except OSError:
+                        # The caller closed its end, the rest is still recorded
+                        forward_fd = None
+        finally:
+            source.close()
+            if close_forward and forward_fd is not None:
+                os.close(forward_fd)
+
+    def _finish(self) -> None:
+        for pump in self._pumps:
+            pump.join()
+        returncode = self._process.wait()
+        self._output.close()
+        files = {}
+        files_dir = self._fixture_dir / CALLS_DIR / f"{self._call['id']}.files"
+        for path in _named_files(self._command, self._cwd):
+            try:
+                stat = path.stat()
+                if not path.is_file() or stat.st_mtime < self._started_at - 1 or stat.st_size > MAX_FILE_SIZE:
+                    continue
+                files_dir.mkdir(exist_ok=True)
+                shutil.copyfile(path, files_dir / str(len(files)))
+                files[_normalize(str(path.resolve()))] = str(len(files))
+            except OSError:
+                continue
+        _append_index(self._fixture_dir, dict(self._call, returncode=returncode, files=files,
+                                              duration=round(time.monotonic() - self._started, 3)))
+
+
+def record(popen, fixture_dir: Path, *args, **kwargs):
+    """
+    Starts the real process, its output and exit code are recorded to the fixture directory in the background
+    """
+    arguments = _popen_arguments(popen, args, kwargs)
+    command, cwd = command_string(arguments["args"]), arguments.get("cwd")
+    targets = {}
+    for name in ("stdout", "stderr"):
+        target = arguments.get(name)
+        if target in (subprocess.DEVNULL, subprocess.STDOUT):
+            continue
+        targets[name] = target
+        arguments[name] = subprocess.PIPE
+    try:
+        process = popen(**arguments)
+    except OSError as exc:
+        # E.g. the command isn't installed, replayed as the same error
+        _append_index(fixture_dir, dict(id=None, command=_normalize(command), cwd=_normalize(str(cwd) if cwd else None),
+                                        error=[exc.errno, exc.strerror]))
+        raise
+    _Recorder(fixture_dir, process, command, cwd, targets)
+    return process
+
+
+def install() -> None:
+    """
+    Wraps subprocess.Popen to record or replay the subprocesses, only when SUBPROCESS_RECORD or SUBPROCESS_REPLAY is set
+    """
+    if not (recording() or replaying()) or hasattr(subprocess.Popen, "unwrapped"):
+        return
+    original = subprocess.Popen
+
+    def _popen(*args, **kwargs):
+        if replaying():
+            return replay(original, replaying(), *args, **kwargs)
+        return record(original, recording(), *args, **kwargs)
+
+    _popen.unwrapped = original
+    subprocess.Popen = _popen
+
+
+def _load_calls(fixture_dir: Path) -> Dict[tuple, List[dict]]:
+    if str(fixture_dir) not in _calls:
+        calls = {}
+        with open(fixture_dir / INDEX_FILE) as index:
+            for line in index:
+                if line.strip():
+                    call = json.loads(line)
+                    calls.setdefault((call["command"], call["cwd"]), []).append(call)
+        _calls[str(fixture_dir)] = calls
+    return _calls[str(fixture_dir)]
+
+
+def _next_call(fixture_dir: Path, command: str, cwd: Optional[str]) -> Optional[dict]:
+    """
+    The next recorded call of the command, the command and cwd are normalized
+    """
+    with _index_lock:
+        calls = _load_calls(fixture_dir)
+        matching = calls.get((command, cwd)) or \
+            next((calls[key] for key in calls if key[0] == command), None)
+        if not matching:
+            return None
+        # The last one is repeated when the command is run more times than it was recorded
+        return matching.pop(0) if len(matching) > 1 else matching[0]
+
+
+def replay(popen, fixture_dir: Path, *args, **kwargs):
+    """
+    Starts the replayer of the recorded call instead of the command
+    """
+    arguments = _popen_arguments(popen, args, kwargs)
+    command = command_string(arguments.pop("args"))
+    cwd = str(arguments["cwd"]) if arguments.get("cwd") else None
+    call = _next_call(fixture_dir, _normalize(command), _normalize(cwd))
+    files = {}
+    if call is None:
+        LOGGER.error("The command wasn't recorded in '%s': %s", fixture_dir, command)
+    elif call.get("error"):
+        raise OSError(*call["error"])
+    else:
+        # The recorded files go to the paths named in this command, which may differ from the recorded ones
+        named = {_normalize(str(path.resolve())): str(path.resolve()) for path in _named_files(command, cwd)}
+        files = {stored: named.get(recorded) or _expand(recorded) for recorded, stored in call["files"].items()}
+    # The cwd of the recorded command might not exist, the replayer doesn't need it
+    for name in ("shell", "executable", "cwd"):
+        arguments.pop(name, None)
+    return popen([sys.executable, os.path.abspath(__file__), str(fixture_dir), call["id"] if call else "",
+                  str(replay_speed()), command, json.dumps(files)], **arguments)
+
+
+def _sleep_until(started: float, offset: float, speed: float) -> None:
+    if speed > 0:
+        time.sleep(max(0.0, started + offset / speed - time.monotonic()))
+
+
+def play(fixture_dir: Path, call_id: str, speed: float, command: str, files: Dict[str, str]) -> int:
+    """
+    The replayer: writes the recorded output with its timing and the recorded files (by their stored name to
+    the path to write them to), returns the exit code
+    """
+    call = next((call for calls in _load_calls(fixture_dir).values() for call in calls if call["id"] == call_id),
+                None)
+    if call is None:
+        sys.stderr.write(f"subprocess_replay: the command wasn't recorded in '{fixture_dir}': {command}\n")
+        return NOT_RECORDED_RETURNCODE
+    started = time.monotonic()
+    streams = {"stdout": 1, "stderr": 2}
+    with gzip.open(fixture_dir / CALLS_DIR / f"{call_id}.jsonl.gz", "rt") as output:
+        for line in output:
+            offset, name, data = json.loads(line)
+            _sleep_until(started, offset, speed)
+            if name in streams:
+                try:
+                    _write_all(streams[name], data.encode(errors="surrogateescape"))
+                except OSError:
+                    streams.pop(name)
+    _sleep_until(started, call["duration"], speed)
+    for stored, path in files.items():
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(fixture_dir / CALLS_DIR / f"{call_id}.files" / stored, path)
+    returncode = call["returncode"]
+    if returncode < 0:
+        # Killed by a signal, e.g. by the hang watchdog
+        signal.signal(-returncode, signal.SIG_DFL)
+        os.kill(os.getpid(), -returncode)
+    return returncode
+
+
+if __name__ == '__main__':
+    sys.exit(play(Path(sys.argv[1]), sys.argv[2], float(sys.argv[3]), sys.argv[4], json.loads(sys.argv[5])))
@@ -0,0 +1,98 @@
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import subprocess
+from pathlib import Path
+from typing import List
+
+from packaging.version import Version, InvalidVersion
+
+LOGGER = logging.getLogger(__name__)
+
+# ~/.local is kept between the runs of the docker container (see scripts/run_test.sh)
+DEFAULT_MIRRORS_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "cpp-driver-matrix", "mirrors")
+DEFAULT_TTL = 600  # seconds, the matrix jobs starting within it share a single fetch
+
+RELEASE_TAG_RE = re.compile(r"^[0-9]+\.[0-9]+\.[0-9]+(-1)?$")
+
+
+def _git(args: List[str], cwd, **kwargs) -> str:
+    return subprocess.check_output(["git", *args], cwd=cwd, text=True, **kwargs)
+
+
+def sort_tags(tags: List[str]) -> List[str]:
+    """
+    Release tags only, from the newest version to the oldest
+    """
+    versions = []
+    for tag in tags:
+        if not RELEASE_TAG_RE.match(tag):
+            continue
+        try:
+            versions.append((Version(tag), tag))
+        except InvalidVersion:
+            continue
+    return [tag for _, tag in sorted(versions, reverse=True)]
+
+
+class TagIndex:
+    """
+    The tags of the driver repository, resolved through a local bare mirror of its origin.
+    The mirror is fetched incrementally, at most once per TTL, under a file lock shared by the concurrent jobs.
+    """
+
+    def __init__(self, repo_directory: str, mirrors_dir: str = DEFAULT_MIRRORS_DIR, ttl: int = DEFAULT_TTL):
+        self._repo_directory = repo_directory
+        self._remote = _git(["config", "--get", "remote.origin.url"], cwd=repo_directory).strip()
+        name = hashlib.sha256(self._remote.encode()).hexdigest()[:16]
+        self._mirror = Path(mirrors_dir) / f"{name}.git"
+        self._index_file = Path(mirrors_dir) / f"{name}.tags.json"
+        self._lock_file = Path(mirrors_dir) / f"{name}.lock"
+        self._ttl = ttl
+
+    def _read_index(self) -> dict:
+        if self._index_file.exists():
+            try:
+                return json.loads(self._index_file.read_text())
+            except ValueError:
+                LOGGER.warning("The tags index '%s' is broken, it will be rebuilt", self._index_file)
+        return {}
+
+    def _fetch(self) -> None:
+        if not (self._mirror / "HEAD").exists():
+            LOGGER.info("Cloning the mirror of '%s' to '%s'", self._remote, self._mirror)
+            subprocess.check_call(["git", "clone", "--quiet", "--mirror", self._remote, str(self._mirror)])
+        else:
+            LOGGER.info("Fetching '%s' to the mirror '%s'", self._remote, self._mirror)
+            subprocess.check_call(["git", "fetch", "--quiet", "--prune", "origin"], cwd=self._mirror)
+
+    def tags(self) -> List[str]:
+        """
+        The release tags from the newest version to the oldest, they are also fetched into the driver repository
+        """
+        self._lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_file, "w") as lock:
+            # Whoever comes second waits for the fetch of the first one and then uses its index
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self._read_index()
+            if time.time() - index.get("fetched_at", 0) > self._ttl:
+                self._fetch()
+                refs = _git(["for-each-ref", "--format=%(refname:short)", "refs/tags"], cwd=self._mirror)
+                index = dict(fetched_at=time.time(), tags=sort_tags(refs.split()))
+                tmp_file = self._index_file.with_suffix(f".tmp-{os.getpid()}")
+                tmp_file.write_text(json.dumps(index))
+                tmp_file.rename(self._index_file)
+            else:
+                LOGGER.info("Using the tags fetched %d seconds ago", time.time() - index["fetched_at"])
+        # A local fetch, the tags have to be in the driver repository to check them out
+        subprocess.check_call(["git", "fetch", "--quiet", str(self._mirror.resolve()), "+refs/tags/*:refs/tags/*"],
+                              cwd=self._repo_directory)
+        return index["tags"]
+
+
+def local_tags(repo_directory: str) -> List[str]:
+    return sort_tags(_git(["tag"], cwd=repo_directory).split())
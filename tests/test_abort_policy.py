@@ -0,0 +1,101 @@
+import pytest
+
+from abort_policy import AbortMonitor, AbortPolicy, error_class, is_bootstrap_failure
+from gtest_stream import GtestEventParser
+
+
+@pytest.mark.parametrize("message", [
+    "integration.cpp:120: Failure\nUnable to start cluster: ccm exited with 1",
+    "CCM bridge: unable to create the cluster 'cpp-driver'",
+    "Unable to populate cluster with 3 nodes",
+    "Error starting node node1: scylla exited",
+    "Node 127.0.1.2 failed to start within 120 seconds",
+    "ccm start failed: timed out waiting for the nodes",
+])
+def test_bootstrap_failures(message):
+    assert is_bootstrap_failure(message)
+
+
+@pytest.mark.parametrize("message", [
+    # The ordinary failures of the tests that connect, not of the cluster
+    "test_basics.cpp:52: Failure\nUnable to establish connection to 127.0.1.1:9042",
+    "ssl.cpp:80: Failure\nError: 'Unable to establish connection: SSL handshake failed'",
+    "auth.cpp:33: Failure\nExpected: CASS_OK, actual: CASS_ERROR_SERVER_BAD_CREDENTIALS (Provided username "
+    "cassandra and/or password are incorrect)",
+    "ccm error while stopping node2, the test restarts it",
+    "Exception in ccm bridge: no such node 'node4'",
+    "control_connection.cpp:97: Failure\nThe cluster failed over to the second datacenter",
+])
+def test_not_bootstrap_failures(message):
+    assert not is_bootstrap_failure(message)
+
+
+def test_error_class_ignores_the_volatile_parts():
+    first = "test_basics.cpp:52: Failure\nKeyspace 'ks_1634567' at 127.0.1.1 timed out after 12000 ms"
+    second = "test_basics.cpp:52: Failure\nKeyspace 'ks_9876543' at 127.0.2.1 timed out after 15000 ms"
+    assert error_class(first) == error_class(second)
+    assert error_class(first).startswith("test_basics.cpp:52 ")
+    assert error_class(first) != error_class(first.replace(":52:", ":60:"))
+    assert error_class("") == "unknown"
+
+
+def monitor(policy):
+    parser = GtestEventParser()
+    return AbortMonitor(policy, parser), parser
+
+
+def run_test(parser, name, failure=None):
+    parser.feed(f"[ RUN      ] {name}\n")
+    if failure is None:
+        parser.feed(f"[       OK ] {name} (1 ms)\n")
+    else:
+        for line in failure.splitlines():
+            parser.feed(line + "\n")
+        parser.feed(f"[  FAILED  ] {name} (1 ms)\n")
+
+
+def test_bootstrap_abort_is_opt_in():
+    abort_monitor, parser = monitor(AbortPolicy())
+    assert not AbortPolicy().enabled
+    for index in range(10):
+        run_test(parser, f"BasicsTests.Test{index}", "integration.cpp:120: Failure\nUnable to start cluster")
+    assert abort_monitor.check() is None
+
+
+def test_bootstrap_abort_after_failures_in_a_row():
+    abort_monitor, parser = monitor(AbortPolicy(bootstrap=3))
+    run_test(parser, "BasicsTests.Test0", "integration.cpp:120: Failure\nUnable to start cluster")
+    run_test(parser, "BasicsTests.Test1", "integration.cpp:120: Failure\nUnable to start cluster")
+    # A passed test resets the count
+    run_test(parser, "BasicsTests.Test2")
+    assert abort_monitor.check() is None
+    for index in range(3, 6):
+        run_test(parser, f"BasicsTests.Test{index}", "integration.cpp:120: Failure\nUnable to start cluster")
+    assert abort_monitor.check().startswith("the cluster failed to start in 3 tests in a row")
+
+
+def test_connection_failures_dont_abort_as_bootstrap():
+    abort_monitor, parser = monitor(AbortPolicy(bootstrap=3))
+    for index in range(5):
+        run_test(parser, f"SslTests.Test{index}", f"ssl.cpp:{index}: Failure\nUnable to establish connection")
+    assert abort_monitor.check() is None
+
+
+def test_consecutive_failures_with_the_same_error():
+    abort_monitor, parser = monitor(AbortPolicy(consecutive=3))
+    run_test(parser, "SchemaTests.Test0", "schema.cpp:10: Failure\nTimed out after 1000 ms")
+    run_test(parser, "SchemaTests.Test1", "schema.cpp:10: Failure\nTimed out after 2000 ms")
+    run_test(parser, "SchemaTests.Test2", "schema.cpp:99: Failure\nOther error")
+    assert abort_monitor.check() is None
+    run_test(parser, "SchemaTests.Test3", "schema.cpp:99: Failure\nOther error")
+    run_test(parser, "SchemaTests.Test4", "schema.cpp:99: Failure\nOther error")
+    assert abort_monitor.check() == "3 tests in a row failed with the same error: schema.cpp:99 other error"
+
+
+def test_failure_ratio_after_the_minimum_of_tests():
+    abort_monitor, parser = monitor(AbortPolicy(failure_ratio=0.5, min_tests=4))
+    for index in range(3):
+        run_test(parser, f"BasicsTests.Test{index}", f"basics.cpp:{index}: Failure\nerror {index}")
+    assert abort_monitor.check() is None
+    run_test(parser, "BasicsTests.Test3")
+    assert abort_monitor.check() == "3 of the 4 tests failed, more than 50%"
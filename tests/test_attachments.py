@@ -0,0 +1,42 @@
+import gzip
+import os
+
+import attachments
+from attachments import Attachment, prepare_attachments, trim
+from output_log import OutputLogWriter
+
+
+def write_log(log_file):
+    with OutputLogWriter(log_file) as writer:
+        for number in range(2000):
+            writer.write(f"line {number} {os.urandom(32).hex()}\n")
+        writer.write("Scylla failed to start\n")
+
+
+def test_log_without_failed_tests_is_trimmed_to_its_end(tmp_path, monkeypatch):
+    monkeypatch.setattr(attachments, "TAIL_SIZE", 4096)
+    log_file = tmp_path / "scylla-2.16.2-1.stdout.log.gz"
+    write_log(log_file)
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    # A version that failed with an exception has no failed tests
+    files, notes = prepare_attachments([Attachment(log_file)], work_dir, log_file.stat().st_size // 2)
+
+    assert [path.name for path in files] == ["scylla-2.16.2-1.stdout.tail.log.gz"]
+    assert "is trimmed to its end" in notes[0]
+    with gzip.open(files[0], "rt") as tail:
+        text = tail.read()
+    assert text.startswith("[... the first ")
+    assert text.endswith("Scylla failed to start\n")
+
+
+def test_log_without_output_of_the_failed_tests_is_trimmed_to_its_end(tmp_path):
+    log_file = tmp_path / "scylla-2.16.2-1.stdout.log.gz"
+    write_log(log_file)
+
+    trimmed = trim(Attachment(log_file, failed_tests=("BasicsTests.Missing",)), tmp_path)
+
+    assert trimmed.name == "scylla-2.16.2-1.stdout.tail.log.gz"
+    with gzip.open(trimmed, "rt") as tail:
+        assert tail.read().endswith("Scylla failed to start\n")
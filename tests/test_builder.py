@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+
+import run
+from builder import BuildCache, BuildOptions, TESTS_BINARY
+
+# Writes the tests binary and a driver library, counting the builds
+FAKE_BUILD = (f"echo build >> $BUILDS_FILE && printf '#!/bin/sh\\n' > {TESTS_BINARY} && chmod +x {TESTS_BINARY} && "
+              "echo library > libscylla-cpp-driver.so.2.16.2 && ln -sf libscylla-cpp-driver.so.2.16.2 "
+              "libscylla-cpp-driver.so")
+
+
+def git_checkout(path):
+    path.mkdir()
+    for command in (["init", "-q"], ["-c", "user.name=test", "-c", "user.email=test@localhost", "commit", "-q",
+                                     "--allow-empty", "-m", "initial"]):
+        subprocess.check_call(["git", *command], cwd=path)
+    return path
+
+
+def compile_tests(cpp_driver_dir, cache_dir):
+    test_run = run.Run(str(cpp_driver_dir), str(cpp_driver_dir), "scylla", "2.16.2-1", "3.11.4",
+                       build_options=BuildOptions(cache_dir=str(cache_dir)))
+    test_run.compile_tests()
+    return test_run.build_dir
+
+
+def builds(tmp_path):
+    return len((tmp_path / "builds").read_text().splitlines())
+
+
+def test_build_is_restored_to_the_same_build_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(run, "build_command", lambda options: FAKE_BUILD)
+    monkeypatch.setenv("BUILDS_FILE", str(tmp_path / "builds"))
+    checkouts = tmp_path / "worktrees"
+    checkouts.mkdir()
+    cpp_driver_dir = git_checkout(checkouts / "scylla-2.16.2-1")
+    cache_dir = tmp_path / "cache"
+
+    build_dir = compile_tests(cpp_driver_dir, cache_dir)
+    shutil.rmtree(build_dir)
+    # A retriggered job, the worktree of the version is created again at the same path
+    build_dir = compile_tests(cpp_driver_dir, cache_dir)
+
+    assert builds(tmp_path) == 1
+    assert os.access(build_dir / TESTS_BINARY, os.X_OK)
+    assert os.readlink(build_dir / "libscylla-cpp-driver.so") == "libscylla-cpp-driver.so.2.16.2"
+    assert (build_dir / "libscylla-cpp-driver.so").read_text() == "library\n"
+
+    # The same commit in another directory, its binary would look for the libraries in the first one
+    subprocess.check_call(["git", "clone", "-q", str(cpp_driver_dir), str(checkouts / "scylla-2.16.2-1-copy")])
+    compile_tests(checkouts / "scylla-2.16.2-1-copy", cache_dir)
+
+    assert builds(tmp_path) == 2
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_build_without_the_tests_binary_isnt_cached(tmp_path):
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    (build_dir / "libscylla-cpp-driver.so").write_text("library\n")
+    cache = BuildCache(str(tmp_path / "cache"))
+
+    cache.store("key", build_dir)
+
+    assert not cache.restore("key", tmp_path / "restored")
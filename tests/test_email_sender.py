@@ -0,0 +1,33 @@
+import email
+
+from email_sender import Email
+
+
+def prepare(subject, recipients, files=()):
+    # Only the message is built, without connecting to the SMTP server
+    email_client = Email.__new__(Email)
+    email_client.sender = "qa@scylladb.com"
+    email_client.conn = None
+    with email_client.prepare_email(subject, "<p>Résultats ✓</p>", recipients, files=files) as message:
+        raw = message.read()
+    raw.decode("ascii")
+    return email.message_from_bytes(raw, policy=email.policy.default)
+
+
+def test_non_ascii_headers(tmp_path):
+    attachment = tmp_path / "TEST-scylla-2.16.2-1-résumé.xml.gz"
+    attachment.write_bytes(b"\x1f\x8b" + bytes(range(256)) * 100)
+    subject = "FAILED: cpp-driver-matrix #1 – ünïcode ✓"
+    message = prepare(subject, ["Zoë <zoe@scylladb.com>", "qa@scylladb.com"], [attachment])
+    assert message["Subject"] == subject
+    assert [address.display_name for address in message["To"].addresses] == ["Zoë", ""]
+    text, attached = list(message.iter_parts())
+    assert text.get_content() == "<p>Résultats ✓</p>"
+    assert attached.get_filename() == attachment.name
+    assert attached.get_content() == attachment.read_bytes()
+
+
+def test_ascii_headers_are_kept_as_they_are():
+    message = prepare("SUCCESS: cpp-driver-matrix #2", ["qa@scylladb.com"])
+    assert message["Subject"] == "SUCCESS: cpp-driver-matrix #2"
+    assert message.get_content_type() == "multipart/mixed"
@@ -0,0 +1,94 @@
+from gtest_stream import GtestEventParser
+
+OUTPUT = """\
+Starting the integration tests, the settings:
+[==========] Running 3 tests from 2 test cases.
+[----------] 2 tests from BasicsTests
+[ RUN      ] BasicsTests.Integration_Cassandra_BindBlobAsString
+ccm: starting the cluster
+[       OK ] BasicsTests.Integration_Cassandra_BindBlobAsString (120 ms)
+[ RUN      ] BasicsTests.Integration_Cassandra_NoCompactEnabledConnection
+ccm: starting the cluster
+/src/tests/integration/tests/test_basics.cpp:482: Failure
+Expected equality of these values:
+  CASS_OK
+  error_code
+[  FAILED  ] BasicsTests.Integration_Cassandra_NoCompactEnabledConnection (2300 ms)
+[----------] 1 test from PreparedTests
+[ RUN      ] PreparedTests.Integration_Cassandra_PreparedIDUnchangedDuringReprepare
+[       OK ] PreparedTests.Integration_Cassandra_PreparedIDUnchangedDuringReprepare (80 ms)
+[==========] 3 tests from 2 test cases ran. (2500 ms total)
+[  PASSED  ] 2 tests.
+[  FAILED  ] 1 test, listed below:
+[  FAILED  ] BasicsTests.Integration_Cassandra_NoCompactEnabledConnection
+"""
+
+
+def feed(parser, output, now=0.0):
+    return [parser.feed(line + "\n", now=now) for line in output.splitlines()]
+
+
+def test_events_and_summary():
+    parser = GtestEventParser()
+    events = [event for event in feed(parser, OUTPUT) if event is not None]
+    assert [(event.name.split(".")[1], event.status) for event in events] == [
+        ("Integration_Cassandra_BindBlobAsString", "running"),
+        ("Integration_Cassandra_BindBlobAsString", "passed"),
+        ("Integration_Cassandra_NoCompactEnabledConnection", "running"),
+        ("Integration_Cassandra_NoCompactEnabledConnection", "failed"),
+        ("Integration_Cassandra_PreparedIDUnchangedDuringReprepare", "running"),
+        ("Integration_Cassandra_PreparedIDUnchangedDuringReprepare", "passed"),
+    ]
+    assert (parser.running_tests, parser.ran_tests, parser.passed, parser.failed) == (3, 3, 2, 1)
+    assert parser.failed_tests == ["BasicsTests.Integration_Cassandra_NoCompactEnabledConnection"]
+    assert parser.current_test is None
+
+
+def test_failure_message_starts_at_the_failure():
+    parser = GtestEventParser()
+    feed(parser, OUTPUT)
+    message = parser.messages["BasicsTests.Integration_Cassandra_NoCompactEnabledConnection"]
+    assert message.splitlines()[0] == "/src/tests/integration/tests/test_basics.cpp:482: Failure"
+    assert "ccm: starting the cluster" not in message
+    assert message.splitlines()[-1] == "  error_code"
+
+
+def test_interleaved_output_of_the_tests():
+    # The driver and ccm write from their own threads, their lines land between and inside the gtest lines
+    parser = GtestEventParser()
+    feed(parser, """\
+[ RUN      ] SchemaTests.Integration_Cassandra_KeyspaceMetadata
+1634567890.123 [WARN] (src/connection.cpp:123:void on_close()): Lost connection to host 127.0.1.1
+[       OK ] SchemaTests.Integration_Cassandra_KeyspaceMetadata (15 ms)
+1634567890.456 [ERROR] (src/cluster.cpp:55:void on_reconnect()): Unable to reconnect
+[ RUN      ] SchemaTests.Integration_Cassandra_TableMetadata
+[==========] this line is not a summary
+[  FAILED  ] SchemaTests.Integration_Cassandra_NeverStarted (1 ms)
+[  FAILED  ] SchemaTests.Integration_Cassandra_TableMetadata (7 ms)
+""")
+    assert parser.tests["SchemaTests.Integration_Cassandra_KeyspaceMetadata"].status == "passed"
+    assert parser.tests["SchemaTests.Integration_Cassandra_KeyspaceMetadata"].duration_ms == 15
+    assert parser.tests["SchemaTests.Integration_Cassandra_TableMetadata"].status == "failed"
+    # A FAILED line of a test that never started (e.g. of the summary) isn't a test of its own
+    assert "SchemaTests.Integration_Cassandra_NeverStarted" not in parser.tests
+    assert parser.failed_tests == ["SchemaTests.Integration_Cassandra_TableMetadata"]
+
+
+def test_the_summary_doesnt_fail_a_test_twice():
+    parser = GtestEventParser()
+    feed(parser, OUTPUT)
+    feed(parser, "[  FAILED  ] BasicsTests.Integration_Cassandra_NoCompactEnabledConnection\n")
+    assert parser.failed_tests == ["BasicsTests.Integration_Cassandra_NoCompactEnabledConnection"]
+
+
+def test_interrupted_test_and_test_cases():
+    parser = GtestEventParser()
+    feed(parser, "[ RUN      ] BasicsTests.Integration_Cassandra_Passed\n"
+                 "[       OK ] BasicsTests.Integration_Cassandra_Passed (1500 ms)\n"
+                 "[ RUN      ] BasicsTests.Integration_Cassandra_Hangs\n", now=10.0)
+    parser.interrupt("BasicsTests.Integration_Cassandra_Hangs", "Timed out: 600 seconds", now=610.0)
+    cases = {case.name: case for case in parser.test_cases()}
+    assert cases["BasicsTests.Integration_Cassandra_Passed"].duration == 1.5
+    hung = cases["BasicsTests.Integration_Cassandra_Hangs"]
+    assert (hung.status, hung.duration, hung.message) == ("failed", 600.0, "Timed out: 600 seconds")
+    assert parser.current_test is None
@@ -0,0 +1,50 @@
+from gtest_stream import GtestEventParser
+from history import HistoryStore
+from run import Run
+
+REPORT = """<testsuites tests="3" failures="2" time="3" name="AllTests">
+<testsuite name="BasicsTests" tests="3" failures="2" time="3">
+<testcase name="Passed" status="run" time="1" classname="BasicsTests"/>
+<testcase name="Flaky" status="run" time="1" classname="BasicsTests"><failure message="failed" type=""/></testcase>
+<testcase name="Broken" status="run" time="1" classname="BasicsTests"><failure message="failed" type=""/></testcase>
+</testsuite>
+</testsuites>
+"""
+
+RETRY_REPORT = """<testsuites tests="2" failures="1" time="2" name="AllTests">
+<testsuite name="BasicsTests" tests="2" failures="1" time="2">
+<testcase name="Flaky" status="run" time="1" classname="BasicsTests"/>
+<testcase name="Broken" status="run" time="1" classname="BasicsTests"><failure message="failed" type=""/></testcase>
+</testsuite>
+</testsuites>
+"""
+
+
+def rows(history):
+    # pylint: disable=protected-access
+    return (history._conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0],
+            history._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0])
+
+
+def test_rerun_isnt_recorded_again(tmp_path, monkeypatch):
+    history = HistoryStore(":memory:")
+    test_run = Run(str(tmp_path), str(tmp_path), "scylla", "2.16.2-1", "3.11.4")
+    test_run.xml_file.parent.mkdir()
+    test_run.xml_file.write_text(REPORT)
+    results = Run.collect_results(test_run.xml_file, GtestEventParser(), 1, '')
+    history.record_results("scylla", "2024.1.0-0", "#1", {"2.16.2-1": results})
+    assert rows(history) == (1, 3)
+
+    def execute_tests(_, xml_file, *__):
+        xml_file.write_text(RETRY_REPORT)
+        return Run.collect_results(xml_file, GtestEventParser(), 1, '')
+
+    monkeypatch.setattr(test_run, "_execute_tests", execute_tests)
+    rerun = test_run.rerun_failed()
+    assert rerun.rerun and rerun.passed_on_retry == ("BasicsTests.Flaky",)
+    history.record_results("scylla", "2024.1.0-0", "#2", {"2.16.2-1": rerun})
+    assert rows(history) == (1, 3)
+    # A run of its own is still recorded, the failed and cached versions aren't
+    history.record_results("scylla", "2024.1.0-0", "#3", {"2.16.2-1": results, "2.17.0-1": dict(exception=[]),
+                                                          "2.18.0-1": results._replace(cached_from="#1")})
+    assert rows(history) == (2, 6)
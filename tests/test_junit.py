@@ -0,0 +1,123 @@
+import xml.etree.ElementTree as ElementTree
+
+import junit
+
+REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuites tests="5" failures="1" disabled="1" errors="0" time="12.5" timestamp="2024-01-01T00:00:00" name="AllTests">
+  <testsuite name="BasicsTests" tests="3" failures="1" disabled="0" errors="0" time="10.5">
+    <testcase name="Integration_Cassandra_Passed" status="run" result="completed" time="0.5" classname="BasicsTests" />
+    <testcase name="Integration_Cassandra_Failed" status="run" result="completed" time="10" classname="BasicsTests">
+      <failure message="test_basics.cpp:10&#x0A;Expected equality" type=""><![CDATA[test_basics.cpp:10
+Expected equality]]></failure>
+    </testcase>
+    <testcase name="Integration_Cassandra_Skipped" status="run" result="skipped" time="0" classname="BasicsTests" />
+  </testsuite>
+  <testsuite name="SslTests" tests="2" failures="0" disabled="1" errors="0" time="2">
+    <testcase name="Integration_Cassandra_Ssl" status="run" result="completed" time="2" classname="SslTests" />
+    <testcase name="DISABLED_Integration_Cassandra_Off" status="notrun" time="0" classname="SslTests" />
+  </testsuite>
+</testsuites>
+"""
+
+
+def write(path, content):
+    path.write_text(content)
+    return path
+
+
+def report(tests, time, cases):
+    suites = {}
+    for name, status, duration in cases:
+        suites.setdefault(name.split(".")[0], []).append((name.split(".")[1], status, duration))
+    lines = [f'<testsuites tests="{tests}" failures="{sum(status == "failed" for _, status, _ in cases)}" '
+             f'time="{time}" name="AllTests">']
+    for suite, suite_cases in suites.items():
+        lines.append(f'<testsuite name="{suite}" tests="{len(suite_cases)}" '
+                     f'failures="{sum(status == "failed" for _, status, _ in suite_cases)}" time="{time}">')
+        for name, status, duration in suite_cases:
+            failure = '<failure message="failed" type=""/>' if status == "failed" else ''
+            lines.append(f'<testcase name="{name}" status="run" time="{duration}" classname="{suite}">{failure}'
+                         '</testcase>')
+        lines.append('</testsuite>')
+    lines.append('</testsuites>')
+    return "\n".join(lines)
+
+
+def test_parse_junit(tmp_path):
+    parsed = junit.parse_junit(write(tmp_path / "TEST-scylla-2.16.2-1.xml", REPORT))
+    assert (parsed.total, parsed.time, parsed.ran, parsed.passed) == (5, 12.5, 4, 2)
+    assert parsed.failed_tests == ["BasicsTests.Integration_Cassandra_Failed"]
+    assert {test.name: test.status for test in parsed.tests} == {
+        "BasicsTests.Integration_Cassandra_Passed": "passed",
+        "BasicsTests.Integration_Cassandra_Failed": "failed",
+        "BasicsTests.Integration_Cassandra_Skipped": "skipped",
+        "SslTests.Integration_Cassandra_Ssl": "passed",
+    }
+    failed = parsed.tests[1]
+    assert (failed.duration, failed.message) == (10.0, "test_basics.cpp:10\nExpected equality")
+
+
+def test_parse_junit_missing_or_broken(tmp_path):
+    assert junit.parse_junit(tmp_path / "missing.xml") is None
+    # The tests binary was killed while it wrote the report
+    assert junit.parse_junit(write(tmp_path / "broken.xml", REPORT[:len(REPORT) // 2])) is None
+
+
+def test_merge_the_shards(tmp_path):
+    shards = [write(tmp_path / "shard0.xml", report(2, 30, [("BasicsTests.A", "passed", 10),
+                                                             ("SslTests.A", "failed", 20)])),
+              write(tmp_path / "shard1.xml", report(1, 25, [("BasicsTests.B", "passed", 25)]))]
+    junit.merge_junit_files(shards, tmp_path / "merged.xml")
+    root = ElementTree.parse(tmp_path / "merged.xml").getroot()
+    assert (root.get("tests"), root.get("failures"), float(root.get("time"))) == ("3", "1", 30.0)
+    # The suite split between the shards is merged back into one suite
+    suites = {suite.get("name"): suite for suite in root.iter("testsuite")}
+    assert list(suites) == ["BasicsTests", "SslTests"]
+    assert [case.get("name") for case in suites["BasicsTests"]] == ["A", "B"]
+    assert suites["BasicsTests"].get("tests") == "2"
+
+
+def test_merge_the_resumed_parts(tmp_path):
+    # The parts of a run resumed after a hang ran one after another, their times add up
+    parts = [write(tmp_path / "part1.xml", report(1, 600, [("BasicsTests.Hangs", "failed", 600)])),
+             write(tmp_path / "resume1.xml", report(1, 5, [("BasicsTests.After", "passed", 5)]))]
+    junit.merge_junit_files(parts, tmp_path / "merged.xml", concurrent=False)
+    merged = junit.parse_junit(tmp_path / "merged.xml")
+    assert (merged.total, merged.time, merged.failed_tests) == (2, 605.0, ["BasicsTests.Hangs"])
+
+
+def test_write_and_parse_back(tmp_path):
+    tests = [junit.TestCase("BasicsTests.Integration_Cassandra_Passed", "passed", 1.5),
+             junit.TestCase("BasicsTests.Integration_Cassandra_Hangs", "failed", 600.0, "Timed out: 600 seconds")]
+    junit.write_junit_file(tests, tmp_path / "part1.xml")
+    assert junit.parse_junit(tmp_path / "part1.xml").tests == tests
+
+
+def test_results_of_the_retries(tmp_path, monkeypatch):
+    # Every attempt runs the tests that still fail and writes its own report, the results come from it
+    from gtest_stream import GtestEventParser
+    from run import Run
+    test_run = Run(str(tmp_path), str(tmp_path), "scylla", "2.16.2-1", "3.11.4", retries=2)
+    attempts = iter([[("BasicsTests.Flaky", "passed", 1), ("BasicsTests.Broken", "failed", 1)],
+                     [("BasicsTests.Broken", "failed", 1)]])
+    filters = []
+
+    def execute_tests(gtest_filter, xml_file, *_):
+        filters.append(gtest_filter)
+        cases = next(attempts)
+        write(xml_file, report(len(cases), 1, cases))
+        return Run.collect_results(xml_file, GtestEventParser(), 1, '')
+
+    monkeypatch.setattr(test_run, "_execute_tests", execute_tests)
+    test_run.xml_file.parent.mkdir()
+    results = Run.collect_results(write(test_run.xml_file, report(3, 3, [
+        ("BasicsTests.Passed", "passed", 1), ("BasicsTests.Flaky", "failed", 1), ("BasicsTests.Broken", "failed", 1)])),
+        GtestEventParser(), 1, '')
+    retried = test_run._retry_failed(results)  # pylint: disable=protected-access
+    assert filters == ["BasicsTests.Flaky:BasicsTests.Broken", "BasicsTests.Broken"]
+    assert (retried.passed, retried.failed, retried.failed_tests) == (2, 1, ["BasicsTests.Broken"])
+    assert retried.passed_on_retry == ("BasicsTests.Flaky",)
+    # The original report is left as it is, the attempts are kept out of the reports collected by CI
+    assert junit.parse_junit(test_run.xml_file).failed_tests == ["BasicsTests.Flaky", "BasicsTests.Broken"]
+    assert sorted(path.name for path in (tmp_path / "log" / "retries").iterdir()) == [
+        "retry1-TEST-scylla-2.16.2-1.xml", "retry2-TEST-scylla-2.16.2-1.xml"]
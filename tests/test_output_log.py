@@ -0,0 +1,97 @@
+import gzip
+import os
+
+import pytest
+
+import output_log
+import gtest_stream
+from output_log import OutputLogWriter, read_index, read_test_log
+
+TESTS = ["BasicsTests.Integration_Cassandra_Basics", "SslTests.Integration_Cassandra_Ssl",
+         "Prefix/ParamTests.Integration_Cassandra_Param/0"]
+
+
+def event(test, status):
+    return gtest_stream.TestEvent(name=test, status=status, started=0.0, finished=None, duration_ms=None)
+
+
+def output_lines(test):
+    # Random, so the member of the test is big enough to be cut in the middle
+    return [f"{test} {number} {os.urandom(16).hex()}\n" for number in range(200)]
+
+
+def write_log(log_file):
+    """
+    Returns the whole output that was written
+    """
+    written = []
+    with OutputLogWriter(log_file) as writer:
+        def write(line, event_=None):
+            writer.write(line, event_)
+            written.append(line)
+
+        write("Starting the integration tests\n")
+        for test in TESTS:
+            write(f"[ RUN      ] {test}\n", event(test, "running"))
+            for line in output_lines(test):
+                write(line)
+            write(f"[       OK ] {test} (10 ms)\n", event(test, "passed"))
+            write("Stopping the cluster\n")
+    return "".join(written)
+
+
+def test_read_test_log(tmp_path):
+    log_file = tmp_path / "scylla-2.16.2-1.stdout.log.gz"
+    written = write_log(log_file)
+
+    index = read_index(log_file)
+    assert [member["test"] for member in index] == [None] + [name for test in TESTS for name in (test, None)]
+    assert [member["lines"] for member in index] == [1, 202, 1, 202, 1, 202, 1]
+
+    ssl_log = read_test_log(log_file, TESTS[1])
+    assert ssl_log.startswith(f"[ RUN      ] {TESTS[1]}\n")
+    assert ssl_log.endswith(f"[       OK ] {TESTS[1]} (10 ms)\n")
+    assert TESTS[0] not in ssl_log and TESTS[2] not in ssl_log
+    assert read_test_log(log_file, "BasicsTests.Missing") == ""
+
+    # A multi member gzip file, readable as a whole too
+    with gzip.open(log_file, "rt") as whole:
+        assert whole.read() == written
+
+
+def test_test_without_result(tmp_path):
+    log_file = tmp_path / "scylla-2.16.2-1.stdout.log.gz"
+    with OutputLogWriter(log_file) as writer:
+        writer.write(f"[ RUN      ] {TESTS[0]}\n", event(TESTS[0], "running"))
+        writer.write("Killed by the hang watchdog\n")
+        writer.end_test()
+        writer.write("Stopping the cluster\n")
+
+    assert [member["test"] for member in read_index(log_file)] == [TESTS[0], None]
+    assert read_test_log(log_file, TESTS[0]) == f"[ RUN      ] {TESTS[0]}\nKilled by the hang watchdog\n"
+
+
+def test_truncated_member(tmp_path):
+    log_file = tmp_path / "scylla-2.16.2-1.stdout.log.gz"
+    write_log(log_file)
+    last_test = read_index(log_file)[-2]
+    with open(log_file, "r+b") as log:
+        log.truncate(last_test["offset"] + last_test["length"] // 2)
+
+    # The tests before are intact, the cut one is read as far as it goes
+    assert read_test_log(log_file, TESTS[0]).endswith(f"[       OK ] {TESTS[0]} (10 ms)\n")
+    truncated = read_test_log(log_file, TESTS[2])
+    assert truncated.startswith(f"[ RUN      ] {TESTS[2]}\n")
+    assert 0 < len(truncated) < last_test["size"]
+
+
+def test_missing_index(tmp_path):
+    log_file = tmp_path / "scylla-2.16.2-1.stdout.log.gz"
+    write_log(log_file)
+    output_log.index_path(log_file).unlink()
+
+    with pytest.raises(FileNotFoundError):
+        read_test_log(log_file, TESTS[0])
+    # Still a regular gzip file
+    with gzip.open(log_file, "rt") as whole:
+        assert whole.read().startswith("Starting the integration tests\n")
@@ -0,0 +1,84 @@
+import subprocess
+
+import junit
+import result_cache
+import run
+from result_cache import ResultCache, result_key
+
+
+def git_checkout(path, *tags):
+    path.mkdir()
+    for command in (["init", "-q"], ["-c", "user.name=test", "-c", "user.email=test@localhost", "commit", "-q",
+                                     "--allow-empty", "-m", "initial"]):
+        subprocess.check_call(["git", *command], cwd=path)
+    for tag in tags:
+        subprocess.check_call(["git", "tag", tag], cwd=path)
+    return str(path)
+
+
+def use_version_directory(monkeypatch, version_dir):
+    monkeypatch.setattr(run.Run, "version_directory", classmethod(lambda cls, driver_type, driver_version: version_dir))
+
+
+def test_key_of_the_patches_and_ignore_yaml(tmp_path, monkeypatch):
+    cpp_driver_dir = git_checkout(tmp_path / "cpp-driver", "2.16.0")
+    version_dir = tmp_path / "2.16.0"
+    version_dir.mkdir()
+    use_version_directory(monkeypatch, version_dir)
+
+    def key(scylla_build="5.4.0-0.20240101.abcdef", cql_cassandra_version="3.11.4"):
+        return result_key(cpp_driver_dir, "scylla", "2.16.0", scylla_build, cql_cassandra_version)
+
+    keys = [key()]
+    assert key() == keys[0]
+    (version_dir / "patch").write_text("--- a/CMakeLists.txt\n")
+    keys.append(key())
+    (version_dir / "patch").write_text("--- a/src/session.cpp\n")
+    keys.append(key())
+    (version_dir / "ignore.yaml").write_text("tests:\n  - BasicsTests.Integration_Cassandra_Broken\n")
+    keys.append(key())
+    (version_dir / "README").write_text("not a patch")
+    assert key() == keys[-1]
+    keys.append(key(cql_cassandra_version="4.0"))
+    keys.append(key(scylla_build="5.4.1-0.20240201.123456"))
+    assert len(set(keys)) == len(keys)
+
+    # The build of scylla or the driver version that can't be told isn't cached
+    assert key(scylla_build=None) is None
+    assert result_key(cpp_driver_dir, "scylla", "2.17.0", "5.4.0", "3.11.4") is None
+
+
+def test_no_key_without_the_version_folder(tmp_path):
+    cpp_driver_dir = git_checkout(tmp_path / "cpp-driver", "1.0.0", "2.16.0")
+
+    # Older than all the folders of the scylla driver, and a driver type without folders
+    assert run.Run.version_directory("scylla", "1.0.0") is None
+    assert result_key(cpp_driver_dir, "scylla", "1.0.0", "5.4.0", "3.11.4") is None
+    assert result_key(cpp_driver_dir, "no-such-driver", "2.16.0", "5.4.0", "3.11.4") is None
+    assert result_key(cpp_driver_dir, "scylla", "2.16.0", "5.4.0", "3.11.4") is not None
+
+
+def test_store_and_restore(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    results = run.TestResults(running_tests=2, ran_tests=2, failed=0, failed_tests=[], passed=2, returncode=0, error="",
+                              tests=(junit.TestCase("BasicsTests.A", "passed", 1.5),
+                                     junit.TestCase("BasicsTests.B", "passed", 0.5)),
+                              passed_on_retry=("BasicsTests.B",), phases={"tests": 2.0})
+    xml_file = tmp_path / "TEST-scylla-2.16.0.xml"
+    xml_file.write_text("<testsuites/>")
+    log_dir = tmp_path / "log"
+
+    assert cache.restore("key", log_dir) is None
+    cache.store("key", results, [xml_file], "cpp-driver-matrix #12")
+    restored = cache.restore("key", log_dir)
+
+    assert restored == results._replace(phases=None, cached_from="cpp-driver-matrix #12")
+    assert (log_dir / xml_file.name).read_text() == "<testsuites/>"
+
+
+def test_broken_entry_isnt_restored(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    (tmp_path / "cache" / "key").mkdir(parents=True)
+    (tmp_path / "cache" / "key" / result_cache.RESULTS_FILE).write_text('{"results": {}}')
+
+    assert cache.restore("key", tmp_path / "log") is None
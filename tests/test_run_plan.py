@@ -0,0 +1,72 @@
+import logging
+
+import run_plan
+
+TESTS_LIST = """\
+Starting the integration tests with the settings:
+  Cassandra version: 3.11.4
+BasicsTests.
+  Integration_Cassandra_BindBlobAsString
+  Integration_Cassandra_NoCompactEnabledConnection
+  DISABLED_Integration_Cassandra_Broken
+SslTests.
+  Integration_Cassandra_ReconnectAfterClusterCrashAndRestart
+Prefix/ParamTests.  # TypeParam = int
+  Integration_Cassandra_Param/0  # GetParam() = 1
+  Integration_Cassandra_Param/1  # GetParam() = 2
+"""
+
+TESTS = ["BasicsTests.Integration_Cassandra_BindBlobAsString",
+         "BasicsTests.Integration_Cassandra_NoCompactEnabledConnection",
+         "BasicsTests.DISABLED_Integration_Cassandra_Broken",
+         "SslTests.Integration_Cassandra_ReconnectAfterClusterCrashAndRestart",
+         "Prefix/ParamTests.Integration_Cassandra_Param/0",
+         "Prefix/ParamTests.Integration_Cassandra_Param/1"]
+
+
+def test_parse_tests_list():
+    assert run_plan.parse_tests_list(TESTS_LIST) == TESTS
+
+
+def test_plan_run_expands_the_ignore_patterns(caplog):
+    caplog.set_level(logging.WARNING, logger="run_plan")
+    plan = run_plan.plan_run(TESTS, ["SslTests.*", "*NoCompact*", "*/ParamTests.*/1", "SchemaTests.*",
+                                     "BasicsTests.Integration_Cassandra_Removed"])
+    assert plan.tests == ["BasicsTests.Integration_Cassandra_BindBlobAsString",
+                          "Prefix/ParamTests.Integration_Cassandra_Param/0"]
+    assert plan.ignored == ["BasicsTests.Integration_Cassandra_NoCompactEnabledConnection",
+                            "SslTests.Integration_Cassandra_ReconnectAfterClusterCrashAndRestart",
+                            "Prefix/ParamTests.Integration_Cassandra_Param/1"]
+    # The disabled tests are listed, but never run
+    assert plan.expected == 2
+    assert plan.stale_patterns == ["SchemaTests.*", "BasicsTests.Integration_Cassandra_Removed"]
+    assert [record.getMessage() for record in caplog.records] == [
+        "The ignored test 'SchemaTests.*' doesn't match any test, it can be removed",
+        "The ignored test 'BasicsTests.Integration_Cassandra_Removed' doesn't match any test, it can be removed"]
+
+
+def test_matches_like_gtest():
+    assert run_plan.matches("BasicsTests.Integration_Cassandra_A", "Basics*")
+    assert run_plan.matches("BasicsTests.Integration_Cassandra_A", "BasicsTests.Integration_Cassandra_?")
+    assert not run_plan.matches("BasicsTests.Integration_Cassandra_A", "BasicsTests")
+
+
+def test_list_tests_is_cached_by_the_binary(tmp_path):
+    binary = tmp_path / "cassandra-integration-tests"
+    calls = tmp_path / "calls"
+    binary.write_text(f"#!/bin/sh\necho >> {calls}\ncat <<'EOF'\n{TESTS_LIST}EOF\n")
+    binary.chmod(0o755)
+    cache_dir = tmp_path / "cache"
+    assert run_plan.list_tests(binary, ["--category=CASSANDRA"], str(cache_dir)) == TESTS
+    assert run_plan.list_tests(binary, ["--category=CASSANDRA"], str(cache_dir)) == TESTS
+    assert len(calls.read_text().splitlines()) == 1
+    # Other arguments or another binary aren't taken from the cache
+    run_plan.list_tests(binary, ["--category=SCYLLA"], str(cache_dir))
+    binary.write_text(binary.read_text() + "\n")
+    run_plan.list_tests(binary, ["--category=CASSANDRA"], str(cache_dir))
+    assert len(calls.read_text().splitlines()) == 3
+
+
+def test_list_tests_without_a_binary(tmp_path):
+    assert run_plan.list_tests(tmp_path / "cassandra-integration-tests", [], str(tmp_path / "cache")) is None
+    assert not (tmp_path / "cache").exists()
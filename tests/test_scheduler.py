@@ -0,0 +1,67 @@
+import scheduler
+
+DURATIONS = {
+    "SchemaTests.A": 300.0, "SchemaTests.B": 300.0,
+    "BasicsTests.A": 200.0, "BasicsTests.B": 150.0,
+    "SslTests.A": 250.0,
+    "PreparedTests.A": 100.0, "PreparedTests.B": 50.0,
+    "MetricsTests.A": 100.0,
+}
+
+
+def loads(filters, weights):
+    # The suites of each filter and the total duration they are expected to take
+    result = []
+    for gtest_filter in filters:
+        suites = [pattern[:-2] for pattern in gtest_filter.partition("-")[0].split(":") if pattern.endswith(".*")]
+        result.append((sorted(suites), sum(weights[suite] for suite in suites)))
+    return result
+
+
+def test_suite_durations():
+    assert scheduler.suite_durations(DURATIONS) == {"SchemaTests": 600.0, "BasicsTests": 350.0, "SslTests": 250.0,
+                                                    "PreparedTests": 150.0, "MetricsTests": 100.0}
+    # The new tests have no history, they're assumed to take the median (175 seconds)
+    assert scheduler.suite_durations(DURATIONS, ["SslTests.A", "SslTests.New", "Suite/ParamTests.A/0"]) == {
+        "SslTests": 425.0, "Suite/ParamTests": 175.0}
+
+
+def test_longest_first_balances_the_loads():
+    weights = scheduler.suite_durations(DURATIONS)
+    bins = scheduler.longest_first(weights, 2)
+    # 600 | 350 + 250, then 150 and 100 go to the least loaded one each time
+    assert bins == [["SchemaTests", "PreparedTests"], ["BasicsTests", "SslTests", "MetricsTests"]]
+    assert [sum(weights[suite] for suite in suites) for suites in bins] == [750.0, 700.0]
+
+
+def test_shard_filters_by_the_durations():
+    weights = scheduler.suite_durations(DURATIONS, list(DURATIONS))
+    filters = scheduler.shard_filters(DURATIONS, 3, ["SslTests.*"], tests=list(DURATIONS))
+    assert loads(filters, weights) == [(["SchemaTests"], 600.0), (["BasicsTests", "MetricsTests"], 450.0),
+                                       (["PreparedTests", "SslTests"], 400.0)]
+    # The ignored tests are excluded from every shard
+    assert all(gtest_filter.endswith("-SslTests.*") for gtest_filter in filters)
+
+
+def test_shard_filters_without_the_list_of_tests():
+    # The least loaded shard also runs whatever suite isn't in the history
+    assert scheduler.shard_filters(DURATIONS, 2, []) == ["SchemaTests.*:PreparedTests.*",
+                                                         "*-SchemaTests.*:PreparedTests.*"]
+
+
+def test_shard_filters_fall_back_to_gtest_sharding():
+    assert scheduler.shard_filters({}, 4, []) is None
+    assert scheduler.shard_filters(DURATIONS, 1, []) is None
+    # With the list of tests but no history, the suites are split by the number of their tests
+    assert scheduler.shard_filters({}, 2, [], tests=["A.1", "A.2", "B.1", "C.1"]) == ["A.*", "B.*:C.*"]
+
+
+def test_no_empty_shards():
+    # An empty positive filter would run all the tests
+    assert scheduler.shard_filters(DURATIONS, 10, [], tests=["SchemaTests.A", "SslTests.A"]) == [
+        "SchemaTests.*", "SslTests.*"]
+
+
+def test_exclude_tests():
+    assert scheduler.exclude_tests("*", ["A.1", "B.2"]) == "*-A.1:B.2"
+    assert scheduler.exclude_tests("A.*:B.*-C.*", ["A.1", "C.*"]) == "A.*:B.*-C.*:A.1"
@@ -0,0 +1,109 @@
+import json
+import subprocess
+import sys
+import time
+
+import subprocess_replay
+
+FAKE_TESTS = """import sys
+print("[ RUN      ] BasicsTests.Integration_Cassandra_Basics", flush=True)
+print("connection refused", file=sys.stderr, flush=True)
+with open(sys.argv[1].rpartition(":")[2], "w") as xml:
+    xml.write("<testsuites/>")
+sys.exit(3)
+"""
+
+
+def wait_for_calls(fixture_dir, count):
+    # The recorder writes the call to the index in the background, once the process is over
+    index = fixture_dir / subprocess_replay.INDEX_FILE
+    for _ in range(100):
+        if index.exists() and len(index.read_text().splitlines()) >= count:
+            return [json.loads(line) for line in index.read_text().splitlines()]
+        time.sleep(0.05)
+    raise AssertionError(f"{count} calls weren't recorded")
+
+
+def run(popen, fixture_dir, command, cwd):
+    process = popen(subprocess.Popen, fixture_dir, command, shell=True, cwd=cwd, stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE, text=True)
+    stdout, stderr = process.communicate(timeout=30)
+    return process.returncode, stdout, stderr
+
+
+def test_record_and_replay_in_another_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv(subprocess_replay.ROOTS_ENV, "{}")
+    monkeypatch.setenv("SUBPROCESS_REPLAY_SPEED", "0")
+    fixture_dir = tmp_path / "fixture"
+    recorded_dir = tmp_path / "recorded" / "cpp-driver"
+    recorded_dir.mkdir(parents=True)
+    (recorded_dir / "fake_tests.py").write_text(FAKE_TESTS)
+
+    subprocess_replay.set_roots(cpp_driver_dir=str(recorded_dir))
+    recorded = run(subprocess_replay.record, fixture_dir,
+                   f"{sys.executable} {recorded_dir}/fake_tests.py --gtest_output=xml:{recorded_dir}/TEST.xml",
+                   recorded_dir)
+    call, = wait_for_calls(fixture_dir, 1)
+
+    assert recorded == (3, "[ RUN      ] BasicsTests.Integration_Cassandra_Basics\n", "connection refused\n")
+    assert call["cwd"] == "{cpp_driver_dir}"
+    assert "{cpp_driver_dir}/TEST.xml" in call["command"] and str(recorded_dir) not in call["command"]
+    assert call["returncode"] == 3
+
+    # Another checkout, without the tests: the replayer plays the output and writes the file to the new path
+    replayed_dir = tmp_path / "replayed" / "cpp-driver"
+    replayed_dir.mkdir(parents=True)
+    subprocess_replay.set_roots(cpp_driver_dir=str(replayed_dir))
+    replayed = run(subprocess_replay.replay, fixture_dir,
+                   f"{sys.executable} {replayed_dir}/fake_tests.py --gtest_output=xml:{replayed_dir}/TEST.xml",
+                   replayed_dir)
+
+    assert replayed == recorded
+    assert (replayed_dir / "TEST.xml").read_text() == "<testsuites/>"
+
+
+def test_calls_are_replayed_in_order(tmp_path, monkeypatch):
+    monkeypatch.setenv(subprocess_replay.ROOTS_ENV, "{}")
+    monkeypatch.setenv("SUBPROCESS_REPLAY_SPEED", "0")
+    fixture_dir = tmp_path / "fixture"
+    counter = tmp_path / "counter"
+    command = f"echo x >> {counter}; wc -l < {counter}"
+    for count in range(1, 3):
+        run(subprocess_replay.record, fixture_dir, command, None)
+        wait_for_calls(fixture_dir, count)
+    counter.unlink()
+
+    # The last recorded call is repeated when the command runs more times than it was recorded
+    assert [run(subprocess_replay.replay, fixture_dir, command, None)[1].strip() for _ in range(3)] == ["1", "2", "2"]
+
+
+def test_command_that_wasnt_recorded(tmp_path, monkeypatch):
+    monkeypatch.setenv("SUBPROCESS_REPLAY_SPEED", "0")
+    fixture_dir = tmp_path / "fixture"
+    run(subprocess_replay.record, fixture_dir, "true", None)
+    wait_for_calls(fixture_dir, 1)
+
+    returncode, stdout, stderr = run(subprocess_replay.replay, fixture_dir, "make -j8", None)
+
+    assert returncode == subprocess_replay.NOT_RECORDED_RETURNCODE
+    assert stdout == ""
+    assert "wasn't recorded" in stderr
+
+
+def test_popen_is_wrapped_only_to_record_or_replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(subprocess, "Popen", subprocess.Popen)
+    monkeypatch.delenv("SUBPROCESS_RECORD", raising=False)
+    monkeypatch.delenv("SUBPROCESS_REPLAY", raising=False)
+    original = subprocess.Popen
+
+    subprocess_replay.install()
+    assert subprocess.Popen is original
+
+    monkeypatch.setenv("SUBPROCESS_RECORD", str(tmp_path / "fixture"))
+    subprocess_replay.install()
+    subprocess_replay.install()
+    assert subprocess.Popen.unwrapped is original
+
+    assert subprocess.check_output(["echo", "recorded"], text=True) == "recorded\n"
+    call, = wait_for_calls(tmp_path / "fixture", 1)
+    assert call["command"] == "echo recorded"
@@ -0,0 +1,39 @@
+import subprocess
+
+import pytest
+
+import tags
+from main import extract_n_latest_repo_tags
+
+REPO_TAGS = ["1.0.0-1", "1.1.0-1", "2.9.0-1", "2.10.0-1", "2.10.1-1", "2.16.0", "2.17.0", "10.0.0-1", "10.0.1-1",
+             "10.1.0-1", "10.2.0", "10.3.0", "11.0.0-1", "2.17.0-rc1", "latest"]
+
+
+@pytest.fixture(name="cpp_driver_dir")
+def fixture_cpp_driver_dir(tmp_path, monkeypatch):
+    for command in (["init", "-q"], ["-c", "user.name=test", "-c", "user.email=test@localhost", "commit", "-q",
+                                     "--allow-empty", "-m", "initial"]):
+        subprocess.check_call(["git", *command], cwd=tmp_path)
+    for tag in REPO_TAGS:
+        subprocess.check_call(["git", "tag", tag], cwd=tmp_path)
+    # The local tags, without the mirror of the origin
+    monkeypatch.setenv("DEV_MODE", "1")
+    return str(tmp_path)
+
+
+def test_sort_tags():
+    assert tags.sort_tags(REPO_TAGS) == ["11.0.0-1", "10.3.0", "10.2.0", "10.1.0-1", "10.0.1-1", "10.0.0-1", "2.17.0",
+                                         "2.16.0", "2.10.1-1", "2.10.0-1", "2.9.0-1", "1.1.0-1", "1.0.0-1"]
+
+
+def test_latest_tags_are_grouped_by_the_whole_major(cpp_driver_dir):
+    # 10.x isn't taken for 1.x, and 2.10 is newer than 2.9
+    assert extract_n_latest_repo_tags(cpp_driver_dir, ["10", "2", "1"], latest_tags_size=2) == \
+        ["1.1.0-1", "1.0.0-1", "2.10.1-1", "2.9.0-1", "10.1.0-1", "10.0.1-1"]
+    assert extract_n_latest_repo_tags(cpp_driver_dir, ["2", "10"], latest_tags_size=2, is_scylla_driver=False) == \
+        ["2.17.0", "2.16.0", "10.3.0", "10.2.0"]
+
+
+def test_not_enough_versions_of_the_major(cpp_driver_dir):
+    with pytest.raises(ValueError):
+        extract_n_latest_repo_tags(cpp_driver_dir, ["11"], latest_tags_size=2)
@@ -0,0 +1,65 @@
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+LOGGER = logging.getLogger(__name__)
+
+METRIC_NAME = "cpp_driver_matrix_phase_seconds"
+
+
+class PhaseTimer:
+    """
+    Monotonic durations of the phases of a run, a phase that runs a few times accumulates its durations
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            self.phases[name] = self.phases.get(name, 0.0) + duration
+            LOGGER.info("Phase '%s' took %.1f seconds", name, duration)
+
+
+def _labels(labels: dict) -> str:
+    return ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                    for key, value in labels.items())
+
+
+def write_prometheus(metrics_file: str, samples: List[tuple]) -> None:
+    """
+    Write (labels, phases) samples in the Prometheus textfile collector format.
+    The file is replaced atomically, so the collector never reads it half written.
+    """
+    lines = [f"# HELP {METRIC_NAME} Duration of the cpp-driver matrix phases",
+             f"# TYPE {METRIC_NAME} gauge"]
+    for labels, phases in samples:
+        for phase, seconds in phases.items():
+            lines.append(f"{METRIC_NAME}{{{_labels(dict(labels, phase=phase))}}} {seconds:.3f}")
+    path = Path(metrics_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    tmp_file.write_text("\n".join(lines) + "\n")
+    tmp_file.rename(path)
+
+
+def append_trace(trace_file: str, samples: List[tuple]) -> None:
+    """
+    Append (labels, phases) samples as JSON lines, one line per phase
+    """
+    path = Path(trace_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    with open(path, "a") as trace:
+        for labels, phases in samples:
+            for phase, seconds in phases.items():
+                trace.write(json.dumps(dict(labels, timestamp=now, phase=phase, seconds=round(seconds, 3))) + "\n")
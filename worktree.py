@@ -0,0 +1,47 @@
+import os
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+
+LOGGER = logging.getLogger(__name__)
+
+
+def worktree_path(repo_directory: str, worktrees_dir: str, name: str) -> Path:
+    base_dir = Path(worktrees_dir) if worktrees_dir else Path(repo_directory) / '.matrix-worktrees'
+    return base_dir / name
+
+
+def add_worktree(repo_directory: str, path: Path) -> Path:
+    """
+    Create a detached git worktree of the repository, the existing one will be reused with its build directory
+    """
+    subprocess.check_call(["git", "worktree", "prune"], cwd=repo_directory)
+    if (path / '.git').exists():
+        LOGGER.info("Reusing the worktree '%s'", path)
+        return path
+    if path.exists():
+        shutil.rmtree(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    LOGGER.info("Creating the worktree '%s'", path)
+    subprocess.check_call(["git", "worktree", "add", "--force", "--detach", str(path)], cwd=repo_directory)
+    return path
+
+
+def remove_worktree(repo_directory: str, path: Path) -> None:
+    if not path.exists():
+        return
+    LOGGER.info("Removing the worktree '%s'", path)
+    subprocess.check_call(["git", "worktree", "remove", "--force", str(path)], cwd=repo_directory)
+    if path.exists():
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def ccm_host(worker_index: int) -> str:
+    # Each worker gets its own loopback subnet: 127.0.1.x, 127.0.2.x, ...
+    return f"127.0.{worker_index + 1}.1"
+
+
+def ccm_config_dir(worker_name: str) -> str:
+    # Kept under ~/.ccm since only that directory is mounted into the docker container
+    return os.path.join(os.path.expanduser("~"), ".ccm", "workers", worker_name)